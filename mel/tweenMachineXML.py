@@ -0,0 +1,299 @@
+"""
+tweenMachineXML.py
+
+Python fast path for the XML data used by the MEL version of tweenMachine.
+
+xml_lib.mel parses data files one character at a time and builds a scene
+node per element, and tmReadXML reads every node back one getData call at a
+time.  This module parses files once with a real XML parser, builds or reads
+the tmXML1 node hierarchy in a single pass through the API, and hands the
+group, set and button data back to MEL.  The node hierarchy it builds is the
+same one tmDefaultXML makes, so the rest of the MEL code is unaffected.
+
+Every function called from MEL returns a single tab-separated string (or an
+int), which MEL splits with tokenize, so that empty results never reach MEL
+as an untyped empty list.
+"""
+
+# Built-in
+try:
+    import xml.etree.cElementTree as etree
+except ImportError:
+    import xml.etree.ElementTree as etree
+
+# Third-party
+import maya.cmds as mc
+from maya.api import OpenMaya
+
+
+ROOT_NODE = "tmXML1"
+CHARACTER_SET_MARKER = "tmCustomCharacterSet"
+SEPARATOR = "\t"
+NODE_ATTRS = ("id", "order", "data")
+
+# Data read by the last call to read_scene
+_DATA = None
+
+
+def _join(items):
+    return SEPARATOR.join([str(item) for item in items])
+
+
+def _order(element):
+    try:
+        return int(element.get("order", 0))
+    except ValueError:
+        return 0
+
+
+def parse_file(path):
+    """
+    Parse a tweenMachine data file, returning its root element, or None if
+    the file does not contain tweenMachine data
+    """
+    try:
+        root = etree.parse(path).getroot()
+    except (IOError, SyntaxError):
+        return None
+    if root.find(".//tmOptions") is None:
+        return None
+    return root
+
+
+def _read_node(fn_node):
+    """
+    Convert a node made by makeNode (and its children) into an element
+    """
+    values = {}
+    for attr in ("type",) + NODE_ATTRS:
+        if fn_node.hasAttribute(attr):
+            values[attr] = fn_node.findPlug(attr, False).asString()
+    element = etree.Element(values.pop("type", None) or fn_node.name())
+    element.text = values.pop("data", None)
+    for attr, value in values.items():
+        element.set(attr, value)
+    for index in range(fn_node.childCount()):
+        element.append(_read_node(OpenMaya.MFnDagNode(fn_node.child(index))))
+    return element
+
+
+def read_scene(root=ROOT_NODE):
+    """
+    Read the whole tmXML node hierarchy in one pass and keep it for the other
+    query functions.  Returns 1 if the data node exists, 0 otherwise
+    """
+    global _DATA
+    selection = OpenMaya.MSelectionList()
+    try:
+        selection.add(root)
+    except RuntimeError:
+        _DATA = None
+        return 0
+    _DATA = _read_node(OpenMaya.MFnDagNode(selection.getDagPath(0)))
+    return 1
+
+
+def _unique_names(types):
+    """
+    Return a function that hands out names the way makeNode does: the type
+    followed by the lowest number not already used in the scene
+    """
+    used = set()
+    for type_ in types:
+        used.update(mc.ls(type_ + "*") or [])
+    counters = {}
+
+    def name(type_):
+        index = counters.get(type_, 1)
+        while "%s%d" % (type_, index) in used:
+            index += 1
+        counters[type_] = index + 1
+        used.add("%s%d" % (type_, index))
+        return "%s%d" % (type_, index)
+    return name
+
+
+def build_scene(root, name=ROOT_NODE):
+    """
+    Build the tmXML node hierarchy for a parsed data file in one batch,
+    replacing any existing data node.  The root is named tmXML1 and holds the
+    file's tmOptions and tmGroups elements, as made by tmDefaultXML
+    """
+    if mc.objExists(name):
+        mc.delete(name)
+    elements = [element for child in root for element in child.iter()]
+    new_name = _unique_names(set([element.tag for element in elements]))
+    modifier = OpenMaya.MDagModifier()
+    created = []
+
+    def create(element, parent, node_name):
+        node = modifier.createNode("transform", parent)
+        modifier.renameNode(node, node_name)
+        values = [("type", element.tag)]
+        values += [(attr, element.get(attr)) for attr in NODE_ATTRS
+                   if element.get(attr) is not None]
+        text = (element.text or "").strip()
+        if text:
+            values.append(("data", " ".join(text.split())))
+        for attr, value in values:
+            fn_attr = OpenMaya.MFnTypedAttribute()
+            modifier.addAttribute(node, fn_attr.create(attr, attr,
+                                                       OpenMaya.MFnData.kString))
+        created.append((node, values))
+        for child in element:
+            create(child, node, new_name(child.tag))
+
+    # The root has no XML attributes of its own, so build it by hand
+    root_node = modifier.createNode("transform")
+    modifier.renameNode(root_node, name)
+    modifier.addAttribute(root_node, OpenMaya.MFnTypedAttribute().create(
+        "type", "type", OpenMaya.MFnData.kString))
+    created.append((root_node, [("type", "tmXML")]))
+    for child in root:
+        create(child, root_node, new_name(child.tag))
+    modifier.doIt()
+    for node, values in created:
+        fn_node = OpenMaya.MFnDependencyNode(node)
+        for attr, value in values:
+            fn_node.findPlug(attr, False).setString(value)
+    return 1
+
+
+def load_file(path, name=ROOT_NODE):
+    """
+    Replace the scene's tweenMachine data with the data in a file.  Returns
+    1 on success, or 0 if the file does not contain tweenMachine data
+    """
+    root = parse_file(path)
+    if root is None:
+        return 0
+    return build_scene(root, name)
+
+
+def save_file(path, slider_vis, button_vis, rgbs, values, root=ROOT_NODE):
+    """
+    Write the scene's groups and sets, plus the button and visibility data
+    passed from MEL (tab-separated RGB strings and values), to a data file in
+    the format written by tmSaveToFile
+    """
+    read_scene(root)
+    data = etree.Element("tmData")
+    options = etree.SubElement(data, "tmOptions")
+    etree.SubElement(options, "tmSliderVis").text = str(slider_vis)
+    etree.SubElement(options, "tmButtonVis").text = str(button_vis)
+    rgbs = [rgb for rgb in rgbs.split(SEPARATOR) if rgb]
+    values = [value for value in values.split(SEPARATOR) if value]
+    buttons = etree.SubElement(options, "tmButtons")
+    buttons.set("id", str(len(values)))
+    for rgb, value in zip(rgbs, values):
+        button = etree.SubElement(buttons, "tmButton")
+        etree.SubElement(button, "tmButtonRGB").text = rgb
+        etree.SubElement(button, "tmButtonValue").text = value
+    groups = etree.SubElement(data, "tmGroups")
+    for group in _find_all("tmGroup"):
+        group_element = etree.SubElement(groups, "tmGroup")
+        group_element.set("id", group.get("id", ""))
+        group_element.set("order", group.get("order", "0"))
+        for set_ in group.iter("tmSet"):
+            set_element = etree.SubElement(group_element, "tmSet")
+            set_element.set("id", set_.get("id", ""))
+            set_element.set("order", set_.get("order", "0"))
+            for obj in set_.iter("tmObject"):
+                etree.SubElement(set_element, "tmObject").text = obj.text
+    with open(path, "w") as output:
+        output.write('<?xml version="1.0"?>\n')
+        output.write(etree.tostring(data).decode("utf-8")
+                     if bytes is not str else etree.tostring(data))
+        output.write("\n")
+    return 1
+
+
+# -------------------------------------------------------------------------
+# ----------------------------------------------------------- Queries -----
+
+def _find_all(tag):
+    if _DATA is None:
+        return []
+    return list(_DATA.iter(tag))
+
+
+def _find_group(group_id):
+    for group in _find_all("tmGroup"):
+        if group.get("id") == group_id:
+            return group
+    return None
+
+
+def _data_text(tag, default="1"):
+    found = _find_all(tag)
+    if found and found[0].text:
+        return found[0].text.strip()
+    return default
+
+
+def visibility():
+    """
+    Return the slider and button visibility flags
+    """
+    return _join([_data_text("tmSliderVis"), _data_text("tmButtonVis")])
+
+
+def buttons():
+    """
+    Return the RGB string and value of each button, interleaved
+    """
+    items = []
+    for button in _find_all("tmButton"):
+        items.append((button.findtext("tmButtonRGB") or "0.6 0.6 0.6").strip())
+        items.append((button.findtext("tmButtonValue") or "0").strip())
+    return _join(items)
+
+
+def groups():
+    """
+    Return the group names, in order
+    """
+    return _join([group.get("id") for group in
+                  sorted(_find_all("tmGroup"), key=_order)])
+
+
+def sets(group_id):
+    """
+    Return the names of the sets in a group, in order
+    """
+    group = _find_group(group_id)
+    if group is None:
+        return ""
+    return _join([set_.get("id") for set_ in
+                  sorted(group.iter("tmSet"), key=_order)])
+
+
+def objects(group_id, set_id):
+    """
+    Return the members of a set that exist in the scene, checked with one
+    bulk query.  Missing members are reported and left out, except for the
+    character set marker, which is passed through
+    """
+    group = _find_group(group_id)
+    if group is None:
+        return ""
+    names = []
+    for set_ in group.iter("tmSet"):
+        if set_.get("id") == set_id:
+            names = [(obj.text or "").strip() for obj in set_.iter("tmObject")]
+            break
+    names = [name for name in names if name]
+    candidates = [name for name in names if name != CHARACTER_SET_MARKER]
+    existing = set()
+    if candidates:
+        existing.update(mc.ls(candidates) or [])
+        existing.update(mc.ls(candidates, long=True) or [])
+    found = []
+    for name in names:
+        if name in existing or name == CHARACTER_SET_MARKER:
+            found.append(name)
+        else:
+            OpenMaya.MGlobal.displayInfo(
+                'Omitting "%s" from set "%s". Object does not exist in scene.'
+                % (name, set_id))
+    return _join(found)
@@ -0,0 +1,273 @@
+"""
+tween_anim.py
+
+Maya-free tweening of exported .anim and .atom curve files.  Files are
+streamed line by line and only the keys of the curve currently being read are
+held in memory, so large exports can be processed without loading them
+whole.  New keys follow the same previous/next bias and tangent rules as
+tween_machine.tween().
+"""
+
+# Built-in
+import argparse
+from bisect import bisect_left, bisect_right
+import logging
+import multiprocessing
+import os
+import sys
+import time as timer
+
+
+LOG = logging.getLogger(__name__)
+
+TANGENT_TYPES = frozenset(("global", "fixed", "linear", "flat", "step",
+                           "stepnext", "slow", "fast", "smooth", "clamped",
+                           "spline", "plateau", "auto"))
+FILE_EXTENSIONS = (".anim", ".atom")
+
+
+def format_number(value):
+    """
+    Format a float the way Maya writes it in .anim files
+    """
+    text = ("%.6f" % value).rstrip("0").rstrip(".")
+    if text in ("-0", ""):
+        return "0"
+    return text
+
+
+class TMAnimKey(object):
+    """
+    A single key line from an animData keys block.  The line is kept as its
+    tokens so that fields this module doesn't touch are written back as read
+    """
+
+    __slots__ = ("tokens", "tangent_index")
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        # The two tangent types follow the time and value, but .atom files
+        # may have extra fields in between, so find them by name
+        self.tangent_index = 2
+        for index in range(2, len(tokens)):
+            if tokens[index] in TANGENT_TYPES:
+                self.tangent_index = index
+                break
+
+    @classmethod
+    def parse(cls, line):
+        """
+        Build a key from a line such as "10 5 linear linear 1 1 0;"
+        """
+        return cls(line.strip().rstrip(";").split())
+
+    @property
+    def time(self):
+        return float(self.tokens[0])
+
+    @property
+    def value(self):
+        return float(self.tokens[1])
+
+    @property
+    def in_tangent(self):
+        return self.tokens[self.tangent_index]
+
+    @property
+    def out_tangent(self):
+        return self.tokens[self.tangent_index + 1]
+
+    def derive(self, time, value, in_tangent, out_tangent):
+        """
+        Return a new key based on this one with a new time, value and tangent
+        types.  Angle and weight fields that only exist for fixed tangents are
+        dropped
+        """
+        tokens = list(self.tokens)
+        extra = 2 * [self.in_tangent, self.out_tangent].count("fixed")
+        if extra:
+            tokens = tokens[:-extra]
+        tokens[0] = format_number(time)
+        tokens[1] = format_number(value)
+        tokens[self.tangent_index] = in_tangent
+        tokens[self.tangent_index + 1] = out_tangent
+        return TMAnimKey(tokens)
+
+    def line(self, indent):
+        return "%s%s;\n" % (indent, " ".join(self.tokens))
+
+
+def tween_keys(keys, frames, bias, default_tangents=("auto", "auto")):
+    """
+    Insert (or replace) a key at each frame in a sorted list of TMAnimKeys,
+    blending between the previous and next keys.  Frames are processed in
+    order, so later frames see keys added for earlier ones, as repeated calls
+    to tween() in Maya would.  Frames without a key on both sides are
+    skipped.  Returns the number of keys written
+    """
+    times = [key.time for key in keys]
+    written = 0
+    for frame in frames:
+        before = bisect_left(times, frame)
+        after = bisect_right(times, frame)
+        if before == 0 or after == len(keys):
+            continue
+        key_prev = keys[before - 1]
+        key_next = keys[after]
+        in_tan_new = key_prev.out_tangent
+        out_tan_new = key_next.in_tangent
+        # If any of the types (previous or next) is "fixed", use the default
+        # tangent instead
+        if "fixed" in (key_prev.in_tangent, key_prev.out_tangent,
+                       key_next.in_tangent, key_next.out_tangent):
+            in_tan_new, out_tan_new = default_tangents
+        elif key_next.out_tangent == "step":
+            out_tan_new = key_next.out_tangent
+        # tween() leaves the in tangent alone when it would be stepped
+        if in_tan_new == "step":
+            in_tan_new = default_tangents[0]
+        value = key_prev.value + ((key_next.value - key_prev.value) * bias)
+        key = key_prev.derive(frame, value, in_tan_new, out_tan_new)
+        if before != after:
+            # Replace the existing key on this frame
+            keys[before] = key
+        else:
+            keys.insert(before, key)
+            times.insert(before, frame)
+        written += 1
+    return written
+
+
+def tween_stream(source, target, frames, bias, attributes=None,
+                 default_tangents=("auto", "auto")):
+    """
+    Copy an .anim/.atom file from one open file object to another, tweening
+    every curve (or only curves whose attribute name is in attributes) at the
+    given frames.  Returns a (curves, keys) tuple of how many curves were
+    changed and how many keys were written
+    """
+    frames = list(frames)
+    curves = 0
+    written = 0
+    attribute = None
+    keys = None
+    for line in source:
+        stripped = line.strip()
+        if keys is not None:
+            if stripped.startswith("}"):
+                count = 0
+                if attributes is None or attribute in attributes:
+                    count = tween_keys(keys, frames, bias, default_tangents)
+                indent = line[:len(line) - len(line.lstrip())] + "  "
+                for key in keys:
+                    target.write(key.line(indent))
+                target.write(line)
+                curves += int(count > 0)
+                written += count
+                keys = None
+            elif stripped:
+                keys.append(TMAnimKey.parse(stripped))
+            continue
+        if stripped.startswith("anim "):
+            tokens = stripped.rstrip(";").split()
+            attribute = tokens[2] if len(tokens) > 2 else None
+        elif stripped.startswith("keys") and stripped.endswith("{"):
+            keys = []
+        target.write(line)
+    return curves, written
+
+
+def tween_file(source_path, target_path, frames, bias, **kwds):
+    """
+    Tween a single .anim/.atom file, writing the result to target_path.
+    Returns a (curves, keys) tuple (see tween_stream)
+    """
+    with open(source_path, "r") as source:
+        with open(target_path, "w") as target:
+            return tween_stream(source, target, frames, bias, **kwds)
+
+
+def _tween_file_job(job):
+    """
+    Process pool entry point for tween_directory
+    """
+    source_path, target_path, frames, bias, kwds = job
+    start = timer.time()
+    try:
+        curves, keys = tween_file(source_path, target_path, frames, bias, **kwds)
+    except Exception as exc:
+        return source_path, None, None, timer.time() - start, str(exc)
+    return source_path, curves, keys, timer.time() - start, None
+
+
+def tween_directory(source_dir, target_dir, frames, bias, processes=None,
+                    **kwds):
+    """
+    Tween every .anim/.atom file in source_dir into target_dir, spreading the
+    files across a pool of processes (one per core by default).  Returns a
+    list of (path, curves, keys, seconds, error) tuples, one per file
+    """
+    if not os.path.exists(target_dir):
+        os.makedirs(target_dir)
+    jobs = []
+    for name in sorted(os.listdir(source_dir)):
+        if os.path.splitext(name)[1].lower() in FILE_EXTENSIONS:
+            jobs.append((os.path.join(source_dir, name),
+                         os.path.join(target_dir, name),
+                         list(frames), bias, kwds))
+    if not jobs:
+        return []
+    pool = multiprocessing.Pool(processes)
+    try:
+        return list(pool.imap_unordered(_tween_file_job, jobs))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main(argv=None):
+    """
+    Command line entry point
+    """
+    parser = argparse.ArgumentParser(
+        description="Create tweenMachine breakdowns in .anim/.atom files "
+                    "without Maya.")
+    parser.add_argument("source", help="File or directory to read")
+    parser.add_argument("target", help="File or directory to write")
+    parser.add_argument("-f", "--frame", type=float, action="append",
+                        required=True, dest="frames",
+                        help="Frame to key (may be repeated)")
+    parser.add_argument("-b", "--bias", type=float, default=0.5,
+                        help="Bias toward the next key, 0-1 (default 0.5)")
+    parser.add_argument("-a", "--attribute", action="append",
+                        dest="attributes",
+                        help="Only tween this attribute (may be repeated)")
+    parser.add_argument("-t", "--tangents", nargs=2, default=("auto", "auto"),
+                        metavar=("IN", "OUT"),
+                        help="Default tangents used where tween() would use "
+                             "the global tangents (default auto auto)")
+    parser.add_argument("-p", "--processes", type=int, default=None,
+                        help="Worker processes for directories "
+                             "(default: one per core)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    kwds = {"attributes": args.attributes,
+            "default_tangents": tuple(args.tangents)}
+    if os.path.isdir(args.source):
+        results = tween_directory(args.source, args.target, args.frames,
+                                  args.bias, args.processes, **kwds)
+    else:
+        results = [_tween_file_job((args.source, args.target, args.frames,
+                                    args.bias, kwds))]
+    failed = 0
+    for path, curves, keys, seconds, error in results:
+        if error:
+            failed += 1
+            LOG.error("%s: %s", path, error)
+        else:
+            LOG.info("%s: %d keys on %d curves (%.3fs)", path, keys, curves, seconds)
+    return int(failed > 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""
+tween_batch.py
+
+Headless multi-scene batch tweening.  A manifest lists scene files, the
+tweenMachineData sets and groups to tween in each, and the frames and biases
+to key.  Each scene is handled by its own mayapy worker process running
+without any UI, and a pool of workers processes the scenes in parallel.
+
+Manifest format (JSON)::
+
+    {"jobs": [{"scene": "/shots/010/anim.ma",
+               "output": "/shots/010/anim_tween.ma",
+               "groups": ["Body"],
+               "sets": ["Arms"],
+               "frames": [7, 15],
+               "bias": [0.33, 0.5]}]}
+
+"bias" is either a single value for all frames or one value per frame.
+"output" defaults to saving over the scene.  Sets may be given as
+"Group/Set" to pick a set from a specific group.
+
+Workers don't use the tweenMachine settings of the machine they run on:
+every mode is pinned to the default in BATCH_MODES unless the job sets it,
+with "rotation", "space", "layer", "tangents", "neighbours", "easing" or
+"special_tick", so the output doesn't depend on who last used the UI.
+
+The worker command is configurable so that a stub can stand in for mayapy:
+any command that takes the path of a job file as its last argument and
+prints a JSON result as its last line of output will do.
+"""
+
+# Built-in
+import argparse
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time as timer
+
+
+LOG = logging.getLogger(__name__)
+# Job keys for the settings workers pin, with their defaults
+BATCH_MODES = (("rotation", "rotation_mode", "euler"),
+               ("space", "tween_space", "local"),
+               ("layer", "layer_mode", "active"),
+               ("tangents", "tangent_mode", "types"),
+               ("neighbours", "neighbour_mode", "adjacent"),
+               ("easing", "easing", "linear"),
+               ("special_tick", "use_special_tick", False))
+
+
+def load_manifest(path):
+    """
+    Read a manifest file and return its list of jobs
+    """
+    with open(path, "r") as manifest:
+        data = json.load(manifest)
+    jobs = data["jobs"] if isinstance(data, dict) else data
+    for job in jobs:
+        if "scene" not in job or "frames" not in job:
+            raise ValueError("Manifest jobs need a scene and frames: %r" % job)
+    return jobs
+
+
+def worker_command(mayapy="mayapy"):
+    """
+    Return the default worker command, which runs this module under mayapy
+    """
+    return [mayapy, os.path.abspath(__file__).replace(".pyc", ".py"), "--worker"]
+
+
+def run_job(job, command):
+    """
+    Run a single job in a worker process and return its report entry
+    """
+    handle, job_path = tempfile.mkstemp(prefix="tween_batch_", suffix=".json")
+    with os.fdopen(handle, "w") as job_file:
+        json.dump(job, job_file)
+    report = {"scene": job["scene"], "seconds": None, "returncode": None,
+              "result": None, "error": None}
+    start = timer.time()
+    try:
+        process = subprocess.Popen(command + [job_path],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   universal_newlines=True)
+        stdout, stderr = process.communicate()
+        report["returncode"] = process.returncode
+        lines = stdout.strip().splitlines()
+        if lines:
+            try:
+                report["result"] = json.loads(lines[-1])
+            except ValueError:
+                pass
+        if isinstance(report["result"], dict) and report["result"].get("error"):
+            report["error"] = report["result"]["error"]
+        elif process.returncode:
+            report["error"] = stderr.strip().splitlines()[-1] if stderr.strip() \
+                else "Worker exited with code %d" % process.returncode
+        elif report["result"] is None:
+            report["error"] = "Worker returned no result"
+    except OSError as exc:
+        report["error"] = str(exc)
+    finally:
+        report["seconds"] = timer.time() - start
+        os.remove(job_path)
+    return report
+
+
+def run(jobs, workers=None, command=None):
+    """
+    Run all jobs across a pool of worker processes and return a report
+    dictionary with one entry per job plus totals
+    """
+    if command is None:
+        command = worker_command()
+    start = timer.time()
+    pool = ThreadPool(workers or 1)
+    try:
+        entries = pool.map(lambda job: run_job(job, command), jobs)
+    finally:
+        pool.close()
+        pool.join()
+    failed = [entry for entry in entries if entry["error"]]
+    return {"jobs": entries,
+            "total": len(entries),
+            "failed": len(failed),
+            "seconds": timer.time() - start}
+
+
+# -------------------------------------------------------------------------
+# ------------------------------------------------------------ Worker -----
+
+def resolve_nodes(data, job):
+    """
+    Collect the nodes of the job's named groups and sets from a TMData
+    instance
+    """
+    nodes = []
+    groups = dict((group.name, group) for group in data.groups)
+    for name in job.get("groups", []):
+        if name not in groups:
+            raise ValueError("No tweenMachine group named %r" % name)
+        nodes += groups[name].nodes
+    for name in job.get("sets", []):
+        group_name, _, set_name = name.rpartition("/")
+        found = [set_ for group in data.groups for set_ in group.sets
+                 if set_.name == set_name and group_name in ("", group.name)]
+        if not found:
+            raise ValueError("No tweenMachine set named %r" % name)
+        for set_ in found:
+            nodes += set_.nodes
+    return sorted(set(nodes))
+
+
+def work(job_path):
+    """
+    Worker entry point, run under mayapy.  Opens the job's scene, tweens the
+    requested nodes at each frame and saves the result
+    """
+    with open(job_path, "r") as job_file:
+        job = json.load(job_file)
+    result = {"scene": job["scene"], "keys": 0, "nodes": 0}
+    start = timer.time()
+    try:
+        import maya.standalone
+        maya.standalone.initialize(name="python")
+        import maya.cmds as mc
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import tween_machine
+        tween_machine.SETTINGS.pin(**dict((setting, job.get(key, default))
+                                          for key, setting, default in BATCH_MODES))
+        mc.file(job["scene"], open=True, force=True)
+        data = tween_machine.TMData()
+        nodes = resolve_nodes(data, job)
+        result["nodes"] = len(nodes)
+        frames = job["frames"]
+        biases = job.get("bias", 0.5)
+        if not isinstance(biases, list):
+            biases = [biases] * len(frames)
+        if nodes:
+            for frame, bias in zip(frames, biases):
+                result["keys"] += tween_machine.tween(bias, nodes, time=frame)
+        mc.file(rename=job.get("output", job["scene"]))
+        mc.file(save=True, force=True)
+    except Exception as exc:
+        result["error"] = "%s: %s" % (type(exc).__name__, exc)
+    result["seconds"] = timer.time() - start
+    sys.stdout.write("\n" + json.dumps(result) + "\n")
+    return int("error" in result)
+
+
+def main(argv=None):
+    """
+    Command line entry point
+    """
+    parser = argparse.ArgumentParser(
+        description="Tween tweenMachine sets across many scenes with "
+                    "headless mayapy workers.")
+    parser.add_argument("manifest", nargs="?", help="Manifest JSON file")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Number of worker processes (default 1)")
+    parser.add_argument("--mayapy", default="mayapy",
+                        help="mayapy executable (default: mayapy on PATH)")
+    parser.add_argument("--worker-command", default=None,
+                        help="Command to run instead of mayapy, e.g. a stub "
+                             "worker; the job file path is appended")
+    parser.add_argument("-r", "--report", default=None,
+                        help="Write the JSON report here instead of stdout")
+    parser.add_argument("--worker", metavar="JOB", default=None,
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.worker:
+        return work(args.worker)
+    if not args.manifest:
+        parser.error("a manifest is required")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.worker_command:
+        command = shlex.split(args.worker_command)
+    else:
+        command = worker_command(args.mayapy)
+    report = run(load_manifest(args.manifest), args.workers, command)
+    for entry in report["jobs"]:
+        if entry["error"]:
+            LOG.error("%s: failed after %.2fs: %s", entry["scene"],
+                      entry["seconds"], entry["error"])
+        else:
+            LOG.info("%s: %.2fs", entry["scene"], entry["seconds"])
+    text = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, "w") as report_file:
+            report_file.write(text)
+    else:
+        sys.stdout.write(text + "\n")
+    return int(report["failed"] > 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
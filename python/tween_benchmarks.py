@@ -0,0 +1,191 @@
+"""
+tween_benchmarks.py
+
+Benchmarks for tweenMachine's data model and chunked tweening, run from the
+Script Editor:
+
+    import tween_benchmarks
+    tween_benchmarks.benchmark_data_model()
+    tween_benchmarks.benchmark_chunks()
+
+They are kept out of tween_machine so that the tool itself carries no
+benchmark code.  The Qt row benchmark lives with the rows in tween_qt.
+"""
+
+# Built-in
+from array import array
+import logging
+from multiprocessing import cpu_count
+import sys
+import time as timer
+try:
+    import xml.etree.cElementTree as etree
+except ImportError:
+    import xml.etree.ElementTree as etree
+
+import tween_machine
+
+
+LOG = logging.getLogger(__name__)
+
+
+def _deep_size(obj, seen, skip=("group", "data", "_element")):
+    """
+    Return the size in bytes of an object and everything it holds, leaving
+    out back-references and element trees (skip) and anything already seen
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        children = list(obj.keys()) + list(obj.values())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        children = obj
+    else:
+        children = [getattr(obj, name) for name in getattr(type(obj), "__slots__", ())
+                    if name not in skip and hasattr(obj, name)]
+        if hasattr(obj, "__dict__"):
+            size += sys.getsizeof(obj.__dict__)
+            children += [value for name, value in vars(obj).items() if name not in skip]
+    for child in children:
+        size += _deep_size(child, seen, skip)
+    return size
+
+
+class _BenchmarkData(object):
+    """
+    Stands in for TMData, holding the node table its groups share
+    """
+
+    def __init__(self):
+        self.node_table = tween_machine.TMNodeTable()
+
+
+class LegacyGroup(object):
+    """
+    A group as the data model held it before TMNodeTable
+    """
+
+    def __init__(self, element):
+        self.data = None
+        self._element = element
+        self.index = element.get("index")
+        self.name = element.get("name")
+        self.sets = [LegacySet(self, e) for e in element.findall("set")]
+
+
+class LegacySet(object):
+    """
+    A set holding its members as a list of name strings
+    """
+
+    def __init__(self, group, element):
+        self.group = group
+        self._element = element
+        self.nodes = (element.text or "").split()
+        self.name = element.get("name")
+        self.index = element.get("index")
+        self.easing = None
+        self.stagger_offset = None
+        self.stagger_falloff = 0.0
+
+
+class LegacyButton(object):
+    """
+    A button as a plain object
+    """
+
+    def __init__(self, data):
+        self.value, self.color = data
+
+
+class LegacyRow(object):
+    """
+    A button row keeping its own iteration cursor
+    """
+
+    def __init__(self, data):
+        self.buttons = tuple([LegacyButton(element) for element in data])
+        self.iter_index = -1
+
+
+def benchmark_data_model(count=10000, members=20, pool=2000, groups=100):
+    """
+    Compare the memory held by count sets, their groups and a button row per
+    set in the compact data model with the same data held as the model held
+    it before: plain objects, a list of name strings per set and a button row
+    keeping its own iteration cursor.  Members are drawn from a pool of node
+    names so that sets share members, as they do on a rig.  Element trees are
+    the same in both models and aren't counted.  Returns (and logs) the
+    bytes and build seconds of each model
+    """
+    root = etree.Element("groups")
+    per_group = max(1, count // groups)
+    for index in range(count):
+        if index % per_group == 0:
+            group_element = etree.SubElement(root, "group")
+            group_element.set("name", "group%d" % (index // per_group))
+            group_element.set("index", str(index // per_group))
+        element = etree.SubElement(group_element, "set")
+        element.set("name", "set%d" % index)
+        element.set("index", str(index % per_group))
+        element.text = " ".join(["rig:ctrl%d" % ((index * 7 + member * 13) % pool)
+                                 for member in range(members)])
+    button_data = tween_machine.SETTINGS["default_button_data"]
+    results = {}
+    for model, group_class, row_class in (("legacy", LegacyGroup, LegacyRow),
+                                          ("compact", None, tween_machine.TMButtonRowData)):
+        start = timer.time()
+        if group_class is None:
+            data = _BenchmarkData()
+            built = [tween_machine.TMGroup(data, element) for element in root]
+        else:
+            built = [group_class(element) for element in root]
+        rows = [row_class(button_data) for group in built for set_ in group.sets]
+        seconds = timer.time() - start
+        results[model] = {"bytes": _deep_size([built, rows], set()), "seconds": seconds}
+    LOG.info("%d sets: legacy %.1f MB in %.3fs, compact %.1f MB in %.3fs",
+             count, results["legacy"]["bytes"] / 1048576.0, results["legacy"]["seconds"],
+             results["compact"]["bytes"] / 1048576.0, results["compact"]["seconds"])
+    return results
+
+
+def benchmark_chunks(count=100000, chunk_size=None, workers=None, repeat=3):
+    """
+    Time the chunk pipeline (see tween_machine.run_chunks) on count
+    synthetic curves with 1 up to workers (by default, every core) worker
+    threads, logging and returning the best time and the speedup over one
+    worker for each, and which blend kernel ran: "numpy", whose loops
+    release the GIL, or "python", which can't run in parallel.  Snapshots
+    are built from arrays rather than queried, so only the pipeline and
+    kernel are measured
+    """
+    workers = workers or cpu_count()
+    kernel_name = "python" if tween_machine.numpy is None else "numpy"
+    values_prev = array("d", [float(i % 97) for i in range(count)])
+    values_next = array("d", [float(i % 89) for i in range(count)])
+    biases = array("d", [(i % 100) / 100.0 for i in range(count)])
+
+    def snapshot(span):
+        start, stop = span
+        return values_prev[start:stop], values_next[start:stop], biases[start:stop]
+
+    def kernel(item):
+        return tween_machine.blend(*item)
+
+    results = []
+    for worker_count in range(1, workers + 1):
+        best = None
+        for _ in range(repeat):
+            start = timer.time()
+            tween_machine.run_chunks(tween_machine.chunk_ranges(count, chunk_size),
+                                     snapshot, kernel, len, worker_count)
+            seconds = timer.time() - start
+            best = seconds if best is None else min(best, seconds)
+        speedup = results[0]["seconds"] / best if results and best else 1.0
+        results.append({"workers": worker_count, "seconds": best,
+                        "speedup": speedup, "kernel": kernel_name})
+        LOG.info("%d curves, %s kernel, %d worker(s): %.3fs, %.2fx",
+                 count, kernel_name, worker_count, best, speedup)
+    return results
@@ -3,26 +3,47 @@ tween_machine.py
 """
 
 # Built-in
+from bisect import bisect_left, bisect_right, insort
 import contextlib
+import copy
+from array import array
+from collections import deque
+from itertools import compress
 import json
 import logging
 import logging.config
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 import os
 import sys
 import tempfile
-import urllib2
+import time as timer
+try:
+    from urllib2 import urlopen
+except ImportError:
+    from urllib.request import urlopen
 import webbrowser
 from threading import Thread
-import xml.etree.cElementTree as etree
+try:
+    import xml.etree.cElementTree as etree
+except ImportError:
+    import xml.etree.ElementTree as etree
 
-from maya.api import OpenMaya
+from maya.api import OpenMaya, OpenMayaAnim
 
 # Third-party
 import maya.cmds as mc
 import maya.mel as mel
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 __version__ = "3.0.0"
+DATA_FILE_VERSION = 1
+# Tweens of more curves than this are queried, blended and written in chunks
+CHUNK_SIZE = 4096
 MAYA_VERSION = mc.about(version=True)
 GITHUB_URL = 'https://github.com/alexwidener/tweenMachine'
 GITHUB_ISSUES_URL = 'https://github.com/alexwidener/tweenMachine/issues'
@@ -125,111 +146,2419 @@ def find_ui(uitype):
     return ""
 
 
+def qt_rows():
+    """
+    Return the tween_qt module, or None if Qt can't be imported
+    """
+    try:
+        import tween_qt
+    except ImportError:
+        return None
+    return tween_qt if tween_qt.AVAILABLE else None
+
+
 def start():
     """
-    Convenience function to open the main tweenMachine instance
+    Convenience function to open the main tweenMachine instance
+    """
+    TMWindowUI()
+
+
+def is_headless():
+    """
+    Return True when running without a UI (mayapy or maya -batch)
+    """
+    return mc.about(batch=True)
+
+
+def inactive():
+    """
+    Display a warning when a feature is not active
+    """
+    LOG.warn('This tweenMachine feature is not currently active.')
+
+
+class TMEasing(object):
+    """
+    Easing profile that maps a linear bias to an eased bias through a
+    precomputed lookup table, so evaluating it while dragging a slider costs
+    one table lookup.  Biases outside 0-1 (overshoot) continue linearly from
+    the ends of the profile
+    """
+
+    samples = 256
+
+    def __init__(self, name, function=None, points=None):
+        self.name = name
+        self.points = points
+        if function is None:
+            function = self._piecewise(points)
+        step = 1.0 / self.samples
+        self.table = array("d", [function(i * step) for i in range(self.samples + 1)])
+
+    @staticmethod
+    def _piecewise(points):
+        """
+        Return a function that linearly interpolates a flat list of
+        (x, y) control point values
+        """
+        pairs = sorted(zip(points[::2], points[1::2]))
+
+        def function(x):
+            for (x0, y0), (x1, y1) in zip(pairs, pairs[1:]):
+                if x <= x1:
+                    if x1 == x0:
+                        return y1
+                    return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+            return pairs[-1][1]
+        return function
+
+    def __call__(self, bias):
+        clamped = min(max(bias, 0.0), 1.0)
+        position = clamped * self.samples
+        index = min(int(position), self.samples - 1)
+        fraction = position - index
+        eased = self.table[index] + (self.table[index + 1] - self.table[index]) * fraction
+        return eased + (bias - clamped)
+
+
+EASINGS = {}
+
+
+def register_easing(easing):
+    """
+    Make an easing profile available by name
+    """
+    EASINGS[easing.name] = easing
+
+
+def get_easing(name=None):
+    """
+    Return the named easing profile, falling back to the global setting and
+    then to linear
+    """
+    if name is None:
+        name = SETTINGS["easing"]
+    return EASINGS.get(name, EASINGS["linear"])
+
+
+register_easing(TMEasing("linear", lambda x: x))
+register_easing(TMEasing("ease_in", lambda x: x * x))
+register_easing(TMEasing("ease_out", lambda x: 1.0 - (1.0 - x) * (1.0 - x)))
+register_easing(TMEasing("ease_in_out", lambda x: x * x * (3.0 - 2.0 * x)))
+register_easing(TMEasing("cubic", lambda x: 4.0 * x ** 3 if x < 0.5
+                         else 1.0 - ((2.0 - 2.0 * x) ** 3) / 2.0))
+# Halfway between linear and the ease-in/out of a spline segment with flat
+# tangents, so breakdowns lean toward the spline shape without losing control
+register_easing(TMEasing("favor_spline",
+                         lambda x: (x + x * x * (3.0 - 2.0 * x)) / 2.0))
+
+
+def blend(values_prev, values_next, bias):
+    """
+    Blend two equal-length sequences of values by the given bias, either a
+    single value or a sequence with one value per pair, in a single pass,
+    returning an array of doubles.  With NumPy the pass runs in its
+    compiled loops, which release the GIL, so that chunks blended on worker
+    threads run in parallel (see run_chunks); otherwise it's a Python loop
+    """
+    if numpy is not None and len(values_prev):
+        values = array("d", values_prev)
+        out = numpy.frombuffer(values, dtype=numpy.float64)
+        if not isinstance(bias, (int, float)):
+            bias = numpy.asarray(bias, dtype=numpy.float64)
+        numpy.subtract(numpy.asarray(values_next, dtype=numpy.float64), out, out=out)
+        numpy.multiply(out, bias, out=out)
+        numpy.add(out, numpy.asarray(values_prev, dtype=numpy.float64), out=out)
+        return values
+    if isinstance(bias, (int, float)):
+        return array("d", [prev + ((next_ - prev) * bias)
+                           for prev, next_ in zip(values_prev, values_next)])
+    return array("d", [prev + ((next_ - prev) * bias_)
+                       for prev, next_, bias_ in zip(values_prev, values_next, bias)])
+
+
+def curve_subset(values, curves, subset):
+    """
+    Return the bias (or time) for a subset of the given curves, from a
+    single value or a sequence with one value per curve
+    """
+    if isinstance(values, (int, float)):
+        return values
+    lookup = dict(zip(curves, values))
+    return array("d", [lookup[curve] for curve in subset])
+
+
+def value_slice(values, start, stop):
+    """
+    Return the bias (or time) for the items from start to stop, from a
+    single value or a sequence with one value per item
+    """
+    if isinstance(values, (int, float)):
+        return values
+    return values[start:stop]
+
+
+def value_at(values, index):
+    """
+    Return the bias (or time) for the item at index, from a single value or
+    a sequence with one value per item
+    """
+    if isinstance(values, (int, float)):
+        return values
+    return values[index]
+
+
+def curve_plugs(curves):
+    """
+    Return the plug driven by each of the given anim curves, in the same
+    order.  Curves that don't drive anything are returned as None
+    """
+    plugs = {}
+    if curves:
+        connections = mc.listConnections(curves, source=False, destination=True,
+                                         plugs=True, connections=True,
+                                         skipConversionNodes=True) or []
+        for source, dest in zip(connections[::2], connections[1::2]):
+            plugs.setdefault(source.split(".")[0], dest)
+    return [plugs.get(curve) for curve in curves]
+
+
+def default_tangents():
+    """
+    Return the global (default) in and out tangent types
+    """
+    return (mc.keyTangent(q=True, g=True, itt=True)[0],
+            mc.keyTangent(q=True, g=True, ott=True)[0])
+
+
+@contextlib.contextmanager
+def write_phase(name="tweenMachine"):
+    """
+    Group every edit made inside the block into a single undo chunk and, if
+    the "suspend_refresh" setting is on, keep the viewport from refreshing
+    (and therefore from pulling on the DG) until the block exits
+    """
+    suspend = SETTINGS["suspend_refresh"] and not mc.refresh(q=True, suspend=True)
+    mc.undoInfo(openChunk=True, chunkName=name)
+    if suspend:
+        mc.refresh(suspend=True)
+    try:
+        yield
+    finally:
+        if suspend:
+            mc.refresh(suspend=False)
+        mc.undoInfo(closeChunk=True)
+
+
+@contextlib.contextmanager
+def undo_suspended():
+    """
+    Turn undo off, without flushing the undo queue, for the edits made
+    inside the block
+    """
+    undo = mc.undoInfo(q=True, state=True)
+    if undo:
+        mc.undoInfo(stateWithoutFlush=False)
+    try:
+        yield
+    finally:
+        if undo:
+            mc.undoInfo(stateWithoutFlush=True)
+
+
+def anim_curve(curve):
+    """
+    Return the MFnAnimCurve of a curve and the scale from its internal
+    units (radians, centimetres) to UI units
+    """
+    selection = OpenMaya.MSelectionList()
+    selection.add(curve)
+    function = OpenMayaAnim.MFnAnimCurve(selection.getDependNode(0))
+    curve_type = function.animCurveType
+    scale = 1.0
+    if curve_type in (OpenMayaAnim.MFnAnimCurve.kAnimCurveTA,
+                      OpenMayaAnim.MFnAnimCurve.kAnimCurveUA):
+        scale = OpenMaya.MAngle(1.0).asUnits(OpenMaya.MAngle.uiUnit())
+    elif curve_type in (OpenMayaAnim.MFnAnimCurve.kAnimCurveTL,
+                        OpenMayaAnim.MFnAnimCurve.kAnimCurveUL):
+        scale = OpenMaya.MDistance(1.0).asUnits(OpenMaya.MDistance.uiUnit())
+    return function, scale
+
+
+def edit_curves(function, curves):
+    """
+    Run function(change) through the tweenMachineKeys command (see
+    TMKeyCommand), so that the MFnAnimCurve edits it records in the
+    MAnimCurveChange are undone and redone as one step, and mark the given
+    curves in the curve journal.  Returns False, without running function,
+    if the plugin isn't loaded and callers have to edit with commands
+    """
+    if not TMKeyCommand.registered:
+        return False
+    TMKeyCommand.pending = function
+    try:
+        getattr(mc, TMKeyCommand.kPluginCmdName)()
+    finally:
+        TMKeyCommand.pending = None
+    journal = TMCurveJournal.instance()
+    for curve in curves:
+        journal.mark(curve)
+    return True
+
+
+# MFnAnimCurve tangent types by keyTangent name
+TANGENT_TYPES = {"global": "kTangentGlobal", "fixed": "kTangentFixed",
+                 "linear": "kTangentLinear", "flat": "kTangentFlat",
+                 "spline": "kTangentSmooth", "step": "kTangentStep",
+                 "stepnext": "kTangentStepNext", "clamped": "kTangentClamped",
+                 "plateau": "kTangentPlateau", "auto": "kTangentAuto"}
+
+
+def set_curve_keys(keys, time, change=None):
+    """
+    Write keys (see write_keys) through each curve's MFnAnimCurve, in one
+    pass, recording the edits in the given MAnimCurveChange
+    """
+    function_class = OpenMayaAnim.MFnAnimCurve
+    types = dict((name, getattr(function_class, constant, function_class.kTangentGlobal))
+                 for name, constant in TANGENT_TYPES.items())
+    unit = OpenMaya.MTime.uiUnit()
+    functions = {}
+    for curve, value, in_tan, out_tan in keys:
+        if curve not in functions:
+            functions[curve] = anim_curve(curve)
+        function, scale = functions[curve]
+        key_time = OpenMaya.MTime(time[curve] if isinstance(time, dict) else time, unit)
+        out_type = types.get(out_tan, function_class.kTangentGlobal)
+        index = function.find(key_time)
+        if index is None:
+            # Step is only an out tangent type, so the in tangent is left
+            # to the global type, as setKeyframe leaves it
+            in_type = types.get(in_tan, function_class.kTangentGlobal)
+            if in_tan == "step":
+                in_type = function_class.kTangentGlobal
+            function.addKey(key_time, value / scale, in_type, out_type, change)
+        else:
+            function.setValue(index, value / scale, change)
+            if in_tan != "step":
+                function.setInTangentType(
+                    index, types.get(in_tan, function_class.kTangentGlobal), change)
+            function.setOutTangentType(index, out_type, change)
+
+
+def write_keys(keys, time, tangents=()):
+    """
+    Write new keys at the given time, or at the time each curve maps to if
+    time is a dictionary.  Each key is a (curve, value, in_tangent,
+    out_tangent) tuple.  With the plugin loaded every key is written in one
+    pass through MFnAnimCurve, as a single undoable command (see
+    edit_curves and set_curve_keys).  Otherwise curves sharing a time, value
+    and out tangent type are keyed with a single setKeyframe, and curves
+    sharing a time and in tangent type edited with a single keyTangent.
+    Explicit tangents from shape_tangents are then set on their keys,
+    after unlocking the weights of weighted curves with one edit per time,
+    and the special tick with one edit per time
+    """
+    ticks = {}
+    for key in keys:
+        key_time = time[key[0]] if isinstance(time, dict) else time
+        ticks.setdefault(key_time, []).append(key[0])
+    if not edit_curves(lambda change: set_curve_keys(keys, time, change),
+                       [key[0] for key in keys]):
+        values = {}
+        in_tangents = {}
+        for curve, value, in_tan, out_tan in keys:
+            key_time = time[curve] if isinstance(time, dict) else time
+            values.setdefault((key_time, value, out_tan), []).append(curve)
+            if in_tan != "step":
+                in_tangents.setdefault((key_time, in_tan), []).append(curve)
+        for (key_time, value, out_tan), curves in values.items():
+            mc.setKeyframe(curves, t=(key_time,), v=value, ott=out_tan)
+        for (key_time, in_tan), curves in in_tangents.items():
+            mc.keyTangent(curves, t=(key_time,), itt=in_tan)
+    unlock = {}
+    for curve, _, weighted in tangents:
+        if weighted:
+            key_time = time[curve] if isinstance(time, dict) else time
+            unlock.setdefault(key_time, []).append(curve)
+    for key_time, curves in unlock.items():
+        mc.keyTangent(curves, t=(key_time,), weightLock=False)
+    for curve, (in_x, in_y, out_x, out_y), _ in tangents:
+        key_time = time[curve] if isinstance(time, dict) else time
+        mc.keyTangent(curve, t=(key_time,), ix=in_x, iy=in_y, ox=out_x, oy=out_y)
+    # If we're using the special tick, set that appropriately
+    if SETTINGS["use_special_tick"]:
+        for key_time, curves in ticks.items():
+            mc.keyframe(curves, tds=True, t=(key_time,))
+
+
+def split_segment(points, x):
+    """
+    Split the cubic Bezier segment given by four (x, y) control points at
+    the given x, which must lie between the end points' x values.  Returns
+    the point on the curve and the handle offsets either side of it, as
+    (point, in_handle, out_handle)
+    """
+    (x0, _), (x1, _), (x2, _), (x3, _) = points
+    # Non-weighted handles reach a third of the way along the segment, which
+    # makes x(u) linear, so this first guess is exact for them.  Weighted
+    # segments are refined with Newton steps; x(u) is monotonic over a
+    # segment, so a step that leaves the bracket bisects it instead
+    u = (x - x0) / (x3 - x0)
+    low, high = 0.0, 1.0
+    for _ in range(20):
+        v = 1.0 - u
+        error = v * v * v * x0 + 3 * v * v * u * x1 + 3 * v * u * u * x2 + u * u * u * x3 - x
+        if abs(error) <= 1e-12 * (x3 - x0):
+            break
+        if error < 0:
+            low = u
+        else:
+            high = u
+        slope = 3 * (v * v * (x1 - x0) + 2 * v * u * (x2 - x1) + u * u * (x3 - x2))
+        u = u - error / slope if slope > 0 else low - 1.0
+        if not low < u < high:
+            u = (low + high) / 2.0
+    lerp = lambda a, b: (a[0] + (b[0] - a[0]) * u, a[1] + (b[1] - a[1]) * u)
+    a, b, c = lerp(points[0], points[1]), lerp(points[1], points[2]), lerp(points[2], points[3])
+    d, e = lerp(a, b), lerp(b, c)
+    point = lerp(d, e)
+    return (point, (point[0] - d[0], point[1] - d[1]),
+            (e[0] - point[0], e[1] - point[1]))
+
+
+def shape_tangents(keys, time, data):
+    """
+    Compute explicit tangents for new keys that follow the shape of each
+    curve's segment between the neighbour keys the new keys were blended
+    from.
+
+    The segment is rebuilt as a cubic Bezier from the neighbours' tangents
+    and split at the new key's time, giving the slope (and, on weighted
+    curves, the handle lengths) of the curve at that point.  A key that
+    lands on the curve therefore leaves a non-weighted curve's shape
+    unchanged, and keys at other biases keep the same tangents so the curve
+    changes smoothly with the bias.  The neighbouring keys are not edited,
+    so keying the same frame again gives the same tangents.  Segments that
+    are stepped, or whose neighbour tangents are vertical, are skipped.
+
+    time is a single time or a dictionary mapping curves to times, and data
+    is the neighbour_data the keys were built from, whose neighbour times
+    and values (adjacent or pose keys) bound each segment.  The neighbour
+    tangents are queried in bulk: one keyTangent query per flag for all the
+    curves sharing a neighbour time, and one for every curve's weighting.
+    Returns a list of (curve, (in_x, in_y, out_x, out_y), weighted) tuples,
+    in keyTangent units (x in seconds)
+    """
+    seconds = OpenMaya.MTime(1.0, OpenMaya.MTime.uiUnit()).asUnits(OpenMaya.MTime.kSeconds)
+    times_prev, times_next, values_prev, values_next, new_tangents = data
+    indices = dict((entry[0], index) for index, entry in enumerate(new_tangents))
+    # The curves whose new key lies inside its segment, by neighbour time
+    curves = []
+    by_prev = {}
+    by_next = {}
+    for key in keys:
+        curve = key[0]
+        index = indices.get(curve)
+        if index is None:
+            continue
+        key_time = time[curve] if isinstance(time, dict) else time
+        if not times_prev[index] < key_time < times_next[index]:
+            continue
+        curves.append(curve)
+        by_prev.setdefault(times_prev[index], []).append(curve)
+        by_next.setdefault(times_next[index], []).append(curve)
+    if not curves:
+        return []
+    # Curve -> (out type, ox, oy) at the previous key and (in type, ix, iy)
+    # at the next
+    outs = {}
+    for time_prev, group in by_prev.items():
+        span = {"q": True, "t": (time_prev,)}
+        outs.update(zip(group, zip(mc.keyTangent(group, ott=True, **span),
+                                   mc.keyTangent(group, ox=True, **span),
+                                   mc.keyTangent(group, oy=True, **span))))
+    ins = {}
+    for time_next, group in by_next.items():
+        span = {"q": True, "t": (time_next,)}
+        ins.update(zip(group, zip(mc.keyTangent(group, itt=True, **span),
+                                  mc.keyTangent(group, ix=True, **span),
+                                  mc.keyTangent(group, iy=True, **span))))
+    weights = dict(zip(curves, mc.keyTangent(curves, q=True, weightedTangents=True)))
+    segments = []
+    for key in keys:
+        curve = key[0]
+        if curve not in weights:
+            continue
+        out_type, out_x, out_y = outs[curve]
+        in_type, in_x, in_y = ins[curve]
+        if out_type in ("step", "stepnext") or in_type in ("step", "stepnext"):
+            continue
+        index = indices[curve]
+        key_time = time[curve] if isinstance(time, dict) else time
+        segments.append((
+            curve, key_time * seconds, times_prev[index] * seconds,
+            times_next[index] * seconds, values_prev[index], values_next[index],
+            out_x, out_y, in_x, in_y, weights[curve]))
+    # Split every segment in one pass
+    tangents = []
+    for (curve, x, x0, x3, y0, y3, out_x, out_y, in_x, in_y,
+         weighted) in segments:
+        if weighted:
+            handle_out = (out_x / 3.0, out_y / 3.0)
+            handle_in = (in_x / 3.0, in_y / 3.0)
+        elif out_x > 1e-9 and in_x > 1e-9:
+            # Non-weighted handles always reach a third of the way along
+            # the segment
+            third = (x3 - x0) / 3.0
+            handle_out = (third, third * out_y / out_x)
+            handle_in = (third, third * in_y / in_x)
+        else:
+            continue
+        point, handle_in_new, handle_out_new = split_segment(
+            ((x0, y0), (x0 + handle_out[0], y0 + handle_out[1]),
+             (x3 - handle_in[0], y3 - handle_in[1]), (x3, y3)), x)
+        tangents.append((curve, (3.0 * handle_in_new[0], 3.0 * handle_in_new[1],
+                                 3.0 * handle_out_new[0], 3.0 * handle_out_new[1]),
+                         bool(weighted)))
+    return tangents
+
+
+def tween(bias, nodes=None, reset_time=True, poses=None, easing=None,
+          rotation=None, space=None, time=None, attributes=None, layer=None,
+          tangents=None, neighbours=None, frames=None):
+    """
+    Create the in-between key(s) on the specified nodes
+
+    All keys are written inside a single write phase (see write_phase).
+    Afterwards, if reset_time is True, the time is set to the keyed frame.
+    When the current time is already that frame, only the keyed attributes
+    are evaluated (with dgeval) rather than the whole scene; moving to
+    another frame needs the full update that currentTime makes.  When
+    reset_time is False neither is done.
+
+    If poses is a pair of TMPose snapshots, they are used as the endpoints of
+    the blend instead of the previous and next keys on each curve.
+
+    The bias is passed through the named easing profile (see TMEasing), or
+    the global "easing" setting if none is given.
+
+    rotation is "euler" to blend rotate channels independently or
+    "quaternion" to slerp them per node (see slerp_rotations), defaulting to
+    the global "rotation_mode" setting.
+
+    space is "local" to blend channel values or "world" to blend the world
+    matrices of transforms at their neighbour keys and solve back to local
+    channels (see world_space_keys), defaulting to the global "tween_space"
+    setting.
+
+    time and attributes override the frame to key and the channels to
+    affect, which otherwise come from the time slider and the channel box.
+    In batch mode (see is_headless) no UI is queried or touched.
+
+    layer is "active" to key only the curves on the active animation layer
+    (see TMLayerCache.active_layer), "composite" to also blend the final
+    attribute values rather than the layer's own values, or "all" to key the
+    curves on every layer, defaulting to the global "layer_mode" setting.
+    Scenes without animation layers are unaffected.
+
+    tangents is "types" to copy the neighbouring keys' tangent types, or
+    "shape" to give new keys explicit tangents that follow the shape of the
+    curve (see shape_tangents), defaulting to the global "tangent_mode"
+    setting.
+
+    neighbours is "adjacent" to blend between the keys either side of the
+    frame, or "poses" to blend between the nearest pose keys, for baked or
+    dense curves with a key on every frame (see role_neighbours), defaulting
+    to the global "neighbour_mode" setting.  frames are extra pose frames,
+    by default the scene's (see TMData.set_pose_frames).
+
+    Returns the number of keys written.
+    """
+    if isinstance(nodes, list) and not nodes:
+        nodes = None
+    bias = get_easing(easing)(bias)
+    # Figure out which nodes to pull from
+    if nodes is not None:
+        pullfrom = nodes
+    else:
+        pullfrom = mc.ls(sl=True)
+        if not pullfrom:
+            return 0
+    curves = resolve_curves(pullfrom, attributes)
+    return tween_curves(curves, bias, time, reset_time, poses, rotation, space,
+                        layer, tangents, neighbours, frames)
+
+
+def tween_time(time=None):
+    """
+    Return the frame to key: the given time, or the start of the time slider
+    range (the current time in batch mode)
+    """
+    if time is not None:
+        return time
+    if is_headless():
+        return mc.currentTime(q=True)
+    return mc.timeControl("timeControl1", q=True, ra=True)[0]
+
+
+def channel_attributes(attributes=None):
+    """
+    Return the given attributes, or those selected in the channel box
+    outside batch mode
+    """
+    if attributes is None and not is_headless():
+        attributes = mc.channelBox("mainChannelBox", q=True, sma=True)
+    return attributes or ()
+
+
+def resolve_curves(nodes, attributes=None):
+    """
+    Return the anim curves on the given nodes, limited to the given
+    attributes (or those selected in the channel box, outside batch mode)
+    """
+    # If attributes are selected, use them to build curve node list
+    attributes = channel_attributes(attributes)
+    if attributes:
+        curves = []
+        for attr in attributes:
+            for node in nodes:
+                fullnode = "%s.%s" % (node, attr)
+                if not mc.objExists(fullnode):
+                    continue
+                tmp = mc.keyframe(fullnode, q=True, name=True)
+                if not tmp:
+                    continue
+                curves += tmp
+        return curves
+    # Otherwise get curves for all nodes
+    return mc.keyframe(nodes, q=True, name=True) or []
+
+
+def tween_curves(curves, bias, time=None, reset_time=True, poses=None,
+                 rotation=None, space=None, layer=None, tangents=None,
+                 neighbours=None, frames=None):
+    """
+    Key the given curves at the given time (see tween_time), blending each
+    by bias.  Either may be a single value or a sequence with one value per
+    curve; per-curve times are keyed in local space.  The bias is used as
+    is, with no easing.  See tween for the other arguments.  Returns the
+    number of keys written
+    """
+    headless = is_headless()
+    if time is None or isinstance(time, (int, float)):
+        currenttime = times = tween_time(time)
+    else:
+        currenttime = tween_time()
+        times = time
+        space = "local"
+    layer = layer or SETTINGS["layer_mode"]
+    layers = None
+    if layer != "all" and TMLayerCache.instance().layers():
+        layers = TMLayerCache.instance()
+        keyed = layers.layer_curves(curves, layers.active_layer())
+        bias = curve_subset(bias, curves, keyed)
+        times = curve_subset(times, curves, keyed)
+        curves = keyed
+    rotation = rotation or SETTINGS["rotation_mode"]
+    if (neighbours or SETTINGS["neighbour_mode"]) != "poses":
+        frames = None
+    elif frames is None:
+        frames = TMDataService.instance().get().pose_frames
+    written = 0
+    if not headless:
+        mc.waitCursor(state=True)
+    # Wrap the main operation in a try/except to prevent the waitcursor from
+    # sticking if something should fail
+    try:
+        # Keys blended from their neighbours, which can follow the curve
+        # shape, and the neighbour data they were blended from
+        local = []
+        data = None
+        if (poses is None and len(curves) > CHUNK_SIZE and rotation == "euler"
+                and (space or SETTINGS["tween_space"]) == "local"
+                and (layers is None or layer != "composite")
+                and (tangents or SETTINGS["tangent_mode"]) == "types"):
+            # Crowd-scale tweens are keyed chunk by chunk (see tween_chunks)
+            with write_phase():
+                written = tween_chunks(curves, bias, times, frames=frames)
+            return written
+        if poses is not None:
+            keys = pose_keys(curves, poses[0], poses[1], bias)
+        elif (space or SETTINGS["tween_space"]) == "world":
+            keys, remaining = world_space_keys(curves, currenttime, bias)
+            if layers is not None:
+                # World space keys are composite values
+                keys = layer_keys(keys, currenttime)
+            data = neighbour_data(remaining, currenttime, frames)
+            local = blend_neighbours(remaining, data,
+                                     curve_subset(bias, curves, remaining), rotation)
+            keys += local
+        elif layers is not None and layer == "composite":
+            data = neighbour_data(curves, times, frames)
+            keys = local = composite_keys(curves, bias, times, rotation, data)
+        else:
+            data = neighbour_data(curves, times, frames)
+            keys = local = blend_neighbours(curves, data, bias, rotation)
+        if not isinstance(times, (int, float)):
+            times = dict(zip(curves, times))
+        shapes = ()
+        if local and (tangents or SETTINGS["tangent_mode"]) == "shape":
+            shapes = shape_tangents(local, times, data)
+        # Set new keyframes and tangents
+        with write_phase():
+            write_keys(keys, times, shapes)
+        written = len(keys)
+    except:
+        raise
+    finally:
+        if not headless:
+            mc.waitCursor(state=False)
+            # Resetting the time is the single re-evaluation after the write
+            # phase, so skip it if nothing was keyed, and limit it to the
+            # keyed attributes if the time doesn't change
+            if written and reset_time:
+                if mc.currentTime(q=True) == currenttime:
+                    if layers is not None:
+                        plugs = layer_plugs(curves)[0]
+                    else:
+                        plugs = curve_plugs(curves)
+                    plugs = [plug for plug in plugs if plug]
+                    if plugs:
+                        mc.dgeval(plugs)
+                else:
+                    mc.currentTime(currenttime, update=True)
+            mel.eval("global string $gMainWindow;")
+            windowname = mel.eval("$temp = $gMainWindow")
+            mc.setFocus(windowname)
+    return written
+
+
+def tween_staggered(bias, nodes, offset=1.0, falloff=0.0, reset_time=True,
+                    easing=None, time=None, attributes=None, layer=None):
+    """
+    Tween a chain of nodes with each node keyed at its own frame and bias,
+    for overlapping action on tails, chains and crowds.  Every key's time and
+    value is computed in one pass and written in one batch.
+
+    offset is the number of frames between consecutive nodes, or a sequence
+    with one offset per node, added to the frame being keyed.  falloff
+    scales each node's (eased) bias down along the chain, from the full bias
+    on the first node to (1 - falloff) times the bias on the last, so that
+    later nodes lag behind.
+
+    Returns the number of keys written.
+    """
+    nodes = list(nodes)
+    if not nodes:
+        return 0
+    bias = get_easing(easing)(bias)
+    start = tween_time(time)
+    last = float(max(len(nodes) - 1, 1))
+    curves = []
+    biases = array("d")
+    times = array("d")
+    for index, node in enumerate(nodes):
+        node_curves = resolve_curves([node], attributes)
+        curves += node_curves
+        if isinstance(offset, (int, float)):
+            node_offset = offset * index
+        else:
+            node_offset = offset[index]
+        biases.extend([bias * (1.0 - falloff * index / last)] * len(node_curves))
+        times.extend([start + node_offset] * len(node_curves))
+    if not curves:
+        return 0
+    return tween_curves(curves, biases, times, reset_time, layer=layer)
+
+
+def tween_sets(sets, reset_time=True, rotation=None, space=None, time=None,
+               attributes=None, layer=None):
+    """
+    Tween several TMSets at once, each with its own bias, in one pass: the
+    curves of all sets are gathered, then queried, blended with a per-curve
+    bias array and written together as a single undo step.
+
+    sets is a list of (TMSet, bias) pairs, with each bias passed through the
+    set's easing profile.  A curve shared by several sets takes the bias of
+    the set with the fewest nodes, as the most specific set, and sets of
+    equal size are ranked by their order in the list.
+
+    Returns the number of keys written.
+    """
+    ranked = sorted(enumerate(sets), key=lambda item: (len(item[1][0].nodes or ()),
+                                                      item[0]))
+    attributes = channel_attributes(attributes)
+    biases = {}
+    curves = []
+    for _, (set_, bias) in ranked:
+        if not set_.nodes:
+            continue
+        bias = get_easing(set_.easing)(bias)
+        for curve in set_.curves(attributes):
+            if curve not in biases:
+                biases[curve] = bias
+                curves.append(curve)
+    if not curves:
+        return 0
+    return tween_curves(curves, array("d", [biases[curve] for curve in curves]),
+                        time, reset_time, rotation=rotation, space=space,
+                        layer=layer)
+
+
+def breakdown_intervals(target, bias=0.5, placement="midpoint", snap=True,
+                        attributes=None, easing=None, neighbours="adjacent",
+                        frames=None):
+    """
+    Add a breakdown key to every interval between keys on every curve of a
+    TMSet or TMGroup, for blocking passes that want the same favor in every
+    interval of a shot.
+
+    bias is a single value, or a function called with the times of the keys
+    either side of an interval that returns the bias for that interval; it
+    is passed through the named easing profile (or the global one).
+    placement is "midpoint" or the fraction of each interval at which to
+    key.  With snap on, the new key times are rounded to whole frames, and
+    intervals with no frame left between their keys are skipped.
+    neighbours is "adjacent" to use every pair of consecutive keys, or
+    "poses" to use only the pose keys (see role_flags), with frames as the
+    pose frames (the scene's by default).
+
+    Every new key time and value is computed from each curve's key arrays
+    in one pass, and all keys are written as a single undo step.  Returns
+    the number of keys written.
+    """
+    fraction = 0.5 if placement == "midpoint" else float(placement)
+    easing = get_easing(easing)
+    if isinstance(target, TMSet) and target.nodes:
+        curves = target.curves(channel_attributes(attributes))
+    else:
+        # The selected set (or an empty one) works on the selection
+        curves = resolve_curves(target.nodes or mc.ls(sl=True), attributes)
+    if neighbours == "poses" and frames is None:
+        frames = TMDataService.instance().get().pose_frames
+    # Bring the cached curves up to date before reading their keys
+    cache = TMCurveCache.instance()
+    if cache.active:
+        cache.sync()
+    # New keys by time, so curves keyed at the same frame are written together
+    keys = {}
+    for curve in curves:
+        times, values, in_tans, out_tans = curve_keys(curve)
+        indices = range(len(times))
+        if neighbours == "poses":
+            indices = array("i", compress(indices, role_flags(curve, times, frames)))
+        for prev, next_ in zip(indices[:-1], indices[1:]):
+            time_prev, time_next = times[prev], times[next_]
+            time = time_prev + (time_next - time_prev) * fraction
+            if snap:
+                time = float(round(time))
+                if time <= time_prev or time >= time_next:
+                    continue
+            if callable(bias):
+                interval_bias = easing(bias(time_prev, time_next))
+            else:
+                interval_bias = easing(bias)
+            value = values[prev] + (values[next_] - values[prev]) * interval_bias
+            keys.setdefault(time, []).append(
+                (curve, value) + key_tangents(in_tans[prev], out_tans[prev],
+                                              in_tans[next_], out_tans[next_]))
+    if keys:
+        with write_phase("tweenMachineBreakdowns"):
+            for time, time_keys in sorted(keys.items()):
+                write_keys(time_keys, time)
+    return sum([len(time_keys) for time_keys in keys.values()])
+
+
+class TweenSession(object):
+    """
+    Tweening for pipeline scripts that key many frames in a row.  Nodes,
+    attributes and times are always given explicitly and no UI is queried
+    or touched: no time slider, channel box, wait cursor, time change or
+    focus change.  Resolved curves and each curve's keys are read once and
+    kept for the life of the session, new keys are added to those snapshots
+    (so later tweens see earlier ones) and the writes are held until flush,
+    or the end of a with block, where they are made as one undo step::
+
+        with TweenSession() as session:
+            session.tween(0.33, ["arm_ctrl"], 12)
+            session.tween(0.5, ["arm_ctrl", "hand_ctrl"], 18, ["rotateX"])
+
+    Sessions blend in local space between the adjacent keys, copying their
+    tangent types, and assume nothing else edits the curves meanwhile.  If
+    the block raises, or a flush fails, the pending keys are discarded (see
+    discard).  Every operation returns a timing record, also kept in timings
+    """
+
+    def __init__(self, rotation="euler", easing="linear"):
+        self.rotation = rotation
+        self.easing = easing
+        self.timings = []
+        self._curves = {}
+        self._keys = {}
+        self._pending = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+
+    def _record(self, operation, start, **values):
+        """
+        Add a timing record for an operation and return it
+        """
+        values.update(operation=operation, seconds=timer.time() - start)
+        self.timings.append(values)
+        return values
+
+    def curves(self, nodes, attributes=()):
+        """
+        Return the anim curves of the given nodes, limited to the given
+        attributes (all curves if there are none)
+        """
+        lookup = (tuple(nodes), tuple(attributes))
+        if lookup not in self._curves:
+            self._curves[lookup] = resolve_curves(nodes, attributes or ())
+        return self._curves[lookup]
+
+    def keys(self, curve):
+        """
+        Return the session's snapshot of a curve's keys, as lists of times,
+        values, in tangent types and out tangent types
+        """
+        if curve not in self._keys:
+            self._keys[curve] = (
+                mc.keyframe(curve, q=True, timeChange=True) or [],
+                mc.keyframe(curve, q=True, valueChange=True) or [],
+                mc.keyTangent(curve, q=True, itt=True) or [],
+                mc.keyTangent(curve, q=True, ott=True) or [])
+        return self._keys[curve]
+
+    def tween(self, bias, nodes, time, attributes=(), easing=None):
+        """
+        Tween the given nodes at a frame, with bias passed through the
+        session's easing profile (or the given one).  Curves without a key
+        on either side of the frame are skipped.  Returns a timing record
+        with the number of keys added
+        """
+        start = timer.time()
+        bias = get_easing(easing or self.easing)(bias)
+        curves = []
+        found = ([], [], [], [], [])
+        for curve in self.curves(nodes, attributes):
+            times, values, in_tans, out_tans = self.keys(curve)
+            prev = bisect_left(times, time) - 1
+            next_ = bisect_right(times, time)
+            if prev < 0 or next_ >= len(times):
+                continue
+            curves.append(curve)
+            found[0].append(times[prev])
+            found[1].append(times[next_])
+            found[2].append(values[prev])
+            found[3].append(values[next_])
+            found[4].append((curve,) + key_tangents(in_tans[prev], out_tans[prev],
+                                                    in_tans[next_], out_tans[next_]))
+        keys = blend_neighbours(curves, found, bias, self.rotation)
+        for key in keys:
+            self._add_key(key, time)
+        return self._record("tween", start, curves=len(curves), keys=len(keys))
+
+    def _add_key(self, key, time):
+        """
+        Add a new key to its curve's snapshot and to the pending writes
+        """
+        curve, value, in_tan, out_tan = key
+        times, values, in_tans, out_tans = self.keys(curve)
+        index = bisect_left(times, time)
+        if index < len(times) and times[index] == time:
+            values[index] = value
+            in_tans[index] = in_tan
+            out_tans[index] = out_tan
+        else:
+            times.insert(index, time)
+            values.insert(index, value)
+            in_tans.insert(index, in_tan)
+            out_tans.insert(index, out_tan)
+        self._pending.setdefault(time, {})[curve] = key
+
+    def flush(self):
+        """
+        Write every pending key in one write phase.  Returns a timing record
+        with the number of keys written
+        """
+        start = timer.time()
+        count = 0
+        if self._pending:
+            try:
+                with write_phase("tweenMachineSession"):
+                    for time, keys in sorted(self._pending.items()):
+                        write_keys(list(keys.values()), time)
+                        count += len(keys)
+            except Exception:
+                self.discard()
+                raise
+        self._pending = {}
+        return self._record("flush", start, keys=count)
+
+    def discard(self):
+        """
+        Drop the pending keys without writing them.  The snapshots of the
+        curves they were added to no longer match the scene, so they are
+        dropped too and read again on next use
+        """
+        for keys in self._pending.values():
+            for curve in keys:
+                self._keys.pop(curve, None)
+        self._pending = {}
+
+
+def _timed(function):
+    """
+    Decorate a callback method to count its calls, and the time spent in it,
+    in its instance's stats
+    """
+    def wrapper(self, *args):
+        start = timer.time()
+        try:
+            function(self, *args)
+        finally:
+            self.stats["callbacks"] += 1
+            self.stats["seconds"] += timer.time() - start
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+class TMCurveJournal(object):
+    """
+    Record of the anim curves edited since the curve cache last read it,
+    kept by MAnimMessage/MDGMessage callbacks registered with the plugin.
+    Edits that only change existing keys (values or tangents) are recorded as
+    the key indices touched; anything that adds, removes or moves keys marks
+    the whole curve.  Undo, redo and scene changes mark everything.  The
+    time spent in its own callbacks is counted in stats
+    """
+
+    _instance = None
+    # Keyframe delta types that leave the curve's keys in place
+    in_place_deltas = ("kKeyframeDeltaTangent", "kKeyframeDeltaBreakdown")
+
+    def __init__(self):
+        self._curves = {}
+        self._reset = False
+        self._callbacks = []
+        # Counts changes to which curves drive which nodes (see TMCurvePlan)
+        self.generation = 0
+        self._rewired = {}
+        self._rewired_all = 0
+        self.stats = {"callbacks": 0, "entries": 0, "seconds": 0.0}
+
+    @classmethod
+    def instance(cls):
+        """
+        Return the shared instance of the journal
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @property
+    def active(self):
+        """
+        Whether the callbacks are registered, and so the journal can be
+        trusted
+        """
+        return bool(self._callbacks)
+
+    def mark(self, curve, indices=None):
+        """
+        Record an edit to the given curve's keys at the given indices, or to
+        the whole curve if indices is None
+        """
+        self.stats["entries"] += 1
+        if indices is None or self._curves.get(curve, ()) is None:
+            self._curves[curve] = None
+        else:
+            self._curves.setdefault(curve, set()).update(indices)
+
+    def reset(self, *args):
+        """
+        Record that every curve may have changed
+        """
+        self._reset = True
+        self._curves = {}
+        self.generation += 1
+        self._rewired = {}
+        self._rewired_all = self.generation
+
+    def rewired_since(self, generation):
+        """
+        Return the UUIDs of the nodes whose anim curve connections have
+        changed since the given generation, or None if any node may have
+        changed
+        """
+        if generation < self._rewired_all:
+            return None
+        return set(node for node, changed in self._rewired.items()
+                   if changed > generation)
+
+    def drain(self):
+        """
+        Return and clear the journal, as a (reset, curves) tuple where curves
+        maps each edited curve to the set of key indices touched, or None
+        """
+        if hasattr(OpenMayaAnim.MAnimMessage, "flushAnimKeyframeEditedCallbacks"):
+            OpenMayaAnim.MAnimMessage.flushAnimKeyframeEditedCallbacks()
+        entries = (self._reset, self._curves)
+        self._reset = False
+        self._curves = {}
+        return entries
+
+    @_timed
+    def _keyframes_edited(self, deltas, *args):
+        """
+        Record the keys changed by each MFnKeyframeDelta
+        """
+        in_place = [getattr(OpenMaya.MFn, name) for name in self.in_place_deltas
+                    if hasattr(OpenMaya.MFn, name)]
+        for delta in deltas:
+            try:
+                fn_delta = OpenMayaAnim.MFnKeyframeDelta(delta)
+                curve = OpenMaya.MFnDependencyNode(fn_delta.paramCurve).name()
+                if any(delta.hasFn(type_) for type_ in in_place):
+                    self.mark(curve, (fn_delta.keyIndex,))
+                else:
+                    self.mark(curve)
+            except (AttributeError, RuntimeError, TypeError):
+                # Without details of the edit, nothing can be trusted
+                self.reset()
+                return
+
+    @_timed
+    def _curves_edited(self, curves, *args):
+        """
+        Record whole curves reported as edited
+        """
+        for curve in curves:
+            self.mark(OpenMaya.MFnDependencyNode(curve).name())
+
+    @_timed
+    def _connection_changed(self, source, destination, *args):
+        """
+        Record the node on the other end of an anim curve being connected or
+        disconnected, by UUID so that it matches however the node is named.
+        Curves driving anything but a DAG node (through animation layers or
+        character sets) could affect any node
+        """
+        if not source.node().hasFn(OpenMaya.MFn.kAnimCurve):
+            return
+        self.generation += 1
+        node = destination.node()
+        if node.hasFn(OpenMaya.MFn.kDagNode):
+            self._rewired[OpenMaya.MFnDependencyNode(node).uuid().asString()] = self.generation
+        else:
+            self._rewired = {}
+            self._rewired_all = self.generation
+
+    @_timed
+    def _node_changed(self, node, *args):
+        """
+        Record anim curves being added or removed
+        """
+        self.mark(OpenMaya.MFnDependencyNode(node).name())
+
+    def add_callbacks(self):
+        """
+        Register the callbacks that keep the journal
+        """
+        if self._callbacks:
+            return
+        anim_message = OpenMayaAnim.MAnimMessage
+        if hasattr(OpenMayaAnim, "MFnKeyframeDelta"):
+            self._callbacks.append(anim_message.addAnimKeyframeEditedCallback(
+                self._keyframes_edited))
+        else:
+            self._callbacks.append(anim_message.addAnimCurveEditedCallback(
+                self._curves_edited))
+        self._callbacks.append(OpenMaya.MDGMessage.addNodeAddedCallback(
+            self._node_changed, "animCurve"))
+        self._callbacks.append(OpenMaya.MDGMessage.addNodeRemovedCallback(
+            self._node_changed, "animCurve"))
+        self._callbacks.append(OpenMaya.MDGMessage.addConnectionCallback(
+            self._connection_changed))
+        for event in ("Undo", "Redo"):
+            self._callbacks.append(OpenMaya.MEventMessage.addEventCallback(
+                event, self.reset))
+        for message in TMDataService.scene_messages:
+            if hasattr(OpenMaya.MSceneMessage, message):
+                self._callbacks.append(OpenMaya.MSceneMessage.addCallback(
+                    getattr(OpenMaya.MSceneMessage, message), self.reset))
+        self.reset()
+
+    def remove_callbacks(self):
+        """
+        Remove the callbacks
+        """
+        for callback in self._callbacks:
+            OpenMaya.MMessage.removeCallback(callback)
+        self._callbacks = []
+        self.reset()
+
+
+class TMCurveCache(object):
+    """
+    Key times, values and tangent types of the curves tweened so far, used to
+    find neighbour keys without querying the scene.  Before each use the
+    cache is brought up to date from the TMCurveJournal: curves whose keys
+    were only edited in place have just those keys read again, curves that
+    changed in any other way are dropped and read again when next needed,
+    and everything else is left alone.  The keys' pose roles (see
+    role_flags) are cached alongside and dropped on any edit to their curve.
+    The cache is only used while the journal is active
+    """
+
+    _instance = None
+
+    def __init__(self):
+        # Curve name -> (times, values, in tangents, out tangents)
+        self._curves = {}
+        # Curve name -> (breakdown times, special ticks)
+        self._roles = {}
+        self.stats = {"hits": 0, "reads": 0, "patches": 0, "drops": 0,
+                      "seconds": 0.0}
+
+    @classmethod
+    def instance(cls):
+        """
+        Return the shared instance of the cache
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @property
+    def active(self):
+        return TMCurveJournal.instance().active
+
+    def sync(self):
+        """
+        Apply the journal's edits to the cached curves
+        """
+        start = timer.time()
+        reset, curves = TMCurveJournal.instance().drain()
+        if reset:
+            self.stats["drops"] += len(self._curves)
+            self._curves = {}
+            self._roles = {}
+        for curve, indices in curves.items():
+            self._roles.pop(curve, None)
+            if curve not in self._curves:
+                continue
+            if indices is None or not self._patch(curve, indices):
+                del self._curves[curve]
+                self.stats["drops"] += 1
+        self.stats["seconds"] += timer.time() - start
+
+    def _read(self, curve):
+        """
+        Read every key of a curve
+        """
+        start = timer.time()
+        entry = (array("d", mc.keyframe(curve, q=True, timeChange=True) or []),
+                 array("d", mc.keyframe(curve, q=True, valueChange=True) or []),
+                 mc.keyTangent(curve, q=True, itt=True) or [],
+                 mc.keyTangent(curve, q=True, ott=True) or [])
+        self._curves[curve] = entry
+        self.stats["reads"] += 1
+        self.stats["seconds"] += timer.time() - start
+        return entry
+
+    def _patch(self, curve, indices):
+        """
+        Read the keys between the lowest and highest of the given indices
+        again.  Returns False if the curve no longer matches the cache
+        """
+        times, values, in_tans, out_tans = self._curves[curve]
+        first, last = min(indices), max(indices)
+        if last >= len(times):
+            return False
+        span = {"index": (first, last), "q": True}
+        new_times = mc.keyframe(curve, timeChange=True, **span) or []
+        if list(new_times) != list(times[first:last + 1]):
+            return False
+        values[first:last + 1] = array("d", mc.keyframe(curve, valueChange=True, **span))
+        in_tans[first:last + 1] = mc.keyTangent(curve, itt=True, **span)
+        out_tans[first:last + 1] = mc.keyTangent(curve, ott=True, **span)
+        self.stats["patches"] += 1
+        return True
+
+    def keys(self, curve):
+        """
+        Return the (times, values, in_tangents, out_tangents) of every key
+        of a curve
+        """
+        entry = self._curves.get(curve)
+        if entry is None:
+            return self._read(curve)
+        self.stats["hits"] += 1
+        return entry
+
+    def roles(self, curve):
+        """
+        Return the (breakdown times, special ticks) of a curve's keys (see
+        query_roles)
+        """
+        entry = self._roles.get(curve)
+        if entry is None:
+            entry = self._roles[curve] = query_roles(curve)
+        return entry
+
+    def neighbours(self, curve, time):
+        """
+        Return the neighbour key data for a curve at the given time, in the
+        form returned by query_neighbours, or None if the curve lacks a key
+        on either side
+        """
+        times, values, in_tans, out_tans = self.keys(curve)
+        prev = bisect_left(times, time) - 1
+        next_ = bisect_right(times, time)
+        if prev < 0 or next_ >= len(times):
+            return None
+        return (times[prev], times[next_], in_tans[prev], out_tans[prev],
+                in_tans[next_], out_tans[next_], values[prev], values[next_])
+
+
+def curve_cache_stats():
+    """
+    Return the curve journal's and curve cache's counters, including the
+    time spent keeping and applying the journal
+    """
+    stats = dict(("journal_" + key, value) for key, value in
+                 TMCurveJournal.instance().stats.items())
+    stats.update(("cache_" + key, value) for key, value in
+                 TMCurveCache.instance().stats.items())
+    return stats
+
+
+def query_neighbours(curve, search):
+    """
+    Query the previous and next keys around a time on a curve, returning
+    (time_prev, time_next, in_tan_prev, out_tan_prev, in_tan_next,
+    out_tan_next, value_prev, value_next)
+    """
+    # Find time for next and previous keys...
+    time_prev = mc.findKeyframe(curve, which="previous", **search)
+    time_next = mc.findKeyframe(curve, which="next", **search)
+    # Find previous and next tangent types
+    try:
+        in_tan_prev = mc.keyTangent(curve, time=(time_prev,), q=True,
+                                    itt=True)[0]
+        out_tan_prev = mc.keyTangent(curve, time=(time_prev,), q=True,
+                                     ott=True)[0]
+        in_tan_next = mc.keyTangent(curve, time=(time_next,), q=True,
+                                    itt=True)[0]
+        out_tan_next = mc.keyTangent(curve, time=(time_next,), q=True,
+                                     ott=True)[0]
+    # Workaround for keyTangent error in Maya 2016 Extension 2
+    except RuntimeError:
+        in_tan_prev = mel.eval("keyTangent -time %s -q -itt %s" % (time_prev, curve))[0]
+        out_tan_prev = mel.eval("keyTangent -time %s -q -ott %s" % (time_prev, curve))[0]
+        in_tan_next = mel.eval("keyTangent -time %s -q -itt %s" % (time_next, curve))[0]
+        out_tan_next = mel.eval("keyTangent -time %s -q -ott %s" % (time_next, curve))[0]
+    # Find previous and next key values
+    value_prev = mc.keyframe(curve, time=(time_prev,), q=True,
+                             valueChange=True)[0]
+    value_next = mc.keyframe(curve, time=(time_next,), q=True,
+                             valueChange=True)[0]
+    return (time_prev, time_next, in_tan_prev, out_tan_prev, in_tan_next,
+            out_tan_next, value_prev, value_next)
+
+
+def curve_keys(curve):
+    """
+    Return the (times, values, in_tangents, out_tangents) of every key of a
+    curve, from the TMCurveCache when the curve journal is active.  Callers
+    sync the cache first (see TMCurveCache.sync), once for all their curves
+    """
+    cache = TMCurveCache.instance()
+    if cache.active:
+        return cache.keys(curve)
+    return (array("d", mc.keyframe(curve, q=True, timeChange=True) or []),
+            array("d", mc.keyframe(curve, q=True, valueChange=True) or []),
+            mc.keyTangent(curve, q=True, itt=True) or [],
+            mc.keyTangent(curve, q=True, ott=True) or [])
+
+
+def query_roles(curve):
+    """
+    Query the times of a curve's breakdown keys and the special tick flag of
+    each of its keys
+    """
+    breakdowns = frozenset(mc.keyframe(curve, q=True, breakdown=True) or [])
+    try:
+        special = mc.keyframe(curve, q=True, tickDrawSpecial=True) or []
+    except (TypeError, RuntimeError):
+        # Older versions can't query the special tick
+        special = []
+    return breakdowns, [bool(tick) for tick in special]
+
+
+def role_flags(curve, times, frames=()):
+    """
+    Return an array with a flag per key of a curve, set on keys that mark a
+    pose: breakdown keys, keys drawn with the special tick (as tween writes
+    them) and keys on any of the given pose frames.  The breakdown and tick
+    flags come from the TMCurveCache when the curve journal is active
+    """
+    cache = TMCurveCache.instance()
+    breakdowns, special = cache.roles(curve) if cache.active else query_roles(curve)
+    marked = set(breakdowns)
+    marked.update(frames)
+    special = special + [False] * (len(times) - len(special))
+    return array("b", [time in marked or tick
+                       for time, tick in zip(times, special)])
+
+
+def role_neighbours(curve, time, frames=()):
+    """
+    Find the pose keys (see role_flags) before and after the given time on
+    a curve, in the form returned by query_neighbours, or None if there
+    isn't one on either side.  The flagged keys are picked out of the key
+    arrays in one pass and the neighbours found by bisection, so dense
+    curves with a key on every frame stay fast
+    """
+    times, values, in_tans, out_tans = curve_keys(curve)
+    flags = role_flags(curve, times, frames)
+    indices = array("i", compress(range(len(times)), flags))
+    role_times = array("d", compress(times, flags))
+    position = bisect_left(role_times, time) - 1
+    next_position = bisect_right(role_times, time)
+    if position < 0 or next_position >= len(role_times):
+        return None
+    prev, next_ = indices[position], indices[next_position]
+    return (times[prev], times[next_], in_tans[prev], out_tans[prev],
+            in_tans[next_], out_tans[next_], values[prev], values[next_])
+
+
+def key_tangents(in_tan_prev, out_tan_prev, in_tan_next, out_tan_next):
+    """
+    Return the in and out tangent types for a new key from the tangent types
+    of its neighbours
+    """
+    # Set new in and out tangent types
+    in_tan_new = out_tan_prev
+    out_tan_new = in_tan_next
+    # However, if any of the types (previous or next) is "fixed",
+    # use the global (default) tangent instead
+    if "fixed" in [in_tan_prev, out_tan_prev, in_tan_next, out_tan_next]:
+        in_tan_new, out_tan_new = default_tangents()
+    elif out_tan_next == "step":
+        out_tan_new = out_tan_next
+    return in_tan_new, out_tan_new
+
+
+def neighbour_data(curves, time=None, frames=None):
+    """
+    Query the previous and next keys around the given time (or the current
+    time) on each curve, returning arrays of their times and values and the
+    (curve, in_tangent, out_tangent) types for each new key.  time is a
+    single value or a sequence with one value per curve.  Neighbour keys
+    come from the TMCurveCache when the curve journal is active, and are
+    queried from each curve otherwise.
+
+    If frames is not None, the neighbours are the nearest pose keys instead
+    (see role_neighbours), with frames as the user's pose frames.  Curves
+    without a pose key on either side fall back to their adjacent keys
+    """
+    times_prev = array("d")
+    times_next = array("d")
+    values_prev = array("d")
+    values_next = array("d")
+    tangents = []
+    cache = TMCurveCache.instance()
+    if cache.active:
+        cache.sync()
+        current = mc.currentTime(q=True) if time is None else None
+    # Process all curves
+    if time is None and frames is not None:
+        current = mc.currentTime(q=True)
+    for index, curve in enumerate(curves):
+        found = None
+        if frames is not None:
+            found = role_neighbours(curve, current if time is None
+                                    else value_at(time, index), frames)
+        if found is None and cache.active:
+            found = cache.neighbours(curve, current if time is None
+                                     else value_at(time, index))
+        if found is None:
+            search = {} if time is None else {"time": (value_at(time, index),)}
+            found = query_neighbours(curve, search)
+        (time_prev, time_next, in_tan_prev, out_tan_prev, in_tan_next,
+         out_tan_next, value_prev, value_next) = found
+        in_tan_new, out_tan_new = key_tangents(in_tan_prev, out_tan_prev,
+                                               in_tan_next, out_tan_next)
+        times_prev.append(time_prev)
+        times_next.append(time_next)
+        values_prev.append(value_prev)
+        values_next.append(value_next)
+        tangents.append((curve, in_tan_new, out_tan_new))
+    return times_prev, times_next, values_prev, values_next, tangents
+
+
+def blend_neighbours(curves, data, bias, rotation="euler"):
+    """
+    Blend the neighbour keys returned by neighbour_data in one pass and
+    return the new keys
+    """
+    times_prev, times_next, values_prev, values_next, tangents = data
+    values = blend(values_prev, values_next, bias)
+    if rotation == "quaternion":
+        slerp_rotations(curves, times_prev, times_next, values_prev,
+                        values_next, bias, values)
+    return [(curve, value_new, in_tan_new, out_tan_new)
+            for (curve, in_tan_new, out_tan_new), value_new in zip(
+                tangents, values)]
+
+
+def neighbour_keys(curves, bias, rotation="euler", time=None, frames=None):
+    """
+    Build the keys for the given curves by blending between the previous and
+    next keys on each curve around the given time (or the current time).
+    bias and time are single values or sequences with one value per curve.
+    frames switches to pose key neighbours (see neighbour_data)
+    """
+    return blend_neighbours(curves, neighbour_data(curves, time, frames), bias,
+                            rotation)
+
+
+def run_chunks(chunks, snapshot, kernel, write, workers=None):
+    """
+    Run each chunk through snapshot, kernel and write.  snapshot and write
+    run on the calling thread, as anything touching Maya must.  With more
+    than one worker the kernels run on a pool of worker threads, which only
+    pays off if the kernel releases the GIL (see blend), so workers defaults
+    to every core when NumPy is available and to one, running everything on
+    the calling thread, when it isn't.  At most one chunk per worker is in
+    flight, so peak memory is bounded by the chunk size rather than the
+    total.  Returns the sum of what write returns
+    """
+    if workers is None:
+        workers = cpu_count() if numpy is not None else 1
+    total = 0
+    if workers <= 1:
+        for chunk in chunks:
+            total += write(kernel(snapshot(chunk)))
+        return total
+    pool = ThreadPool(workers)
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(pool.apply_async(kernel, (snapshot(chunk),)))
+            if len(pending) > workers:
+                total += write(pending.popleft().get())
+        while pending:
+            total += write(pending.popleft().get())
+    finally:
+        pool.close()
+        pool.join()
+    return total
+
+
+def chunk_ranges(count, size=None):
+    """
+    Yield (start, stop) index ranges covering count items in chunks of the
+    given size (CHUNK_SIZE by default)
+    """
+    size = size or CHUNK_SIZE
+    for start in range(0, count, size):
+        yield start, min(start + size, count)
+
+
+def tween_chunks(curves, bias, time, chunk_size=None, frames=None, workers=None):
+    """
+    Key a large number of curves chunk by chunk (see run_chunks): each chunk
+    of curves has its neighbour keys read into arrays, blended (by a worker
+    thread, with NumPy) and written, so a crowd-scale tween never holds
+    more than a few chunks of keys.  bias and time are single values or
+    sequences with one value per curve, and frames picks pose key
+    neighbours (see neighbour_data).  The kernel only blends the values; the
+    keys are built on the calling thread as they're written.  Must be called
+    inside a write phase.  Returns the number of keys written
+    """
+    def snapshot(span):
+        start, stop = span
+        chunk = curves[start:stop]
+        chunk_time = value_slice(time, start, stop)
+        return (chunk, neighbour_data(chunk, chunk_time, frames),
+                value_slice(bias, start, stop), chunk_time)
+
+    def kernel(item):
+        data, chunk_bias = item[1], item[2]
+        return item, blend(data[2], data[3], chunk_bias)
+
+    def write(result):
+        (chunk, data, _, chunk_time), values = result
+        if not isinstance(chunk_time, (int, float)):
+            chunk_time = dict(zip(chunk, chunk_time))
+        keys = [(curve, value, in_tan, out_tan)
+                for (curve, in_tan, out_tan), value in zip(data[4], values)]
+        write_keys(keys, chunk_time)
+        return len(keys)
+
+    return run_chunks(chunk_ranges(len(curves), chunk_size), snapshot, kernel,
+                      write, workers)
+
+
+ROTATE_ATTRS = ("rotateX", "rotateY", "rotateZ")
+
+
+def slerp_rotations(curves, times_prev, times_next, values_prev, values_next,
+                    bias, values, plugs=None):
+    """
+    Replace the blended values of rotate curves with a quaternion slerp.
+    plugs are the attributes the curves animate, if not the curves' own
+    outputs (layer curves, for example, drive blend nodes).
+
+    The rotateX/Y/Z curves of each node are grouped, the previous and next
+    poses converted to quaternions in the node's rotate order and slerped
+    along the shortest arc, and the result converted back to the Euler
+    solution closest to the linear blend to avoid flips.  Nodes missing a
+    rotate curve, or whose rotate curves don't share the same neighbour key
+    times, keep their independent per-channel blend.
+    """
+    nodes = {}
+    for index, plug in enumerate(curve_plugs(curves) if plugs is None else plugs):
+        if plug is None:
+            continue
+        node, attr = plug.rsplit(".", 1)
+        if attr in ROTATE_ATTRS:
+            nodes.setdefault(node, [None, None, None])[ROTATE_ATTRS.index(attr)] = index
+    unit = OpenMaya.MAngle.uiUnit()
+
+    def radians(value):
+        return OpenMaya.MAngle(value, unit).asRadians()
+
+    for node, indices in nodes.items():
+        if None in indices:
+            continue
+        if len(set([(times_prev[i], times_next[i]) for i in indices])) > 1:
+            continue
+        order = mc.getAttr(node + ".rotateOrder")
+        euler_prev = OpenMaya.MEulerRotation(
+            [radians(values_prev[i]) for i in indices], order)
+        euler_next = OpenMaya.MEulerRotation(
+            [radians(values_next[i]) for i in indices], order)
+        euler_blend = OpenMaya.MEulerRotation(
+            [radians(values[i]) for i in indices], order)
+        quat_prev = euler_prev.asQuaternion()
+        quat_next = euler_next.asQuaternion()
+        # Take the shortest arc
+        if (quat_prev.x * quat_next.x + quat_prev.y * quat_next.y +
+                quat_prev.z * quat_next.z + quat_prev.w * quat_next.w) < 0.0:
+            quat_next.negateIt()
+        euler = OpenMaya.MQuaternion.slerp(quat_prev, quat_next,
+                                           value_at(bias, indices[0])).asEulerRotation()
+        euler.reorderIt(order)
+        euler.setToClosestSolution(euler_blend)
+        for index, angle in zip(indices, (euler.x, euler.y, euler.z)):
+            values[index] = OpenMaya.MAngle(angle).asUnits(unit)
+
+
+TRANSFORM_ATTRS = ("translateX", "translateY", "translateZ") + ROTATE_ATTRS
+
+
+def evaluate_plugs(plugs, time=None, as_double=False):
+    """
+    Evaluate a list of MPlugs at the given time (or the current time) within
+    a single MDGContext, returning their data MObjects, or their values as
+    doubles (in internal units) if as_double is True
+    """
+    if as_double:
+        get = lambda plug, *context: plug.asDouble(*context)
+    else:
+        get = lambda plug, *context: plug.asMObject(*context)
+    if time is None:
+        return [get(plug) for plug in plugs]
+    context = OpenMaya.MDGContext(OpenMaya.MTime(time, OpenMaya.MTime.uiUnit()))
+    # Maya 2019+ deprecates passing the context to each evaluation in favour
+    # of making it current for the whole batch
+    if hasattr(context, "makeCurrent"):
+        previous = context.makeCurrent()
+        try:
+            return [get(plug) for plug in plugs]
+        finally:
+            previous.makeCurrent()
+    return [get(plug, context) for plug in plugs]
+
+
+def world_matrices(paths, times):
+    """
+    Return the world matrix of each MDagPath at the matching time.  Paths
+    that share a time are evaluated together, so the number of context
+    evaluations is the number of distinct times rather than the number of
+    nodes
+    """
+    by_time = {}
+    for index, time in enumerate(times):
+        by_time.setdefault(time, []).append(index)
+    matrices = [None] * len(paths)
+    for time, indices in by_time.items():
+        plugs = []
+        for index in indices:
+            path = paths[index]
+            plug = OpenMaya.MFnDagNode(path).findPlug("worldMatrix", False)
+            plugs.append(plug.elementByLogicalIndex(path.instanceNumber()))
+        for index, data in zip(indices, evaluate_plugs(plugs, time)):
+            matrices[index] = OpenMaya.MFnMatrixData(data).matrix()
+    return matrices
+
+
+def world_space_keys(curves, time, bias):
+    """
+    Build keys for the translate and rotate curves in the given list by
+    blending world matrices instead of channel values.
+
+    For each transform, the world matrices at the previous and next keys on
+    its translate/rotate curves are evaluated in bulk (see world_matrices),
+    translation is interpolated linearly and rotation slerped, and the result
+    is solved back into local channel values through the parent inverse
+    matrix at the keyed time, accounting for rotate axis and joint orient.
+    Of the Euler solutions, the one closest to the rotate channels at the
+    keyed time is used.
+    Rotate pivots are assumed to be at the origin.  A per-curve bias
+    sequence is applied per transform, using the bias of its first curve.
+
+    Returns the keys and the list of curves that were not handled, which
+    should be tweened in local space.
+    """
+    remaining = []
+    channels = {}
+    selection = OpenMaya.MSelectionList()
+    node_paths = {}
+    node_biases = {}
+    for index, (curve, plug) in enumerate(zip(curves, curve_plugs(curves))):
+        node, attr = plug.rsplit(".", 1) if plug else (None, None)
+        if attr not in TRANSFORM_ATTRS:
+            remaining.append(curve)
+            continue
+        node_biases.setdefault(node, value_at(bias, index))
+        if node not in node_paths:
+            try:
+                selection.add(node)
+            except RuntimeError:
+                remaining.append(curve)
+                continue
+            node_paths[node] = selection.length() - 1
+        channels.setdefault(node, {})[attr] = curve
+    nodes = []
+    paths = []
+    for node, index in node_paths.items():
+        try:
+            paths.append(selection.getDagPath(index))
+            nodes.append(node)
+        except TypeError:
+            remaining += channels.pop(node).values()
+    if not nodes:
+        return [], remaining
+    times_prev = []
+    times_next = []
+    for node in nodes:
+        node_curves = list(channels[node].values())
+        times_prev.append(mc.findKeyframe(node_curves, time=(time,), which="previous"))
+        times_next.append(mc.findKeyframe(node_curves, time=(time,), which="next"))
+    matrices_prev = world_matrices(paths, times_prev)
+    matrices_next = world_matrices(paths, times_next)
+    parent_inverses = evaluate_plugs(
+        [OpenMaya.MFnDagNode(path).findPlug("parentInverseMatrix", False)
+         .elementByLogicalIndex(path.instanceNumber()) for path in paths], time)
+    # The rotate channels at the keyed time, in radians
+    rotates = evaluate_plugs([OpenMaya.MFnDagNode(path).findPlug(attr, False)
+                              for path in paths for attr in ROTATE_ATTRS],
+                             time, as_double=True)
+    in_tan, out_tan = default_tangents()
+    linear_unit = OpenMaya.MDistance.uiUnit()
+    angle_unit = OpenMaya.MAngle.uiUnit()
+    keys = []
+    for index, (node, path, matrix_prev, matrix_next, parent_inverse) in enumerate(zip(
+            nodes, paths, matrices_prev, matrices_next, parent_inverses)):
+        xform_prev = OpenMaya.MTransformationMatrix(matrix_prev)
+        xform_next = OpenMaya.MTransformationMatrix(matrix_next)
+        translate_prev = xform_prev.translation(OpenMaya.MSpace.kWorld)
+        translate_next = xform_next.translation(OpenMaya.MSpace.kWorld)
+        scale_prev = xform_prev.scale(OpenMaya.MSpace.kWorld)
+        scale_next = xform_next.scale(OpenMaya.MSpace.kWorld)
+        quat_prev = xform_prev.rotation(asQuaternion=True)
+        quat_next = xform_next.rotation(asQuaternion=True)
+        if (quat_prev.x * quat_next.x + quat_prev.y * quat_next.y +
+                quat_prev.z * quat_next.z + quat_prev.w * quat_next.w) < 0.0:
+            quat_next.negateIt()
+        bias = node_biases[node]
+        world = OpenMaya.MTransformationMatrix()
+        world.setScale([a + (b - a) * bias for a, b in zip(scale_prev, scale_next)],
+                       OpenMaya.MSpace.kWorld)
+        world.setRotation(OpenMaya.MQuaternion.slerp(quat_prev, quat_next, bias))
+        world.setTranslation(translate_prev + (translate_next - translate_prev) * bias,
+                             OpenMaya.MSpace.kWorld)
+        local = OpenMaya.MTransformationMatrix(
+            world.asMatrix() * OpenMaya.MFnMatrixData(parent_inverse).matrix())
+        # Strip the rotate axis and joint orient to get the rotate channels
+        transform = OpenMaya.MFnTransform(path)
+        rotation = (transform.rotateOrientation(OpenMaya.MSpace.kTransform).inverse() *
+                    local.rotation(asQuaternion=True))
+        if path.hasFn(OpenMaya.MFn.kJoint):
+            orient = mc.getAttr(node + ".jointOrient")[0]
+            orient = OpenMaya.MEulerRotation(
+                [OpenMaya.MAngle(v, angle_unit).asRadians() for v in orient])
+            rotation *= orient.asQuaternion().inverse()
+        current = OpenMaya.MEulerRotation(rotates[index * 3:index * 3 + 3],
+                                          transform.rotation().order)
+        euler = rotation.asEulerRotation().reorderIt(current.order)
+        euler.setToClosestSolution(current)
+        translate = local.translation(OpenMaya.MSpace.kTransform)
+        values = dict(zip(TRANSFORM_ATTRS, [
+            OpenMaya.MDistance(v).asUnits(linear_unit) for v in translate] + [
+            OpenMaya.MAngle(v).asUnits(angle_unit) for v in euler]))
+        for attr, curve in channels[node].items():
+            keys.append((curve, values[attr], in_tan, out_tan))
+    return keys, remaining
+
+
+class TMLayerCache(object):
+    """
+    Session cache of the scene's animation layers: the layer and attribute
+    each layered anim curve belongs to (found through the layer blend nodes
+    with animLayer -findCurveForPlug), each layer's mute state and blend
+    mode, the order of the layer stack and the active layer.  It's built on
+    first use and dropped when a layer is added, removed or muted, when an
+    attribute is added to a layer (which adds blend nodes), or when the
+    scene changes.  The active layer is found again when the layer
+    selection changes
+    """
+
+    _instance = None
+    node_types = ("animLayer", "animBlendNodeBase")
+
+    def __init__(self):
+        self._root = None
+        self._layers = None
+        self._curves = None
+        self._stack = None
+        self._active = None
+        self._callbacks = []
+        self._layer_callbacks = []
+
+    @classmethod
+    def instance(cls):
+        """
+        Return the shared instance of the cache
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def _build(self):
+        """
+        Read every layer and the curve each of its attributes is keyed on
+        """
+        # Callbacks on layers from before the last invalidation can only be
+        # removed now, outside of the callback that invalidated them
+        for callback in self._layer_callbacks:
+            OpenMaya.MMessage.removeCallback(callback)
+        self._layer_callbacks = []
+        self._layers = {}
+        self._curves = {}
+        self._stack = []
+        self._root = mc.animLayer(q=True, root=True)
+        # Walk the layer hierarchy from the top of the stack down, the order
+        # the Animation Layer Editor lists layers in.  animLayer -children
+        # returns layers from the bottom of the stack up, so the last child
+        # popped is the top one
+        pending = [self._root] if self._root else []
+        while pending:
+            layer = pending.pop()
+            if layer != self._root:
+                self._stack.append(layer)
+            pending += mc.animLayer(layer, q=True, children=True) or []
+        for layer in mc.ls(type="animLayer") or []:
+            override = mc.animLayer(layer, q=True, override=True)
+            multiply = (layer != self._root and not override and
+                        mc.objExists(layer + ".scaleAccumulationMode") and
+                        mc.getAttr(layer + ".scaleAccumulationMode",
+                                   asString=True).lower() == "multiply")
+            self._layers[layer] = {"muted": mc.animLayer(layer, q=True, mute=True),
+                                   "override": override,
+                                   "multiply_scale": multiply}
+            for plug in mc.animLayer(layer, q=True, attribute=True) or []:
+                for curve in mc.animLayer(layer, q=True, findCurveForPlug=plug) or []:
+                    self._curves[curve] = (layer, plug)
+            selection = OpenMaya.MSelectionList()
+            selection.add(layer)
+            self._layer_callbacks.append(
+                OpenMaya.MNodeMessage.addAttributeChangedCallback(
+                    selection.getDependNode(0), self._layer_changed))
+        self.add_callbacks()
+
+    def _layer_changed(self, message, plug, *args):
+        """
+        Invalidate the cache when a layer is muted or unmuted, or its blend
+        mode changes, and forget the active layer when a layer is selected
+        or deselected
+        """
+        if not message & OpenMaya.MNodeMessage.kAttributeSet:
+            return
+        name = plug.partialName(useLongNames=True)
+        if name in ("mute", "override", "scaleAccumulationMode"):
+            self.invalidate()
+        elif name == "selected":
+            self._active = None
+
+    def invalidate(self, *args):
+        """
+        Drop the cached layer data
+        """
+        self._layers = None
+        self._curves = None
+        self._stack = None
+        self._active = None
+
+    def layers(self):
+        """
+        Return a dictionary of the scene's layers (including the root layer)
+        and their mute state and blend mode, which is empty if the scene has
+        no animation layers
+        """
+        if self._layers is None:
+            self._build()
+        return self._layers
+
+    def curve_layer(self, curve):
+        """
+        Return the (layer, plug) that a curve animates, or (None, None) for
+        a curve that isn't on a layer and drives its attribute directly
+        """
+        self.layers()
+        return self._curves.get(curve, (None, None))
+
+    def active_layer(self):
+        """
+        Return the layer to key: the unmuted layer selected in the Animation
+        Layer Editor that is highest in the layer stack, or the root layer
+        """
+        self.layers()
+        if self._active is None:
+            self._active = self._root
+            for layer in self._stack:
+                if (not self._layers[layer]["muted"] and
+                        mc.animLayer(layer, q=True, selected=True)):
+                    self._active = layer
+                    break
+        return self._active
+
+    def layer_curves(self, curves, layer):
+        """
+        Return the curves in the list that are keyed on the given layer.
+        Curves that aren't on any layer belong to the root layer
+        """
+        return [curve for curve in curves
+                if (self.curve_layer(curve)[0] or self._root) == layer]
+
+    def add_callbacks(self):
+        """
+        Register the callbacks that invalidate the cache when layers or blend
+        nodes are added or removed, or the scene changes
+        """
+        if self._callbacks:
+            return
+        for node_type in self.node_types:
+            self._callbacks.append(OpenMaya.MDGMessage.addNodeAddedCallback(
+                self.invalidate, node_type))
+            self._callbacks.append(OpenMaya.MDGMessage.addNodeRemovedCallback(
+                self.invalidate, node_type))
+        for message in TMDataService.scene_messages:
+            if hasattr(OpenMaya.MSceneMessage, message):
+                self._callbacks.append(OpenMaya.MSceneMessage.addCallback(
+                    getattr(OpenMaya.MSceneMessage, message), self.invalidate))
+
+    def remove_callbacks(self):
+        """
+        Remove all callbacks
+        """
+        for callback in self._callbacks + self._layer_callbacks:
+            OpenMaya.MMessage.removeCallback(callback)
+        self._callbacks = []
+        self._layer_callbacks = []
+        self.invalidate()
+
+
+def plug_values(plugs, times):
+    """
+    Return the value of each named numeric plug at the matching time, in UI
+    units.  Plugs that share a time are evaluated together
     """
-    TMWindowUI()
+    mplugs = {}
+    for plug in plugs:
+        if plug not in mplugs:
+            selection = OpenMaya.MSelectionList()
+            selection.add(plug)
+            mplugs[plug] = selection.getPlug(0)
+    by_time = {}
+    for index, time in enumerate(times):
+        by_time.setdefault(time, []).append(index)
+    values = array("d", [0.0] * len(plugs))
+    for time, indices in by_time.items():
+        evaluated = evaluate_plugs([mplugs[plugs[index]] for index in indices],
+                                   time, as_double=True)
+        for index, value in zip(indices, evaluated):
+            attribute = mplugs[plugs[index]].attribute()
+            if attribute.hasFn(OpenMaya.MFn.kUnitAttribute):
+                unit_type = OpenMaya.MFnUnitAttribute(attribute).unitType()
+                if unit_type == OpenMaya.MFnUnitAttribute.kAngle:
+                    value = OpenMaya.MAngle(value).asUnits(OpenMaya.MAngle.uiUnit())
+                elif unit_type == OpenMaya.MFnUnitAttribute.kDistance:
+                    value = OpenMaya.MDistance(value).asUnits(OpenMaya.MDistance.uiUnit())
+            values[index] = value
+    return values
+
+
+def layer_plugs(curves):
+    """
+    Return the attribute each curve animates, through any layer blend nodes,
+    and the layer it's on (None for curves that aren't on a layer)
+    """
+    cache = TMLayerCache.instance()
+    plugs = []
+    layers = []
+    for curve, plug in zip(curves, curve_plugs(curves)):
+        layer, layer_plug = cache.curve_layer(curve)
+        plugs.append(layer_plug or plug)
+        layers.append(layer)
+    return plugs, layers
 
 
-def inactive():
+def layer_keys(keys, time):
     """
-    Display a warning when a feature is not active
+    Convert keys whose values are composite (final attribute) values into
+    keys for their layer curves.  The difference between each target and the
+    attribute's current value is added to the layer's current value, divided
+    by the layer weight, or applied as a ratio for scale on a multiplicative
+    layer.  time is a single value or a sequence with one value per key.
+    Keys on layers with no weight are dropped.  The layer curves are
+    evaluated with one query per time, and each layer's weight read once
+    per time
     """
-    LOG.warn('This tweenMachine feature is not currently active.')
+    cache = TMLayerCache.instance()
+    plugs, layers = layer_plugs([key[0] for key in keys])
+    times = [value_at(time, index) for index in range(len(keys))]
+    current = plug_values(plugs, times)
+    by_time = {}
+    for key, layer, key_time in zip(keys, layers, times):
+        if layer is not None:
+            by_time.setdefault(key_time, set()).add(key[0])
+    values = {}
+    for key_time, curves in by_time.items():
+        curves = sorted(curves)
+        evaluated = mc.keyframe(curves, q=True, eval=True, time=(key_time,),
+                                valueChange=True)
+        values.update(((curve, key_time), value)
+                      for curve, value in zip(curves, evaluated))
+    weights = {}
+    converted = []
+    for key, plug, layer, composite, key_time in zip(keys, plugs, layers,
+                                                     current, times):
+        curve, target, in_tan, out_tan = key
+        if layer is None:
+            converted.append(key)
+            continue
+        value = values[(curve, key_time)]
+        if (cache.layers()[layer]["multiply_scale"] and
+                plug.rsplit(".", 1)[-1].startswith("scale")):
+            if composite:
+                value *= target / composite
+        else:
+            weight = weights.get((layer, key_time))
+            if weight is None:
+                weight = weights[(layer, key_time)] = mc.getAttr(layer + ".weight",
+                                                                 time=key_time)
+            if not weight:
+                continue
+            value += (target - composite) / weight
+        converted.append((curve, value, in_tan, out_tan))
+    return converted
+
+
+def composite_keys(curves, bias, time, rotation="euler", data=None, frames=None):
+    """
+    Build keys for layer curves that blend the composite (final) attribute
+    values at each curve's previous and next keys, rather than the layer's
+    own values, and convert them back into layer values (see layer_keys).
+    With the quaternion rotation mode the composite rotations are slerped
+    (see slerp_rotations).  data is the curves' neighbour_data, if already
+    read, and frames the pose frames it reads otherwise.  Tangent types
+    follow neighbour_data
+    """
+    if data is None:
+        data = neighbour_data(curves, time, frames)
+    keys = blend_neighbours(curves, data, bias)
+    plugs = layer_plugs(curves)[0]
+    times_prev, times_next = data[0], data[1]
+    values_prev = plug_values(plugs, times_prev)
+    values_next = plug_values(plugs, times_next)
+    targets = blend(values_prev, values_next, bias)
+    if rotation == "quaternion":
+        slerp_rotations(curves, times_prev, times_next, values_prev,
+                        values_next, bias, targets, plugs)
+    return layer_keys([(curve, target, in_tan, out_tan)
+                       for (curve, _, in_tan, out_tan), target in zip(keys, targets)],
+                      time)
+
+
+def pose_keys(curves, pose_prev, pose_next, bias):
+    """
+    Build the keys for the given curves by blending between two TMPose
+    snapshots.  Curves whose plug is missing from either pose are skipped, and
+    new keys use the global tangent types
+    """
+    lookup_prev = pose_prev.lookup()
+    lookup_next = pose_next.lookup()
+    keyed = []
+    biases = array("d")
+    values_prev = array("d")
+    values_next = array("d")
+    for index, (curve, plug) in enumerate(zip(curves, curve_plugs(curves))):
+        if plug in lookup_prev and plug in lookup_next:
+            keyed.append(curve)
+            biases.append(value_at(bias, index))
+            values_prev.append(lookup_prev[plug])
+            values_next.append(lookup_next[plug])
+    in_tan, out_tan = default_tangents()
+    return [(curve, value, in_tan, out_tan)
+            for curve, value in zip(keyed, blend(values_prev, values_next, biases))]
+
+
+def apply_pose(pose, bias=1.0, reset_time=True):
+    """
+    Blend the nodes in a stored pose from their current values toward that
+    pose.  A bias of 1.0 reapplies the pose exactly
+    """
+    current = TMPose.capture("current", pose.nodes)
+    tween(bias, list(pose.nodes), reset_time, poses=(current, pose))
+
+
+# Returns the number of selected keys on each curve, followed by their
+# indices, so that every curve's selection is read with one mel.eval
+SELECTED_KEYS_PROC = """
+global proc int[] tweenMachineSelectedKeys(string $curves[])
+{
+    int $result[];
+    for ($curve in $curves) {
+        int $indices[] = `keyframe -q -selected -indexValue $curve`;
+        $result[size($result)] = size($indices);
+        for ($index in $indices)
+            $result[size($result)] = $index;
+    }
+    return $result;
+}
+"""
 
 
-def tween(bias, nodes=None):
+class TMKeySnapshot(object):
     """
-    Create the in-between key(s) on the specified nodes
+    The keys selected in the Graph Editor and the keys either side of each,
+    read once so that the selection can be re-tweened over and over (while a
+    slider is dragged) without querying the scene again.  Keys are addressed
+    by their index on each curve, and the first and last keys of a curve,
+    which lack a neighbour, are left out.  Neighbours are always the original
+    adjacent keys, so runs of selected keys don't feed into each other
     """
-    if isinstance(nodes, list) and not nodes:
-        nodes = None
-    # Find the current frame, where the new key will be added
-    currenttime = mc.timeControl("timeControl1", q=True, ra=True)[0]
-    # Figure out which nodes to pull from
-    if nodes is not None:
-        pullfrom = nodes
-    else:
-        pullfrom = mc.ls(sl=True)
-        if not pullfrom:
-            return
-    # If attributes are selected, use them to build curve node list
-    attributes = mc.channelBox("mainChannelBox", q=True, sma=True)
-    if attributes:
-        curves = []
-        for attr in attributes:
-            for node in pullfrom:
-                fullnode = "%s.%s" % (node, attr)
-                if not mc.objExists(fullnode):
-                    continue
-                tmp = mc.keyframe(fullnode, q=True, name=True)
-                if not tmp:
-                    continue
-                curves += tmp
-    # Otherwise get curves for all nodes
-    else:
-        curves = mc.keyframe(pullfrom, q=True, name=True)
-    mc.waitCursor(state=True)
-    # Wrap the main operation in a try/except to prevent the waitcursor from
-    # sticking if something should fail
-    try:
-        # If we have no curves, force a list
-        if curves is None:
-            curves = []
-        # Process all curves
+
+    def __init__(self, curves=(), indices=(), values=(), values_prev=(),
+                 values_next=()):
+        # One entry per selected key
+        self.curves = list(curves)
+        self.indices = array("i", indices)
+        self.values = array("d", values)
+        self.values_prev = array("d", values_prev)
+        self.values_next = array("d", values_next)
+        # MFnAnimCurve and UI unit scale of each curve, for live edits
+        self._functions = {}
+
+    def __len__(self):
+        return len(self.indices)
+
+    def _curve_function(self, curve):
+        """
+        Return the MFnAnimCurve of a curve and its UI unit scale (see
+        anim_curve)
+        """
+        if curve not in self._functions:
+            self._functions[curve] = anim_curve(curve)
+        return self._functions[curve]
+
+    @classmethod
+    def capture(cls, nodes=None):
+        """
+        Read the selected keys, limited to the curves of the given nodes if
+        any are given.  The selected key indices of every curve are read with
+        one call (a flat keyframe query over several curves loses which
+        curve each index belongs to), and the key values through each
+        curve's MFnAnimCurve
+        """
+        snapshot = cls()
+        curves = mc.keyframe(q=True, selected=True, name=True) or []
+        if nodes:
+            allowed = set(resolve_curves(nodes, attributes=()))
+            curves = [curve for curve in curves if curve in allowed]
+        if not curves:
+            return snapshot
+        mel.eval(SELECTED_KEYS_PROC)
+        selected = mel.eval("tweenMachineSelectedKeys({%s})" %
+                            ", ".join('"%s"' % curve for curve in curves)) or []
+        position = 0
         for curve in curves:
-            # Find time for next and previous keys...
-            time_prev = mc.findKeyframe(curve, which="previous")
-            time_next = mc.findKeyframe(curve, which="next")
-            # Find previous and next tangent types
-            try:
-                in_tan_prev = mc.keyTangent(curve, time=(time_prev,), q=True,
-                                            itt=True)[0]
-                out_tan_prev = mc.keyTangent(curve, time=(time_prev,), q=True,
-                                             ott=True)[0]
-                in_tan_next = mc.keyTangent(curve, time=(time_next,), q=True,
-                                            itt=True)[0]
-                out_tan_next = mc.keyTangent(curve, time=(time_next,), q=True,
-                                             ott=True)[0]
-            # Workaround for keyTangent error in Maya 2016 Extension 2
-            except RuntimeError:
-                in_tan_prev = mel.eval("keyTangent -time %s -q -itt %s" % (time_prev, curve))[0]
-                out_tan_prev = mel.eval("keyTangent -time %s -q -ott %s" % (time_prev, curve))[0]
-                in_tan_next = mel.eval("keyTangent -time %s -q -itt %s" % (time_next, curve))[0]
-                out_tan_next = mel.eval("keyTangent -time %s -q -ott %s" % (time_next, curve))[0]
-            # Set new in and out tangent types
-            in_tan_new = out_tan_prev
-            out_tan_new = in_tan_next
-            # However, if any of the types (previous or next) is "fixed",
-            # use the global (default) tangent instead
-            if "fixed" in [in_tan_prev, out_tan_prev, in_tan_next, out_tan_next]:
-                in_tan_new = mc.keyTangent(q=True, g=True, itt=True)[0]
-                out_tan_new = mc.keyTangent(q=True, g=True, ott=True)[0]
-            elif out_tan_next == "step":
-                out_tan_new = out_tan_next
-            # Find previous and next key values
-            value_prev = mc.keyframe(curve, time=(time_prev,), q=True,
-                                     valueChange=True)[0]
-            value_next = mc.keyframe(curve, time=(time_next,), q=True,
-                                     valueChange=True)[0]
-            value_new = value_prev + ((value_next - value_prev) * bias)
-            # Set new keyframe and tangents
-            mc.setKeyframe(curve, t=(currenttime,), v=value_new,
-                           ott=out_tan_new)
-            if in_tan_new != "step":
-                mc.keyTangent(curve, t=(currenttime,), itt=in_tan_new)
-            # If we're using the special tick, set that appropriately
-            if SETTINGS["use_special_tick"]:
-                mc.keyframe(curve, tds=True, t=(currenttime,))
-    except:
-        raise
-    finally:
-        mc.waitCursor(state=False)
-        mc.currentTime(currenttime)
-        mel.eval("global string $gMainWindow;")
-        windowname = mel.eval("$temp = $gMainWindow")
-        mc.setFocus(windowname)
+            count = int(selected[position])
+            indices = selected[position + 1:position + 1 + count]
+            position += 1 + count
+            if not indices:
+                continue
+            function, scale = snapshot._curve_function(curve)
+            count = function.numKeys
+            for index in indices:
+                index = int(index)
+                if 0 < index < count - 1:
+                    snapshot.curves.append(curve)
+                    snapshot.indices.append(index)
+                    snapshot.values.append(function.value(index) * scale)
+                    snapshot.values_prev.append(function.value(index - 1) * scale)
+                    snapshot.values_next.append(function.value(index + 1) * scale)
+        return snapshot
+
+    def _set_values(self, values):
+        """
+        Set the value of every key in the snapshot by index.  With the
+        plugin loaded every key is set in one pass through MFnAnimCurve, as
+        a single undoable command (see edit_curves); otherwise with one
+        keyframe edit per curve and value
+        """
+        def set_values(change):
+            for curve, index, value in zip(self.curves, self.indices, values):
+                function, scale = self._curve_function(curve)
+                function.setValue(index, value / scale, change)
+
+        if edit_curves(set_values, set(self.curves)):
+            return
+        groups = {}
+        for curve, index, value in zip(self.curves, self.indices, values):
+            groups.setdefault((curve, value), []).append((index, index))
+        for (curve, value), indices in groups.items():
+            mc.keyframe(curve, e=True, index=indices, absolute=True,
+                        valueChange=value)
+
+    def _set_values_live(self, values):
+        """
+        Set the value of every key in the snapshot straight through each
+        curve's MFnAnimCurve.  The edits aren't undoable, so this is only
+        used while undo is off
+        """
+        for curve, index, value in zip(self.curves, self.indices, values):
+            function, scale = self._curve_function(curve)
+            function.setValue(index, value / scale)
+
+    def apply(self, bias, live=False):
+        """
+        Re-tween every key in the snapshot at the given bias.  Live updates
+        (while dragging) are made with undo turned off; a final update first
+        puts the original values back, also without undo, and then writes the
+        new values as a single undo step
+        """
+        values = blend(self.values_prev, self.values_next, bias)
+        if live or mc.undoInfo(q=True, state=True):
+            with undo_suspended():
+                self._set_values_live(values if live else self.values)
+        if not live:
+            with write_phase("tweenMachine Keys"):
+                self._set_values(values)
+        return len(values)
+
+    def restore(self):
+        """
+        Put back the values the keys had when the snapshot was taken
+        """
+        self._set_values(self.values)
+
+
+def tween_selected_keys(bias, nodes=None, easing=None):
+    """
+    Re-tween the keys selected in the Graph Editor against their neighbouring
+    keys in one batched edit (see TMKeySnapshot).  Returns the number of keys
+    changed
+    """
+    return TMKeySnapshot.capture(nodes).apply(get_easing(easing)(bias))
+
+
+class TMPose(object):
+    """
+    Compact snapshot of the animated values on a list of nodes.  Node and
+    attribute names are stored once in lookup tables, each plug is a pair of
+    indices into those tables, and the values are kept in a float array
+    """
+
+    def __init__(self, name, nodes=(), attrs=(), plugs=(), values=(),
+                 time=None):
+        self.name = name
+        self.time = time
+        self.nodes = list(nodes)
+        self.attrs = list(attrs)
+        # Flattened (node index, attribute index) pairs, one pair per value
+        self.plugs = array("i", plugs)
+        self.values = array("d", values)
+
+    def __len__(self):
+        return len(self.values)
+
+    @classmethod
+    def capture(cls, name, nodes=None, time=None):
+        """
+        Capture the values of all animated plugs on the given nodes (or the
+        current selection) at the given time (or the current time)
+        """
+        if nodes is None:
+            nodes = mc.ls(sl=True)
+        if time is None:
+            time = mc.currentTime(q=True)
+        pose = cls(name, time=time)
+        curves = (mc.keyframe(nodes, q=True, name=True) or []) if nodes else []
+        if not curves:
+            return pose
+        # Evaluate every curve at the requested time with one query
+        values = mc.keyframe(curves, q=True, eval=True, time=(time,),
+                             valueChange=True)
+        node_index = {}
+        attr_index = {}
+        for plug, value in zip(curve_plugs(curves), values):
+            if plug is None:
+                continue
+            node, attr = plug.split(".", 1)
+            if node not in node_index:
+                node_index[node] = len(pose.nodes)
+                pose.nodes.append(node)
+            if attr not in attr_index:
+                attr_index[attr] = len(pose.attrs)
+                pose.attrs.append(attr)
+            pose.plugs.append(node_index[node])
+            pose.plugs.append(attr_index[attr])
+            pose.values.append(value)
+        return pose
+
+    def plug_names(self):
+        """
+        Return the full plug name for each value
+        """
+        return ["%s.%s" % (self.nodes[self.plugs[i]], self.attrs[self.plugs[i + 1]])
+                for i in range(0, len(self.plugs), 2)]
+
+    def lookup(self):
+        """
+        Return a dictionary of plug name to value
+        """
+        return dict(zip(self.plug_names(), self.values))
+
+    @classmethod
+    def from_element(cls, element):
+        """
+        Build a pose from its XML element
+        """
+        time = element.get("time")
+        return cls(element.get("name"),
+                   nodes=element.get("nodes", "").split(),
+                   attrs=element.get("attrs", "").split(),
+                   plugs=[int(i) for i in element.get("plugs", "").split()],
+                   values=[float(v) for v in element.get("values", "").split()],
+                   time=float(time) if time else None)
+
+    def to_element(self, parent):
+        """
+        Write the pose as an XML element under the given parent element
+        """
+        element = etree.SubElement(parent, "pose")
+        element.set("name", self.name)
+        if self.time is not None:
+            element.set("time", repr(self.time))
+        element.set("nodes", " ".join(self.nodes))
+        element.set("attrs", " ".join(self.attrs))
+        element.set("plugs", " ".join([str(i) for i in self.plugs]))
+        element.set("values", " ".join([repr(v) for v in self.values]))
+        return element
+
+
+def remap_namespace(node, namespaces):
+    """
+    Rename a node (or DAG path) according to a dictionary mapping old
+    namespaces to new ones.  An empty old namespace adds the new namespace to
+    names that don't have one
+    """
+    if not namespaces:
+        return node
+    parts = []
+    for part in node.split("|"):
+        namespace, _, name = part.rpartition(":")
+        if namespace in namespaces:
+            new = namespaces[namespace]
+            part = "%s:%s" % (new, name) if new else name
+        parts.append(part)
+    return "|".join(parts)
+
+
+def resolve_nodes(nodes, uuids=None):
+    """
+    Return a dictionary mapping each of the given node names to its name in
+    the scene, or None if it doesn't exist.  Existence is checked for all
+    nodes with one bulk ls query (plus one for long names), and missing nodes
+    with a known UUID are found by UUID with another pair of queries
+    """
+    unique = list(set(nodes))
+    if not unique:
+        return {}
+    existing = set(mc.ls(unique) or [])
+    existing.update(mc.ls(unique, long=True) or [])
+    resolved = dict((node, node if node in existing else None) for node in unique)
+    missing = [node for node in unique if resolved[node] is None and uuids and node in uuids]
+    if missing:
+        found = mc.ls([uuids[node] for node in missing]) or []
+        by_uuid = dict(zip(mc.ls(found, uuid=True) or [], found))
+        for node in missing:
+            resolved[node] = by_uuid.get(uuids[node])
+    return resolved
+
+
+def convert_legacy_data(root):
+    """
+    Convert the root element of a data file saved by the MEL version of
+    tweenMachine (tmData) to the current format
+    """
+    new_root = etree.XML("<tweenMachineData />")
+    buttons_element = etree.SubElement(new_root, "buttons")
+    buttons_element.set("height", str(SETTINGS["button_height"]))
+    for button in root.iter("tmButton"):
+        button_element = etree.SubElement(buttons_element, "button")
+        button_element.set("rgb", (button.findtext("tmButtonRGB") or "").strip())
+        button_element.set("value", (button.findtext("tmButtonValue") or "").strip())
+    groups_element = etree.SubElement(new_root, "groups")
+    for group in root.iter("tmGroup"):
+        group_element = etree.SubElement(groups_element, "group")
+        group_element.set("name", group.get("id"))
+        group_element.set("index", group.get("order"))
+        for set_ in group.findall("tmSet"):
+            set_element = etree.SubElement(group_element, "set")
+            set_element.set("name", set_.get("id"))
+            set_element.set("index", set_.get("order"))
+            set_element.text = " ".join(
+                [obj.text.strip() for obj in set_.findall("tmObject")
+                 if obj.text and obj.text.strip() != "tmCustomCharacterSet"])
+    return new_root
 
 
 class TMData(object):
@@ -243,12 +2572,16 @@ class TMData(object):
         self.node = None
         self.name = "selected"
         self.groups = []
+        self.node_table = TMNodeTable()
         # Try to read the existing XML data
         oldnodes = mc.ls("tmXML*")
         newnodes = mc.ls("tweenMachineData")
-        #        if True:
-        #            return
-        if oldnodes:
+        stored = self._stored_root(newnodes[0]) if newnodes else None
+        if stored is not None:
+            # The scene already holds data in the current format
+            self.root = stored
+            self.tree = etree.ElementTree(self.root)
+        elif oldnodes:
             # If we have more than one, use the first one, but warn the user
             self.node = oldnodes[0]
             if len(oldnodes) > 1:
@@ -307,23 +2640,11 @@ class TMData(object):
                         set_element.text = " ".join(setobjs)
             # Otherwise get the data from the node
             else:
-                self.root = etree.XML(mc.getAttr(node + ".data"))
+                self.root = etree.XML(mc.getAttr(self.node + ".data"))
                 self.tree = etree.ElementTree(self.root)
         # Otherwise start from scratch
         else:
-            self.root = etree.XML("""<tweenMachineData>
-    <buttons height="%s">
-         <button rgb="0.6 0.6 0.6" value="-75" />
-         <button rgb="0.6 0.6 0.6" value="-60" />
-         <button rgb="0.6 0.6 0.6" value="-33" />
-         <button rgb="0.6 0.6 0.6" value="0" />
-         <button rgb="0.6 0.6 0.6" value="33" />
-         <button rgb="0.6 0.6 0.6" value="60" />
-         <button rgb="0.6 0.6 0.6" value="75" />
-    </buttons>
-    <groups />
-</tweenMachineData>
-""" % SETTINGS["button_height"])
+            self.root = self._default_root()
             self.tree = etree.ElementTree(self.root)
         # Next: replace existing data with new XML data
         if newnodes:
@@ -339,43 +2660,649 @@ class TMData(object):
                 mc.select(selection)
             else:
                 mc.select(clear=True)
-        self.save_data()
+        # Only write data that didn't come from the data node
+        if stored is None:
+            self.save_data()
         # Erase old data nodes (FUTURE: ask user to confirm)
         if False:
             for node in oldnodes:
                 mc.delete(node)
-        # Build groups and sets
+        self._read_root()
+
+    @staticmethod
+    def _stored_root(node):
+        """
+        Return the XML root stored on a tweenMachineData node, or None if the
+        node holds no (readable) data
+        """
+        text = mc.getAttr(node + ".data")
+        if not text:
+            return None
+        try:
+            root = etree.XML(text)
+        except SyntaxError:
+            LOG.warn("Couldn't read the tweenMachine data on {}".format(node))
+            return None
+        if root.tag != "tweenMachineData" or root.find("groups") is None:
+            return None
+        return root
+
+    @staticmethod
+    def _default_root():
+        """
+        Return the XML root for an empty data set
+        """
+        return etree.XML("""<tweenMachineData>
+    <buttons height="%s">
+         <button rgb="0.6 0.6 0.6" value="-75" />
+         <button rgb="0.6 0.6 0.6" value="-60" />
+         <button rgb="0.6 0.6 0.6" value="-33" />
+         <button rgb="0.6 0.6 0.6" value="0" />
+         <button rgb="0.6 0.6 0.6" value="33" />
+         <button rgb="0.6 0.6 0.6" value="60" />
+         <button rgb="0.6 0.6 0.6" value="75" />
+    </buttons>
+    <groups />
+</tweenMachineData>
+""" % SETTINGS["button_height"])
+
+    def _read_root(self):
+        """
+        Build groups, sets, easing curves and poses from the XML root
+        """
+        # Build groups and sets, with a fresh table for their node names
+        self.groups = []
+        self.node_table = TMNodeTable()
         self.group_root = self.root.find("groups")
         for group in self.group_root.findall("group"):
             # Build a group node
-            self.groups.append(TMGroup(group))
+            self.groups.append(TMGroup(self, group))
+        # Read custom easing curves
+        self.easing_root = self.root.find("easing")
+        if self.easing_root is None:
+            self.easing_root = etree.SubElement(self.root, "easing")
+        for element in self.easing_root.findall("curve"):
+            register_easing(TMEasing(element.get("name"), points=[
+                float(v) for v in element.get("points").split()]))
+        # Read stored poses
+        self.pose_root = self.root.find("poses")
+        if self.pose_root is None:
+            self.pose_root = etree.SubElement(self.root, "poses")
+        self.poses = {}
+        for element in self.pose_root.findall("pose"):
+            pose = TMPose.from_element(element)
+            self.poses[pose.name] = pose
+        self.pose_frames = [float(v) for v in self.pose_root.get("frames", "").split()]
+        # Index the sets for the data manager
+        self.index = TMDataIndex(self.groups)
+
+    def save_data(self):
+        """
+        Save everything to the data node
+        """
+        text = etree.tostring(self.root)
+        if not isinstance(text, str):
+            text = text.decode("utf-8")
+        mc.setAttr(self.node + ".data", text, type="string")
+
+    def _replace_root(self, root):
+        """
+        Replace all data with a new XML root and save it to the data node
+        """
+        self.root = root
+        self.tree = etree.ElementTree(self.root)
+        self.save_data()
+        self._read_root()
+
+    def new(self):
+        """
+        Flush all groups, sets and poses and start over
+        """
+        self._replace_root(self._default_root())
+
+    def save_file(self, path):
+        """
+        Save groups, sets and buttons to a versioned tweenMachine data file.
+        The UUID of each set member is stored next to its name so that
+        members can still be found on import if they have been renamed
+        """
+        root = copy.deepcopy(self.root)
+        root.set("version", str(DATA_FILE_VERSION))
+        # Scene-specific data doesn't belong in a shared library
+        for element in root.findall("poses"):
+            root.remove(element)
+        selection = OpenMaya.MSelectionList()
+        for set_element in root.iter("set"):
+            for element in set_element.findall("plan"):
+                set_element.remove(element)
+            uuids = []
+            for node in (set_element.text or "").split():
+                try:
+                    selection.clear()
+                    selection.add(node)
+                    uuid = OpenMaya.MFnDependencyNode(selection.getDependNode(0)).uuid()
+                    uuids.append(uuid.asString())
+                except RuntimeError:
+                    uuids.append("-")
+            set_element.set("uuids", " ".join(uuids))
+        etree.ElementTree(root).write(path)
+
+    def load_file(self, path, namespaces=None):
+        """
+        Replace all groups, sets and buttons with those from a tweenMachine
+        data file, returning the list of set members that could not be found.
+
+        namespaces optionally maps old namespaces to new ones (an empty old
+        namespace matches names without one).  Every member of every set is
+        then checked with a couple of bulk queries (see resolve_nodes), and
+        missing members are dropped from their sets.
+        """
+        root = etree.parse(path).getroot()
+        if root.tag == "tmData":
+            root = convert_legacy_data(root)
+        if root.tag != "tweenMachineData":
+            raise ValueError("%s does not contain tweenMachine data" % path)
+        version = int(root.get("version", DATA_FILE_VERSION))
+        if version > DATA_FILE_VERSION:
+            raise ValueError("%s was saved by a newer version of tweenMachine" % path)
+        root.attrib.pop("version", None)
+        set_elements = list(root.iter("set"))
+        members = []
+        uuids = {}
+        for set_element in set_elements:
+            nodes = [remap_namespace(node, namespaces)
+                     for node in (set_element.text or "").split()]
+            members.append(nodes)
+            for node, uuid in zip(nodes, set_element.get("uuids", "").split()):
+                if uuid != "-":
+                    uuids[node] = uuid
+            set_element.attrib.pop("uuids", None)
+        resolved = resolve_nodes([node for nodes in members for node in nodes], uuids)
+        missing = []
+        for set_element, nodes in zip(set_elements, members):
+            found = []
+            for node in nodes:
+                if resolved.get(node):
+                    found.append(resolved[node])
+                else:
+                    missing.append(node)
+            set_element.text = " ".join(found)
+        # Keep this scene's poses
+        if root.find("poses") is None and self.pose_root is not None:
+            root.append(self.pose_root)
+        self._replace_root(root)
+        return missing
+
+    def add_group(self, name):
+        """
+        Add a named group
+        """
+        element = etree.SubElement(self.group_root, "group")
+        element.set("name", name)
+        element.set("index", str(len(self.groups)))
+        self.groups.append(TMGroup(self, element))
+        self.save_data()
+
+    def remove_group(self, name):
+        """
+        Remove a named group
+        """
+        for group in self.groups:
+            if group.name == name:
+                self.group_root.remove(group._element)
+                self.groups.remove(group)
+                for set_ in group.sets:
+                    self.index.remove(set_)
+                break
+        self.save_data()
+
+    def add_easing(self, name, points):
+        """
+        Add a custom easing curve from a flat list of (x, y) control point
+        values covering 0-1, replacing any curve with the same name
+        """
+        for element in self.easing_root.findall("curve"):
+            if element.get("name") == name:
+                self.easing_root.remove(element)
+        element = etree.SubElement(self.easing_root, "curve")
+        element.set("name", name)
+        element.set("points", " ".join([repr(float(v)) for v in points]))
+        register_easing(TMEasing(name, points=[float(v) for v in points]))
+        self.save_data()
+
+    def add_pose(self, name, nodes=None):
+        """
+        Capture the current values of the given nodes (or the selection) and
+        store them as a named pose, replacing any pose with the same name
+        """
+        self.remove_pose(name, save=False)
+        pose = TMPose.capture(name, nodes)
+        pose.to_element(self.pose_root)
+        self.poses[name] = pose
+        self.save_data()
+        return pose
+
+    def set_pose_frames(self, frames):
+        """
+        Set the frames that hold this scene's key poses, used as neighbours
+        when tweening between pose keys (see role_neighbours)
+        """
+        self.pose_frames = sorted(set(float(frame) for frame in frames))
+        if self.pose_frames:
+            self.pose_root.set("frames", " ".join([repr(v) for v in self.pose_frames]))
+        else:
+            self.pose_root.attrib.pop("frames", None)
+        self.save_data()
+
+    def remove_pose(self, name, save=True):
+        """
+        Remove a named pose
+        """
+        for element in self.pose_root.findall("pose"):
+            if element.get("name") == name:
+                self.pose_root.remove(element)
+        self.poses.pop(name, None)
+        if save:
+            self.save_data()
+
+
+class TMDataService(object):
+    """
+    Scene-scoped access to the tweenMachine data.  The data node is found and
+    its XML parsed once; the result is cached until the scene changes (a new
+    scene, a scene being opened or imported, or a reference being loaded,
+    unloaded or removed), so opening the window again doesn't touch the
+    scene at all
+    """
+
+    _instance = None
+    scene_messages = ("kAfterNew", "kAfterOpen", "kAfterImport",
+                      "kAfterCreateReference", "kAfterLoadReference",
+                      "kAfterUnloadReference", "kAfterRemoveReference")
+
+    def __init__(self):
+        self._data = None
+        self._callbacks = []
+        self._listeners = []
+
+    @classmethod
+    def instance(cls):
+        """
+        Return the shared instance of the service
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def get(self):
+        """
+        Return the TMData for the current scene, reading it if necessary
+        """
+        if self._data is None:
+            self._data = TMData()
+            self.add_callbacks()
+        return self._data
+
+    def invalidate(self, *args):
+        """
+        Drop the cached data and tell listeners that the scene has changed
+        """
+        self._data = None
+        for listener in list(self._listeners):
+            listener()
+
+    def add_listener(self, listener):
+        """
+        Call the given function whenever the cached data is invalidated
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        Stop calling the given function on invalidation
+        """
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def add_callbacks(self):
+        """
+        Register the scene callbacks that invalidate the cache
+        """
+        if self._callbacks:
+            return
+        for message in self.scene_messages:
+            if hasattr(OpenMaya.MSceneMessage, message):
+                self._callbacks.append(OpenMaya.MSceneMessage.addCallback(
+                    getattr(OpenMaya.MSceneMessage, message), self.invalidate))
+
+    def remove_callbacks(self):
+        """
+        Remove the scene callbacks
+        """
+        for callback in self._callbacks:
+            OpenMaya.MMessage.removeCallback(callback)
+        self._callbacks = []
+
+
+class TMPrefixIndex(object):
+    """
+    Case-insensitive lookup of TMSets by string key.  Keys are kept in a
+    sorted list, so finding every key with a given prefix is one bisection
+    plus the matches themselves
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._sets = {}
+
+    def add(self, key, set_):
+        """
+        Index a set under a key
+        """
+        key = key.lower()
+        if key not in self._sets:
+            insort(self._keys, key)
+            self._sets[key] = set()
+        self._sets[key].add(set_)
+
+    def remove(self, key, set_):
+        """
+        Remove a set from a key, dropping the key when no sets are left
+        """
+        key = key.lower()
+        sets = self._sets.get(key)
+        if sets is None:
+            return
+        sets.discard(set_)
+        if not sets:
+            del self._sets[key]
+            del self._keys[bisect_left(self._keys, key)]
+
+    def get(self, key):
+        """
+        Return the sets indexed under exactly this key
+        """
+        return set(self._sets.get(key.lower(), ()))
+
+    def iter_prefix(self, prefix):
+        """
+        Yield (key, sets) for every key starting with prefix, in key order
+        """
+        prefix = prefix.lower()
+        for index in range(bisect_left(self._keys, prefix), len(self._keys)):
+            key = self._keys[index]
+            if not key.startswith(prefix):
+                break
+            yield key, self._sets[key]
+
+    def search(self, prefix):
+        """
+        Return the sets indexed under any key starting with prefix
+        """
+        found = set()
+        for key, sets in self.iter_prefix(prefix):
+            found.update(sets)
+        return found
 
-    def save_data(self):
+
+class TMDataIndex(object):
+    """
+    In-memory index of every set in a TMData instance by set name, member
+    node and member namespace.  Members are indexed under both their stored
+    name and their short name without a namespace, so "arm" finds
+    "rig:arm_ctrl".  TMGroup and TMSet keep the index up to date as sets are
+    added, removed, renamed or given new nodes
+    """
+
+    modes = ("name", "member", "namespace")
+
+    def __init__(self, groups=()):
+        self._indexes = dict((mode, TMPrefixIndex()) for mode in self.modes)
+        # The keys each set is currently indexed under, by mode
+        self._entries = {}
+        for group in groups:
+            for set_ in group.sets:
+                self.add(set_)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _set_keys(set_):
         """
-        Save everything to the data node
+        Return the keys a set should be indexed under, by mode
+        """
+        members = set()
+        namespaces = set()
+        for node in set_.nodes or ():
+            namespace, _, short = node.rpartition("|")[2].rpartition(":")
+            members.add(node)
+            members.add(short)
+            if namespace:
+                namespaces.add(namespace)
+        return {"name": set([set_.name or ""]),
+                "member": members,
+                "namespace": namespaces}
+
+    def add(self, set_):
         """
-        mc.setAttr(self.node + ".data", etree.tostring(self.root), type="string")
+        Index a set, replacing any keys it was indexed under before
+        """
+        self.remove(set_)
+        entries = self._set_keys(set_)
+        for mode, keys in entries.items():
+            for key in keys:
+                self._indexes[mode].add(key, set_)
+        self._entries[set_] = entries
 
-    def add_group(self, name):
+    # A changed set is simply indexed again
+    update = add
+
+    def remove(self, set_):
         """
-        Add a named group
+        Remove a set from the index
         """
-        element = etree.SubElement(self.group_root, "group")
-        element.set("name", name)
-        element.set("index", str(len(self.groups)))
-        self.groups.append(TMGroup(self, element))
-        self.save_data()
+        entries = self._entries.pop(set_, None)
+        if entries is None:
+            return
+        for mode, keys in entries.items():
+            for key in keys:
+                self._indexes[mode].remove(key, set_)
 
-    def remove_group(self, name):
+    def sets_for_node(self, node):
         """
-        Remove a named group
+        Return the sets that contain a node
         """
-        for group in self.groups:
-            if group.name == name:
-                self.group_root.remove(group._element)
-                self.groups.remove(group)
+        return self._indexes["member"].get(node)
+
+    def search(self, text, mode="name", limit=None):
+        """
+        Return up to limit sets whose name, members or namespaces (depending
+        on mode) start with text, ordered by the matching key and then by set
+        name.  Empty text matches every set.  Keys are walked in sorted order,
+        so a broad filter stops as soon as the limit is reached
+        """
+        if not text:
+            # Every set has a name key, but not every set has members
+            mode = "name"
+        found = []
+        seen = set()
+        order = lambda s: ((s.name or "").lower(), s.group.name)
+        for key, sets in self._indexes[mode].iter_prefix(text):
+            for set_ in sorted(sets - seen, key=order):
+                found.append(set_)
+                seen.add(set_)
+            if limit is not None and len(found) >= limit:
                 break
-        self.save_data()
+        return found[:limit]
+
+
+class TMCurvePlan(object):
+    """
+    The resolved anim curves of a TMSet's nodes for one set of attributes:
+    each node's curves, with the plug each drives and its UUID.  A plan is
+    checked before use rather than resolved again: against the curve
+    journal's generation when the journal is active, so only the nodes whose
+    curves have been connected or disconnected since are resolved again, and
+    otherwise (or for a plan read from the data node) against the curves
+    keyed on its nodes, with one query, which catches curves that have been
+    added, deleted or renamed.  That query is the same keyframe -name query
+    that resolving the plan for all attributes starts with, so without the
+    journal (the plugin not loaded) a plan only saves the plug and UUID
+    lookups, and for channel box selections the per-attribute queries; the
+    check is only cheap with the journal.  A set's plan for all attributes
+    is stored with the set on the data node
+    """
+
+    __slots__ = ("attributes", "entries", "generation", "keyed", "uuids")
+
+    def __init__(self, attributes=()):
+        self.attributes = tuple(attributes)
+        # Node -> list of (curve, plug, uuid)
+        self.entries = {}
+        # Journal generation the plan was checked at, or None if unchecked
+        self.generation = None
+        # Every curve keyed on the nodes when the plan was last checked
+        # against the scene, or None if it never was
+        self.keyed = None
+        # Node -> UUID, to match nodes rewired in the journal
+        self.uuids = {}
+
+    def curves(self, nodes):
+        """
+        Return the curves of the given nodes, in node order, resolving the
+        stale entries first.  Returns True as a second value if any entry
+        was resolved again
+        """
+        journal = TMCurveJournal.instance()
+        stale = set(node for node in nodes if node not in self.entries)
+        if not journal.active or self.generation is None:
+            keyed = set(mc.keyframe(nodes, q=True, name=True) or []) if nodes else set()
+            if keyed != self.keyed:
+                stale.update(nodes)
+                self.keyed = keyed
+        elif self.generation != journal.generation:
+            rewired = journal.rewired_since(self.generation)
+            if rewired is None:
+                stale.update(nodes)
+            elif rewired:
+                uuids = self._node_uuids(nodes)
+                stale.update(node for node in nodes if uuids.get(node) in rewired)
+        if journal.active:
+            self.generation = journal.generation
+        if stale:
+            self.resolve([node for node in nodes if node in stale])
+        curves = []
+        for node in nodes:
+            curves += [entry[0] for entry in self.entries[node]]
+        return curves, bool(stale)
+
+    def _node_uuids(self, nodes):
+        """
+        Return the plan's node -> UUID map, looking up any of the given
+        nodes that are missing from it
+        """
+        selection = OpenMaya.MSelectionList()
+        for node in nodes:
+            if node in self.uuids:
+                continue
+            try:
+                selection.clear()
+                selection.add(node)
+            except RuntimeError:
+                continue
+            self.uuids[node] = OpenMaya.MFnDependencyNode(
+                selection.getDependNode(0)).uuid().asString()
+        return self.uuids
+
+    def resolve(self, nodes):
+        """
+        Resolve the curves of the given nodes again, with one bulk query for
+        the plugs
+        """
+        node_curves = [resolve_curves([node], self.attributes) for node in nodes]
+        curves = [curve for found in node_curves for curve in found]
+        uuids = []
+        selection = OpenMaya.MSelectionList()
+        for curve in curves:
+            selection.clear()
+            selection.add(curve)
+            uuids.append(OpenMaya.MFnDependencyNode(
+                selection.getDependNode(0)).uuid().asString())
+        entries = iter(zip(curves, curve_plugs(curves), uuids))
+        for node, found in zip(nodes, node_curves):
+            self.entries[node] = [next(entries) for _ in found]
+
+    @classmethod
+    def from_element(cls, element):
+        """
+        Read a plan stored by to_element
+        """
+        plan = cls((element.get("attributes") or "").split())
+        for line in (element.text or "").splitlines():
+            if line.strip():
+                node, curve, plug, uuid = line.split()
+                plan.entries.setdefault(node, []).append(
+                    (curve, None if plug == "-" else plug, uuid))
+        if not plan.attributes:
+            # The plan for all attributes holds every curve on its nodes
+            plan.keyed = set(curve for entries in plan.entries.values()
+                             for curve, _, _ in entries)
+        return plan
+
+    def to_element(self, parent):
+        """
+        Store the plan as a child element of the given (set) element, one
+        "node curve plug uuid" line per curve
+        """
+        element = etree.SubElement(parent, "plan")
+        element.set("attributes", " ".join(self.attributes))
+        element.text = "\n".join(["%s %s %s %s" % (node, curve, plug or "-", uuid)
+                                  for node, entries in sorted(self.entries.items())
+                                  for curve, plug, uuid in entries])
+        return element
+
+
+class TMNodeTable(object):
+    """
+    Interned table of node names.  Each name is stored once and given an
+    integer id, so sets keep their members as arrays of ids rather than
+    lists of strings, and sets sharing members share the names.  Each TMData
+    has its own table, which goes with it when the data is reloaded
+    """
+
+    __slots__ = ("names", "ids")
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, name):
+        """
+        Return the id of a name, adding it to the table if needed
+        """
+        id_ = self.ids.get(name)
+        if id_ is None:
+            id_ = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return id_
+
+    def encode(self, names):
+        """
+        Return an array of the ids of the given names
+        """
+        return array("i", [self.intern(name) for name in names])
+
+    def decode(self, ids):
+        """
+        Return the names for an array of ids
+        """
+        names = self.names
+        return [names[id_] for id_ in ids]
 
 
 class TMGroup(object):
@@ -383,15 +3310,19 @@ class TMGroup(object):
     Container object for a collection of TMSet classes
     """
 
+    __slots__ = ("data", "sets", "_element", "index", "name", "node_table")
+
     def __init__(self, data, element):
         self.data = data
+        # Shared by the data's groups and sets (see TMNodeTable)
+        self.node_table = TMNodeTable() if data is None else data.node_table
         self.sets = []
         self._element = element
         self.index = self._element.get("index")
         self.name = self._element.get("name")
         # Build list of sets from XML data
         for set_ in self._element.findall("set"):
-            self.sets.append(TMSet(set_))
+            self.sets.append(TMSet(self, set_))
 
     def save_data(self):
         """
@@ -407,7 +3338,9 @@ class TMGroup(object):
         element.set("name", name)
         element.set("index", str(len(self.sets)))
         element.text = " ".join(nodes)
-        self.sets.append(TMSet(self, element))
+        set_ = TMSet(self, element)
+        self.sets.append(set_)
+        self.data.index.add(set_)
         self.save_data()
 
     def remove_set(self, name):
@@ -415,9 +3348,10 @@ class TMGroup(object):
         Remove the named set
         """
         for set_ in self.sets:
-            if set.name == name:
-                self._element.remove(set.element)
+            if set_.name == name:
+                self._element.remove(set_._element)
                 self.sets.remove(set_)
+                self.data.index.remove(set_)
                 break
         self.save_data()
 
@@ -437,16 +3371,26 @@ class TMGroup(object):
         self._element.set("name", name)
         self.save_data()
 
+    def stagger(self, bias, offset=1.0, falloff=0.0, **kwds):
+        """
+        Tween the nodes of every set in the group as one staggered chain, in
+        set order (see tween_staggered)
+        """
+        nodes = []
+        for set_ in sorted(self.sets, key=lambda s: int(s.index or 0)):
+            nodes += [node for node in set_.nodes if node not in nodes]
+        return tween_staggered(bias, nodes, offset, falloff, **kwds)
+
     # Properties
 
     def _get_nodes(self):
         """
         Return all nodes in all contained sets
         """
-        allnodes = []
+        ids = set()
         for set_ in self.sets:
-            allnodes += set_.nodes
-        return list(set(allnodes))
+            ids.update(set_.members)
+        return self.node_table.decode(ids)
 
     nodes = property(_get_nodes)
 
@@ -457,24 +3401,89 @@ class TMSet(object):
     case of the default selected set)
     """
 
+    __slots__ = ("group", "_element", "members", "name", "index", "easing",
+                 "stagger_offset", "stagger_falloff", "plans", "node_table")
+
+    # Plans kept for channel box selections (see curves)
+    plan_limit = 8
+
     def __init__(self, group=None, element=None):
         self.group = group
         self._element = element
-        self.nodes = None
+        self.node_table = TMNodeTable() if group is None else group.node_table
+        # Ids of the member nodes in node_table, or None for the selection
+        self.members = None
         self.name = None
         self.index = None
+        self.easing = None
+        self.stagger_offset = None
+        self.stagger_falloff = 0.0
+        # Resolved curves by attributes (see TMCurvePlan)
+        self.plans = {}
         # If we have an element, assume that it contains the list of nodes
         if element is not None:
-            self._nodes = element.text.split()
+            self.nodes = (element.text or "").split()
+            for plan_element in element.findall("plan"):
+                if plan_element.get("attributes"):
+                    # Only the plan for all attributes is stored; drop plans
+                    # for channel box selections stored by earlier versions
+                    element.remove(plan_element)
+                    continue
+                plan = TMCurvePlan.from_element(plan_element)
+                self.plans[plan.attributes] = plan
             self.name = element.get("name")
             self.index = element.get("index")
+            self.easing = element.get("easing")
+            if element.get("stagger") is not None:
+                self.stagger_offset, self.stagger_falloff = [
+                    float(v) for v in element.get("stagger").split()]
+
+    def curves(self, attributes=()):
+        """
+        Return the anim curves of this set's nodes, limited to the given
+        attributes, from the set's plan for those attributes (see
+        TMCurvePlan).  The plan for all attributes is stored when it has to
+        be resolved again, with undo off so that storing it doesn't add a
+        step of its own to the undo queue; plans for channel box selections
+        are only kept in memory, and at most plan_limit of them
+        """
+        attributes = tuple(attributes)
+        plan = self.plans.get(attributes)
+        if plan is None:
+            if attributes and len(self.plans) >= self.plan_limit:
+                self.plans = dict((key, value) for key, value in self.plans.items()
+                                  if not key)
+            plan = self.plans[attributes] = TMCurvePlan(attributes)
+        curves, changed = plan.curves(self.nodes)
+        if changed and not attributes and self._element is not None:
+            for element in self._element.findall("plan"):
+                self._element.remove(element)
+            plan.to_element(self._element)
+            with undo_suspended():
+                self.group.save_data()
+        return curves
+
+    def tween(self, bias, **kwds):
+        """
+        Tween this set's nodes (or the selection) with its easing profile,
+        staggered if a stagger offset has been set (see tween_staggered).
+        The set's curves come from its plan (see curves)
+        """
+        if not self.nodes:
+            return tween(bias, self.nodes, easing=self.easing, **kwds)
+        if self.stagger_offset is None:
+            attributes = channel_attributes(kwds.pop("attributes", None))
+            return tween_curves(self.curves(attributes),
+                                get_easing(self.easing)(bias), **kwds)
+        return tween_staggered(bias, self.nodes, self.stagger_offset,
+                               self.stagger_falloff, easing=self.easing, **kwds)
 
     def set_index(self, index):
         """
         Set the index for this set
         """
         self.index = index
-        if self._element:
+        if self._element is not None:
             self._element.set("index", str(index))
             self.group.save_data()
 
@@ -483,10 +3492,50 @@ class TMSet(object):
         Rename this set
         """
         self.name = name
-        if self._element:
+        if self._element is not None:
             self._element.set("name", name)
+            self.group.data.index.update(self)
+            self.group.save_data()
+
+    def set_easing(self, easing=None):
+        """
+        Set the easing profile used by this set (None uses the global one)
+        """
+        self.easing = easing
+        if self._element is not None:
+            if easing is None:
+                self._element.attrib.pop("easing", None)
+            else:
+                self._element.set("easing", easing)
             self.group.save_data()
 
+    def set_stagger(self, offset=None, falloff=0.0):
+        """
+        Set the frame offset between consecutive nodes and the bias falloff
+        used to stagger this set (an offset of None turns staggering off)
+        """
+        self.stagger_offset = offset
+        self.stagger_falloff = falloff
+        if self._element is not None:
+            if offset is None:
+                self._element.attrib.pop("stagger", None)
+            else:
+                self._element.set("stagger", "%r %r" % (float(offset), float(falloff)))
+            self.group.save_data()
+
+    def _get_nodes(self):
+        """
+        Return the names of the member nodes, or None for the selection
+        """
+        if self.members is None:
+            return None
+        return self.node_table.decode(self.members)
+
+    def _set_nodes(self, nodes):
+        self.members = None if nodes is None else self.node_table.encode(nodes)
+
+    nodes = property(_get_nodes, _set_nodes)
+
     def set_nodes(self, nodes=None):
         """
         Sets the list of nodes
@@ -496,8 +3545,12 @@ class TMSet(object):
             self.nodes = mc.ls(sl=True)
         else:
             self.nodes = nodes
-        if self._element:
-            self._element.text = " ".join(nodes)
+        self.plans = {}
+        if self._element is not None:
+            self._element.text = " ".join(self.nodes)
+            for element in self._element.findall("plan"):
+                self._element.remove(element)
+            self.group.data.index.update(self)
             self.group.save_data()
 
 
@@ -512,24 +3565,36 @@ class TMWindowUI(object):
         # Check for updates
         # Spawn in a Thread so we don't have blocking if user is offline or response takes too long.
         Thread(target=self.update_check, args=tuple()).start()
-        # First get an instance of the main data class
-        self.data = TMData()
-        # Test adding a group
-        self.data.add_group("testing")
+        # First get the (cached) instance of the main data class
+        self.data = TMDataService.instance().get()
+        TMDataService.instance().add_listener(self._scene_changed)
         # Set core variables
         self.docked = SETTINGS["docked"]
         self.show_mode = SETTINGS["show_mode"]
         self.use_overshoot = SETTINGS["use_overshoot"]
         self.use_special_tick = SETTINGS["use_special_tick"]
         self.window = None
+        self.group_rows = []
         self.set_ui_mode()
-        self._build_all_groups()
 
+    def _scene_changed(self):
+        """
+        Rebuild the groups from the new scene's data when the scene changes,
+        or stop listening if the window has been closed
+        """
+        if not mc.columnLayout(self.group_column, q=True, exists=True):
+            TMDataService.instance().remove_listener(self._scene_changed)
+            return
+        # Defer so that the scene has finished loading before it's read
+        mc.evalDeferred(self._reload_data)
 
-        # Kick off scriptJobs
-        ##scriptJob -p tweenMachineWin -e "SceneOpened" "deleteUI tweenMachineWin; tweenMachine;";
-        # scriptJob -p tweenMachineWin -e "NewSceneOpened" "deleteUI tweenMachineWin;";
-        # scriptJob -uid tweenMachineWin "tmRestoreTimeControl";
+    def _reload_data(self):
+        """
+        Fetch the current scene's data and rebuild the groups
+        """
+        if mc.columnLayout(self.group_column, q=True, exists=True):
+            self.data = TMDataService.instance().get()
+            self._build_all_groups()
 
     def _make_window(self):
         """
@@ -555,6 +3620,14 @@ class TMWindowUI(object):
                       attachForm=[(self.selected_row.form, "top", 0),
                                   (self.selected_row.form, "left", 0),
                                   (self.selected_row.form, "right", 0)])
+        self.group_column = mc.columnLayout(parent=self.main_form,
+                                            adjustableColumn=True)
+        mc.formLayout(self.main_form, e=True,
+                      attachControl=[(self.group_column, "top", 0,
+                                      self.selected_row.form)],
+                      attachForm=[(self.group_column, "left", 0),
+                                  (self.group_column, "right", 0)])
+        self._build_all_groups()
 
     def _make_menus(self):
         """
@@ -568,17 +3641,17 @@ class TMWindowUI(object):
             menus = mc.window(self.window, q=True, menuArray=True)
             if menus is not None:
                 for menu in menus:
-                    #                    if mc.menu(menu, q=True, label=True) == "File":
-                    #                        self._file_menu = menu
-                    #                    if mc.menu(menu, q=True, label=True) == "Tools":
-                    #                        self._tool_menu = menu
+                    if mc.menu(menu, q=True, label=True) == "File":
+                        self._file_menu = menu
+                    if mc.menu(menu, q=True, label=True) == "Tools":
+                        self._tool_menu = menu
                     if mc.menu(menu, q=True, label=True) == "Options":
                         self._opt_menu = menu
             else:
-                #                self._file_menu = mc.menu(label="File",
-                #                                          postMenuCommand=self._make_file_menu)
-                #                self._tool_menu = mc.menu(label="Tools",
-                #                                          postMenuCommand=self._make_tool_menu)
+                self._file_menu = mc.menu(label="File",
+                                          postMenuCommand=self._make_file_menu)
+                self._tool_menu = mc.menu(label="Tools",
+                                          postMenuCommand=self._make_tool_menu)
                 self._opt_menu = mc.menu(label="Options",
                                          postMenuCommand=self._make_opt_menu)
                 # Help menu
@@ -592,12 +3665,12 @@ class TMWindowUI(object):
         else:
             if not hasattr(self, "popup_menu"):
                 self.popup_menu = mc.popupMenu(parent=self.main_form)
-            #            self._file_menu = mc.menuItem(p=self.popup_menu, label="File",
-            #                                  postMenuCommand=self._make_file_menu,
-            #                                  subMenu=True)
-            #            self._tool_menu = mc.menuItem(p=self.popup_menu, label="Tools",
-            #                                  postMenuCommand=self._make_tool_menu,
-            #                                  subMenu=True)
+            self._file_menu = mc.menuItem(p=self.popup_menu, label="File",
+                                          postMenuCommand=self._make_file_menu,
+                                          subMenu=True)
+            self._tool_menu = mc.menuItem(p=self.popup_menu, label="Tools",
+                                          postMenuCommand=self._make_tool_menu,
+                                          subMenu=True)
             self._opt_menu = mc.menuItem(p=self.popup_menu, label="Options",
                                          postMenuCommand=self._make_opt_menu,
                                          subMenu=True)
@@ -613,9 +3686,6 @@ class TMWindowUI(object):
         Make the file menu
         """
         clear_menu(self._file_menu)
-        mc.menuItem(p=self._file_menu, label="Coming soon...", enable=False)
-        if True:
-            return
         mc.menuItem(p=self._file_menu, label="New...", command=self.new)
         mc.menuItem(p=self._file_menu, divider=True)
         mc.menuItem(p=self._file_menu, label="Open...", command=self.load)
@@ -627,7 +3697,23 @@ class TMWindowUI(object):
         Make the tool menu
         """
         clear_menu(self._tool_menu)
-        mc.menuItem(p=self._tool_menu, label="Coming soon...", enable=False)
+        mc.menuItem(p=self._tool_menu, label="Tween Checked Sets",
+                    command=self.tween_checked,
+                    enable=len(self.group_rows) > 0)
+        mc.menuItem(p=self._tool_menu, label="Breakdown Every Interval of Checked Sets",
+                    command=self.breakdown_checked,
+                    enable=len(self.group_rows) > 0)
+        mc.menuItem(p=self._tool_menu, divider=True)
+        mc.menuItem(p=self._tool_menu, label="Mark Current Frame as Key Pose",
+                    command=self._mark_pose_frame)
+        mc.menuItem(p=self._tool_menu, label="Clear Key Pose Frames",
+                    command=lambda x: self.data.set_pose_frames([]),
+                    enable=len(self.data.pose_frames) > 0)
+        mc.menuItem(p=self._tool_menu, divider=True)
+        mc.menuItem(p=self._tool_menu, label="Manage Sets and Groups...",
+                    command=self._open_data_manager)
+        mc.menuItem(p=self._tool_menu, label="Curve Cache Statistics",
+                    command=self._log_cache_stats)
         if True:
             return
         mc.menuItem(p=self._tool_menu, label="Add Group...",
@@ -636,8 +3722,6 @@ class TMWindowUI(object):
                     command=self._add_set_pre,
                     enable=len(self.data.groups) > 0)
         mc.menuItem(p=self._tool_menu, divider=True)
-        mc.menuItem(p=self._tool_menu, label="Manage Sets and Groups...",
-                    command=self._open_data_manager)
         mc.menuItem(p=self._tool_menu, label="Manage Buttons...",
                     command=self._open_button_manager)
         mc.menuItem(p=self._tool_menu, divider=True)
@@ -689,11 +3773,48 @@ class TMWindowUI(object):
         #                    rb=SETTINGS["ui_mode"] == "hud",
         #                    command=lambda x, m="hud":self.set_ui_mode(m))
         mc.menuItem(p=self._opt_menu, divider=True)
+        easing_menu = mc.menuItem(p=self._opt_menu, label="Easing...",
+                                  subMenu=True)
+        easing_collection = mc.radioMenuItemCollection(parent=easing_menu)
+        for name in sorted(EASINGS):
+            mc.menuItem(p=easing_menu, label=name.replace("_", " ").title(),
+                        rb=SETTINGS["easing"] == name,
+                        command=lambda x, n=name: self._set_easing(n))
         mc.menuItem(p=self._opt_menu, label="Overshoot", cb=self.use_overshoot,
                     command=self._toggle_overshoot)
+        mc.menuItem(p=self._opt_menu, label="Quaternion Rotation",
+                    cb=SETTINGS["rotation_mode"] == "quaternion",
+                    command=self._toggle_rotation_mode)
+        mc.menuItem(p=self._opt_menu, label="World Space",
+                    cb=SETTINGS["tween_space"] == "world",
+                    command=self._toggle_tween_space)
+        layer_menu = mc.menuItem(p=self._opt_menu, label="Animation Layers...",
+                                 subMenu=True)
+        layer_collection = mc.radioMenuItemCollection(parent=layer_menu)
+        for mode, label in (("active", "Active Layer"),
+                            ("composite", "Active Layer (Composite)"),
+                            ("all", "All Layers")):
+            mc.menuItem(p=layer_menu, label=label,
+                        rb=SETTINGS["layer_mode"] == mode,
+                        command=lambda x, m=mode: self._set_layer_mode(m))
+        mc.menuItem(p=self._opt_menu, label="Tween Selected Keys",
+                    cb=SETTINGS["key_mode"] == "selected_keys",
+                    command=self._toggle_key_mode)
+        mc.menuItem(p=self._opt_menu, label="Tween Between Key Poses",
+                    cb=SETTINGS["neighbour_mode"] == "poses",
+                    command=self._toggle_neighbour_mode)
+        mc.menuItem(p=self._opt_menu, label="Preserve Curve Shape",
+                    cb=SETTINGS["tangent_mode"] == "shape",
+                    command=self._toggle_tangent_mode)
         mc.menuItem(p=self._opt_menu, label="Special Tick Color",
                     cb=self.use_special_tick,
                     command=self._toggle_special_tick)
+        mc.menuItem(p=self._opt_menu, label="Qt Set Rows",
+                    cb=SETTINGS["qt_rows"], enable=qt_rows() is not None,
+                    command=self._toggle_qt_rows)
+        mc.menuItem(p=self._opt_menu, label="Suspend Refresh While Keying",
+                    cb=SETTINGS["suspend_refresh"],
+                    command=self._toggle_suspend_refresh)
 
     def open_support(self, *args):
         """Open tweenMachine support in a browser"""
@@ -731,11 +3852,49 @@ class TMWindowUI(object):
         """
         inactive()
 
+    def tween_checked(self, *args):
+        """
+        Tween every checked set by its own slider value in one pass (see
+        tween_sets)
+        """
+        sets = [(row.data, row.bias()) for row in self.group_rows if row.checked()]
+        if not sets:
+            LOG.warn("No sets are checked.")
+            return
+        tween_sets(sets)
+
+    def breakdown_checked(self, *args):
+        """
+        Add a breakdown to every key interval of every checked set, at its
+        own slider value, as a single undo step (see breakdown_intervals)
+        """
+        rows = [row for row in self.group_rows if row.checked()]
+        if not rows:
+            LOG.warn("No sets are checked.")
+            return
+        with write_phase("tweenMachineBreakdowns"):
+            for row in rows:
+                breakdown_intervals(row.data, row.bias(), easing=row.data.easing,
+                                    neighbours=SETTINGS["neighbour_mode"])
+
+    def _mark_pose_frame(self, *args):
+        """
+        Add the current frame to the scene's key pose frames
+        """
+        self.data.set_pose_frames(self.data.pose_frames + [mc.currentTime(q=True)])
+
+    def _log_cache_stats(self, *args):
+        """
+        Log the curve journal and cache counters (see curve_cache_stats)
+        """
+        for key, value in sorted(curve_cache_stats().items()):
+            LOG.info("%s: %s", key, value)
+
     def _open_data_manager(self, *args):
         """
         Open the group/set data manager dialog
         """
-        inactive()
+        TMDataManagerUI(self)
 
     def _open_button_manager(self, *args):
         """
@@ -749,7 +3908,20 @@ class TMWindowUI(object):
         """
         self.show_mode = mode
         SETTINGS["show_mode"] = mode
-        self.selected_row.set_show_mode(mode)
+        for row in self._all_rows():
+            row.set_show_mode(mode)
+
+    def _set_easing(self, name):
+        """
+        Set the global easing profile
+        """
+        SETTINGS["easing"] = name
+
+    def _set_layer_mode(self, mode):
+        """
+        Set which animation layer curves are keyed
+        """
+        SETTINGS["layer_mode"] = mode
 
     def _toggle_overshoot(self, *args):
         """
@@ -757,7 +3929,8 @@ class TMWindowUI(object):
         """
         self.use_overshoot = not self.use_overshoot
         SETTINGS["use_overshoot"] = self.use_overshoot
-        self.selected_row.toggle_overshoot()
+        for row in self._all_rows():
+            row.toggle_overshoot()
 
     def _toggle_special_tick(self, *args):
         """
@@ -766,13 +3939,74 @@ class TMWindowUI(object):
         self.use_special_tick = not self.use_special_tick
         SETTINGS["use_special_tick"] = self.use_special_tick
 
+    def _toggle_rotation_mode(self, *args):
+        """
+        Toggle between Euler and quaternion blending of rotate channels
+        """
+        if SETTINGS["rotation_mode"] == "quaternion":
+            SETTINGS["rotation_mode"] = "euler"
+        else:
+            SETTINGS["rotation_mode"] = "quaternion"
+
+    def _toggle_tween_space(self, *args):
+        """
+        Toggle between local and world space tweening
+        """
+        if SETTINGS["tween_space"] == "world":
+            SETTINGS["tween_space"] = "local"
+        else:
+            SETTINGS["tween_space"] = "world"
+
+    def _toggle_key_mode(self, *args):
+        """
+        Toggle between keying the current frame and re-tweening the keys
+        selected in the Graph Editor
+        """
+        if SETTINGS["key_mode"] == "selected_keys":
+            SETTINGS["key_mode"] = "frame"
+        else:
+            SETTINGS["key_mode"] = "selected_keys"
+
+    def _toggle_neighbour_mode(self, *args):
+        """
+        Toggle between tweening from the adjacent keys and from the nearest
+        key poses
+        """
+        if SETTINGS["neighbour_mode"] == "poses":
+            SETTINGS["neighbour_mode"] = "adjacent"
+        else:
+            SETTINGS["neighbour_mode"] = "poses"
+
+    def _toggle_tangent_mode(self, *args):
+        """
+        Toggle between copying tangent types and shape-preserving tangents
+        """
+        if SETTINGS["tangent_mode"] == "shape":
+            SETTINGS["tangent_mode"] = "types"
+        else:
+            SETTINGS["tangent_mode"] = "shape"
+
+    def _toggle_qt_rows(self, *args):
+        """
+        Toggle building the group rows as Qt widgets
+        """
+        SETTINGS["qt_rows"] = not SETTINGS["qt_rows"]
+        self._build_all_groups()
+
+    def _toggle_suspend_refresh(self, *args):
+        """
+        Toggle suspending the viewport refresh while keys are written
+        """
+        SETTINGS["suspend_refresh"] = not SETTINGS["suspend_refresh"]
+
     def _toggle_label_visibility(self, *args):
         """
         Toggle visibility of the slider label(s)
         """
         show = not SETTINGS["show_label"]
         SETTINGS["show_label"] = show
-        self.selected_row.set_label_visibility(show)
+        for row in self._all_rows():
+            row.set_label_visibility(show)
 
     def _toggle_menu_visibility(self, *args):
         """
@@ -787,10 +4021,31 @@ class TMWindowUI(object):
             if self.popup_menu is not None:
                 mc.popupMenu(self.popup_menu, e=True, dai=True)
 
+    def _all_rows(self):
+        """
+        Return the UI rows for the selected set and every set in every group
+        """
+        return [self.selected_row] + self.group_rows
+
     def _build_all_groups(self):
         """
         Build the group interface(s) based on the data in the scene
         """
+        for child in mc.columnLayout(self.group_column, q=True, childArray=True) or []:
+            mc.deleteUI(child)
+        self.group_rows = []
+        qt = qt_rows() if SETTINGS["qt_rows"] else None
+        groups = sorted(self.data.groups, key=lambda g: int(g.index or 0))
+        for group in groups:
+            frame = mc.frameLayout(parent=self.group_column, label=group.name,
+                                   collapsable=True)
+            column = mc.columnLayout(parent=frame, adjustableColumn=True)
+            sets = sorted(group.sets, key=lambda s: int(s.index or 0))
+            if qt is not None:
+                self.group_rows += qt.add_rows(column, sets)
+                continue
+            for set_ in sets:
+                self.group_rows.append(TMSetUI(column, set_.name, data=set_))
 
     def _cleanup(self):
         """
@@ -878,31 +4133,209 @@ class TMWindowUI(object):
         """
         Flush all data and start over
         """
-        inactive()
+        result = mc.confirmDialog(title="New", message="Remove all groups and sets?",
+                                  button=["Yes", "No"], defaultButton="Yes",
+                                  cancelButton="No", dismissString="No")
+        if result == "Yes":
+            self.data.new()
+            self._build_all_groups()
 
     def load(self, *args):
         """
         Load groups and sets from a tweenMachine data file
         """
-        inactive()
+        path = mc.fileDialog2(fileMode=1, caption="Open tweenMachine Data",
+                              fileFilter="tweenMachine Data (*.xml)")
+        if not path:
+            return
+        result = mc.promptDialog(title="Namespaces",
+                                 message="Remap namespaces (old=new, comma separated)",
+                                 button=["OK", "Skip"], defaultButton="OK",
+                                 cancelButton="Skip", dismissString="Skip")
+        namespaces = {}
+        if result == "OK":
+            for pair in mc.promptDialog(q=True, text=True).split(","):
+                if "=" in pair:
+                    old, new = pair.split("=", 1)
+                    namespaces[old.strip()] = new.strip()
+        try:
+            missing = self.data.load_file(path[0], namespaces)
+        except (ValueError, SyntaxError) as exc:
+            mc.confirmDialog(title="Invalid file", message=str(exc))
+            return
+        if missing:
+            LOG.warn("Omitted %d set members that do not exist in the scene: %s",
+                     len(missing), " ".join(sorted(set(missing))))
+        self._build_all_groups()
 
     def save(self, *args):
         """
         Save groups and sets to a tweenMachine data file
         """
-        inactive()
+        path = mc.fileDialog2(fileMode=0, caption="Save tweenMachine Data",
+                              fileFilter="tweenMachine Data (*.xml)")
+        if path:
+            self.data.save_file(path[0])
 
     @staticmethod
     def update_check():
         """Check for available updates."""
         url = 'https://api.github.com/repos/alexwidener/tweenMachine/releases/latest'
-        with contextlib.closing(urllib2.urlopen(url)) as response:
+        with contextlib.closing(urlopen(url)) as response:
             data = json.loads(response.read())
             # TODO: When doing the Qt rework, add a QMessageBox
             if data['tag_name'] > __version__:
                 LOG.info('A new version is available')
 
 
+class TMDataManagerUI(object):
+    """
+    Dialog for finding sets by name, member node or namespace.  Filtering
+    runs on the data's TMDataIndex as the filter text is typed, and only the
+    first max_results matches are listed
+    """
+
+    max_results = 500
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.results = []
+        windowname = "tweenMachineDataManager"
+        if mc.window(windowname, q=True, exists=True):
+            mc.deleteUI(windowname)
+        self.window = mc.window(windowname, title="tweenMachine Sets and Groups",
+                                width=360, height=400)
+        form = mc.formLayout(parent=self.window)
+        self.mode_menu = mc.optionMenu(parent=form,
+                                       changeCommand=self.filter)
+        for mode in TMDataIndex.modes:
+            mc.menuItem(parent=self.mode_menu, label=mode.title())
+        self.field = mc.textField(parent=form,
+                                  textChangedCommand=self.filter)
+        self.list = mc.textScrollList(parent=form, allowMultiSelection=True,
+                                      selectCommand=self.select_members)
+        popup = mc.popupMenu(parent=self.list)
+        mc.menuItem(parent=popup, label="Rename Set...", command=self.rename_set)
+        mc.menuItem(parent=popup, label="Stagger Sets...", command=self.stagger_sets)
+        mc.menuItem(parent=popup, label="Remove Sets", command=self.remove_sets)
+        self.status = mc.text(parent=form, label="", align="left")
+        mc.formLayout(form, e=True,
+                      attachForm=[(self.mode_menu, "top", 5),
+                                  (self.mode_menu, "left", 5),
+                                  (self.field, "top", 5),
+                                  (self.field, "right", 5),
+                                  (self.list, "left", 5),
+                                  (self.list, "right", 5),
+                                  (self.status, "left", 5),
+                                  (self.status, "right", 5),
+                                  (self.status, "bottom", 5)],
+                      attachControl=[(self.field, "left", 5, self.mode_menu),
+                                     (self.list, "top", 5, self.field),
+                                     (self.list, "bottom", 5, self.status)])
+        mc.showWindow(self.window)
+        self.filter()
+
+    def filter(self, *args):
+        """
+        List the sets matching the filter text
+        """
+        start = timer.time()
+        mode = TMDataIndex.modes[mc.optionMenu(self.mode_menu, q=True,
+                                               select=True) - 1]
+        text = mc.textField(self.field, q=True, text=True).strip()
+        index = TMDataService.instance().get().index
+        self.results = index.search(text, mode, self.max_results)
+        elapsed = timer.time() - start
+        mc.textScrollList(self.list, e=True, removeAll=True)
+        if self.results:
+            mc.textScrollList(self.list, e=True, append=[
+                "%s / %s" % (set_.group.name, set_.name) for set_ in self.results])
+        mc.text(self.status, e=True, label="%d of %d sets" % (
+            len(self.results), len(index)))
+        LOG.debug("Filtered %d sets in %.2fms", len(index), elapsed * 1000.0)
+
+    def selected_sets(self):
+        """
+        Return the sets selected in the list
+        """
+        indices = mc.textScrollList(self.list, q=True, selectIndexedItem=True) or []
+        return [self.results[index - 1] for index in indices]
+
+    def select_members(self, *args):
+        """
+        Select the members of the selected sets in the scene
+        """
+        nodes = []
+        for set_ in self.selected_sets():
+            nodes += set_.nodes
+        nodes = mc.ls(nodes)
+        if nodes:
+            mc.select(nodes, replace=True)
+        else:
+            mc.select(clear=True)
+
+    def rename_set(self, *args):
+        """
+        Rename the first selected set
+        """
+        sets = self.selected_sets()
+        if not sets:
+            return
+        result = mc.promptDialog(title="Rename Set", message="Enter set name",
+                                 text=sets[0].name,
+                                 button=["OK", "Cancel"], defaultButton="OK",
+                                 cancelButton="Cancel", dismissString="Cancel")
+        if result == "OK":
+            sets[0].set_name(mc.promptDialog(q=True, text=True))
+            self._changed()
+
+    def stagger_sets(self, *args):
+        """
+        Set the stagger offset and falloff of the selected sets
+        """
+        sets = self.selected_sets()
+        if not sets:
+            return
+        current = ""
+        if sets[0].stagger_offset is not None:
+            current = "%g %g" % (sets[0].stagger_offset, sets[0].stagger_falloff)
+        result = mc.promptDialog(title="Stagger Sets",
+                                 message="Frame offset and bias falloff "
+                                         "(leave empty to turn off)",
+                                 text=current,
+                                 button=["OK", "Cancel"], defaultButton="OK",
+                                 cancelButton="Cancel", dismissString="Cancel")
+        if result != "OK":
+            return
+        values = mc.promptDialog(q=True, text=True).split()
+        try:
+            values = [float(value) for value in values]
+        except ValueError:
+            LOG.warn("Enter a frame offset and an optional falloff.")
+            return
+        for set_ in sets:
+            if values:
+                set_.set_stagger(values[0], values[1] if len(values) > 1 else 0.0)
+            else:
+                set_.set_stagger()
+
+    def remove_sets(self, *args):
+        """
+        Remove the selected sets from their groups
+        """
+        for set_ in self.selected_sets():
+            set_.group.remove_set(set_.name)
+        self._changed()
+
+    def _changed(self):
+        """
+        Refresh the list and the main window after the data has been edited
+        """
+        self.filter()
+        if mc.columnLayout(self.owner.group_column, q=True, exists=True):
+            self.owner._build_all_groups()
+
+
 class TMSetUI(object):
     """
     Base UI class for a single set, which includes a slider, a set of buttons,
@@ -910,8 +4343,10 @@ class TMSetUI(object):
     """
 
     def __init__(self, parent, name, **kwds):
-        self.data = TMSet()
+        self.data = kwds.pop("data", None) or TMSet()
         self.name = name
+        # Selected keys read when a slider drag starts
+        self._snapshot = None
         self.form = mc.formLayout(parent=parent)
         self.showcheck = lambda: self.data.nodes is not None
         self.checkbox = mc.checkBox(parent=self.form, label="",
@@ -923,12 +4358,12 @@ class TMSetUI(object):
                                      max=100, value=0,
                                      manage=mode in ["both", "slider"],
                                      changeCommand=self.tween_slider,
-                                     dragCommand=self.update_field)
+                                     dragCommand=self.drag_slider)
         self.field = mc.floatField(parent=self.form, min=-100, max=100, value=0,
                                    width=50, pre=1, step=1,
                                    changeCommand=self.tween_field,
                                    enterCommand=self.tween_field,
-                                   dragCommand=self.tween_field)
+                                   dragCommand=self.drag_field)
         # Attach the checkbox
         mc.formLayout(self.form, e=True,
                       attachForm=[(self.checkbox, "left", 5),
@@ -960,11 +4395,61 @@ class TMSetUI(object):
         if SETTINGS["use_overshoot"]:
             self.toggle_overshoot()
 
+    def checked(self):
+        """
+        Return whether the set's check box is on
+        """
+        return mc.checkBox(self.checkbox, q=True, value=True)
+
+    def bias(self):
+        """
+        Return the bias set by the field, from 0 to 1
+        """
+        return (mc.floatField(self.field, q=True, value=True) + 100) / 200.0
+
     def tween(self, value):
         """
         Callback when the slider is triggered
         """
-        tween((value + 100) / 200.0, self.data.nodes)
+        bias = (value + 100) / 200.0
+        if SETTINGS["key_mode"] == "selected_keys":
+            snapshot = self._snapshot or TMKeySnapshot.capture(self.data.nodes)
+            self._snapshot = None
+            snapshot.apply(get_easing(self.data.easing)(bias))
+        else:
+            self.data.tween(bias)
+
+    def drag_slider(self, value):
+        """
+        Callback while the slider is dragged.  In selected keys mode the keys
+        follow the slider, from a snapshot taken when the drag starts
+        """
+        self.update_field(value)
+        self.drag_keys(value)
+
+    def drag_field(self, value):
+        """
+        Callback while the field is dragged.  In selected keys mode the keys
+        follow the field as they do the slider (see drag_slider); other key
+        modes tween on every drag step, as the field always has
+        """
+        if SETTINGS["key_mode"] == "selected_keys":
+            mc.floatSlider(self.slider, e=True, value=value)
+            self.drag_keys(value)
+        else:
+            self.tween_field(value)
+
+    def drag_keys(self, value):
+        """
+        Make the selected keys follow a drag without adding undo steps, from
+        a snapshot taken when the drag starts.  Other key modes wait for the
+        drag to finish
+        """
+        if SETTINGS["key_mode"] == "selected_keys":
+            if self._snapshot is None:
+                self._snapshot = TMKeySnapshot.capture(self.data.nodes)
+            self._snapshot.apply(get_easing(self.data.easing)((value + 100) / 200.0),
+                                 live=True)
 
     def tween_field(self, value):
         """
@@ -1091,28 +4576,22 @@ class TMButtonRowData(object):
     Data for a row of buttons
     """
 
+    __slots__ = ("buttons",)
+
     def __init__(self, data):
         self.buttons = tuple([TMButtonData(element) for element in data])
 
     def __len__(self):
         return len(self.buttons)
 
-    def __iter__(self):
-        """
-        Part of the iteration protocol
-        """
-        self.iter_index = -1
-        return self
+    def __getitem__(self, index):
+        return self.buttons[index]
 
-    def next(self):
+    def __iter__(self):
         """
-        Part of the iteration protocol
+        Return a new iterator over the buttons, so iterations can be nested
         """
-        self.iter_index += 1
-        try:
-            return self.buttons[self.iter_index]
-        except:
-            raise StopIteration
+        return iter(self.buttons)
 
 
 class TMButtonData(object):
@@ -1120,6 +4599,8 @@ class TMButtonData(object):
     Data for a single button in a row
     """
 
+    __slots__ = ("value", "color")
+
     def __init__(self, data):
         self.value, self.color = data
 
@@ -1137,9 +4618,9 @@ class TMButtonData(object):
 
     def __repr__(self):
         """
-        Return a tuple that represents the data
+        Return the representation of the (value, color) tuple
         """
-        return (self.value, self.color)
+        return repr((self.value, self.color))
 
 
 class TMSettings(dict):
@@ -1187,6 +4668,31 @@ class TMSettings(dict):
             self["update_check"] = False
         if "ui_mode" not in self:
             self["ui_mode"] = "window"
+        if "suspend_refresh" not in self:
+            self["suspend_refresh"] = True
+        if "easing" not in self:
+            self["easing"] = "linear"
+        if "rotation_mode" not in self:
+            self["rotation_mode"] = "euler"
+        if "tween_space" not in self:
+            self["tween_space"] = "local"
+        if "layer_mode" not in self:
+            self["layer_mode"] = "active"
+        if "tangent_mode" not in self:
+            self["tangent_mode"] = "types"
+        if "key_mode" not in self:
+            self["key_mode"] = "frame"
+        if "qt_rows" not in self:
+            self["qt_rows"] = False
+        if "neighbour_mode" not in self:
+            self["neighbour_mode"] = "adjacent"
+
+    def pin(self, **values):
+        """
+        Set items for this session only, without saving them to the optionVar
+        """
+        for key, value in values.items():
+            dict.__setitem__(self, key, value)
 
     def __setitem__(self, key, value):
         """
@@ -1224,17 +4730,67 @@ def cmdCreator():
     return PluginCommand()
 
 
+class TMKeyCommand(OpenMaya.MPxCommand):
+    """
+    Undoable command that runs the pending key edit set by edit_curves,
+    recording its MFnAnimCurve edits in an MAnimCurveChange that undo and
+    redo replay
+    """
+    kPluginCmdName = 'tweenMachineKeys'
+    # Whether the command is registered, and the edit to run when it's called
+    registered = False
+    pending = None
+
+    def __init__(self):
+        OpenMaya.MPxCommand.__init__(self)
+        self._change = None
+
+    def doIt(self, *args):
+        function = TMKeyCommand.pending
+        TMKeyCommand.pending = None
+        if function is not None:
+            self._change = OpenMayaAnim.MAnimCurveChange()
+            function(self._change)
+
+    def redoIt(self):
+        self._change.redoIt()
+
+    def undoIt(self):
+        self._change.undoIt()
+
+    def isUndoable(self):
+        return self._change is not None
+
+
+def keyCmdCreator():
+    return TMKeyCommand()
+
+
 def initializePlugin(plugin):
     plugin_fn = OpenMaya.MFnPlugin(plugin)
     try:
         plugin_fn.registerCommand(PluginCommand.kPluginCmdName, cmdCreator)
     except Exception as exc:
         sys.stderr.write('Failed to register command: {}\n{}'.format(PluginCommand.kPluginCmdName, exc))
+    try:
+        plugin_fn.registerCommand(TMKeyCommand.kPluginCmdName, keyCmdCreator)
+        TMKeyCommand.registered = True
+    except Exception as exc:
+        sys.stderr.write('Failed to register command: {}\n{}'.format(TMKeyCommand.kPluginCmdName, exc))
+    TMCurveJournal.instance().add_callbacks()
 
 
 def uninitializePlugin(plugin):
     plugin_fn = OpenMaya.MFnPlugin(plugin)
+    TMDataService.instance().remove_callbacks()
+    TMLayerCache.instance().remove_callbacks()
+    TMCurveJournal.instance().remove_callbacks()
     try:
         plugin_fn.deregisterCommand(PluginCommand.kPluginCmdName)
     except Exception as exc:
         sys.stderr.write('Failed to deregister command: {}\n{}'.format(PluginCommand.kPluginCmdName, exc))
+    TMKeyCommand.registered = False
+    try:
+        plugin_fn.deregisterCommand(TMKeyCommand.kPluginCmdName)
+    except Exception as exc:
+        sys.stderr.write('Failed to deregister command: {}\n{}'.format(TMKeyCommand.kPluginCmdName, exc))
@@ -0,0 +1,361 @@
+"""
+tween_qt.py
+
+Qt set rows for tweenMachine.  A Maya-widget row (TMSetUI) is a formLayout,
+check box, label, field and slider per set, plus an iconTextButton and a
+formLayout edit per button, which adds up to thousands of controls for large
+set libraries.  A Qt row is a single QWidget whose button strip is painted
+as one widget and hit-tested, and whose slider calls straight into the tween
+engine.
+
+PySide2 is used when available, then PySide.  Without either, AVAILABLE is
+False and tweenMachine keeps building Maya-widget rows.
+"""
+
+# Built-in
+import logging
+import os
+import time as timer
+
+# Third-party
+try:
+    from PySide2 import QtCore, QtGui, QtWidgets
+    from shiboken2 import wrapInstance
+except ImportError:
+    try:
+        from PySide import QtCore, QtGui
+        from shiboken import wrapInstance
+        QtWidgets = QtGui
+    except ImportError:
+        QtCore = QtGui = QtWidgets = wrapInstance = None
+
+import maya.cmds as mc
+import maya.OpenMayaUI as OpenMayaUI
+
+import tween_machine
+
+
+LOG = logging.getLogger(__name__)
+AVAILABLE = QtWidgets is not None
+
+# Without Qt the classes below are still defined, but can't be instantiated
+_QWidget = QtWidgets.QWidget if AVAILABLE else object
+
+
+def maya_widget(name):
+    """
+    Return the QWidget of a Maya layout or control
+    """
+    pointer = OpenMayaUI.MQtUtil.findLayout(name) or OpenMayaUI.MQtUtil.findControl(name)
+    if pointer is None:
+        raise RuntimeError("No Qt widget found for %s" % name)
+    return wrapInstance(int(pointer), QtWidgets.QWidget)
+
+
+class TMButtonStrip(_QWidget):
+    """
+    A row of tween buttons painted as one widget.  Each button fills the
+    middle eight tenths of an equal slot, as the iconTextButtons of
+    TMButtonRowUI do, and clicks are mapped to a button from their position
+    """
+
+    margin = 0.1
+
+    def __init__(self, buttons, callback, parent=None):
+        QtWidgets.QWidget.__init__(self, parent)
+        self.buttons = tuple(buttons)
+        self.callback = callback
+        self._hover = -1
+        self.setMouseTracking(True)
+        self.setFixedHeight(tween_machine.SETTINGS["button_height"])
+
+    def button_rect(self, index):
+        """
+        Return the rectangle of the button at index
+        """
+        slot = self.width() / float(len(self.buttons))
+        return QtCore.QRectF(slot * (index + self.margin), 0,
+                             slot * (1.0 - 2 * self.margin), self.height())
+
+    def button_at(self, x):
+        """
+        Return the index of the button at the given x position, or -1
+        """
+        if not self.buttons or self.width() <= 0:
+            return -1
+        slot = self.width() / float(len(self.buttons))
+        index = int(x // slot)
+        offset = x / slot - index
+        if not 0 <= index < len(self.buttons):
+            return -1
+        if offset < self.margin or offset > 1.0 - self.margin:
+            return -1
+        return index
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        for index, button in enumerate(self.buttons):
+            color = QtGui.QColor.fromRgbF(*button.color)
+            if index == self._hover:
+                color = color.lighter(130)
+            painter.fillRect(self.button_rect(index), color)
+        painter.end()
+
+    def mouseMoveEvent(self, event):
+        hover = self.button_at(event.pos().x())
+        if hover != self._hover:
+            self._hover = hover
+            self.update()
+
+    def leaveEvent(self, event):
+        self._hover = -1
+        self.update()
+
+    def mouseReleaseEvent(self, event):
+        index = self.button_at(event.pos().x())
+        if index >= 0 and event.button() == QtCore.Qt.LeftButton:
+            self.callback(self.buttons[index].value)
+
+
+class TMQtSetRow(_QWidget):
+    """
+    Qt counterpart of TMSetUI: a check box, label, field, slider and painted
+    button strip for one set, with the same interface as TMSetUI so the
+    window can treat both kinds of row alike.  The slider works in tenths so
+    that the field keeps its precision
+    """
+
+    scale = 10.0
+
+    def __init__(self, name, data=None, button_data=None, parent=None):
+        QtWidgets.QWidget.__init__(self, parent)
+        settings = tween_machine.SETTINGS
+        self.data = data or tween_machine.TMSet()
+        self.name = name
+        self._snapshot = None
+        layout = QtWidgets.QGridLayout(self)
+        layout.setContentsMargins(5, 0, 5, 2)
+        layout.setHorizontalSpacing(5)
+        layout.setVerticalSpacing(2)
+        self.checkbox = QtWidgets.QCheckBox(self)
+        self.checkbox.setVisible(self.data.nodes is not None)
+        self.label = QtWidgets.QLabel(name, self)
+        self.label.setFixedWidth(90)
+        self.label.setVisible(settings["show_label"])
+        self.field = QtWidgets.QDoubleSpinBox(self)
+        self.field.setDecimals(1)
+        self.field.setRange(-100, 100)
+        self.field.setFixedWidth(50)
+        self.field.setButtonSymbols(QtWidgets.QAbstractSpinBox.NoButtons)
+        self.slider = QtWidgets.QSlider(QtCore.Qt.Horizontal, self)
+        self.slider.setRange(int(-100 * self.scale), int(100 * self.scale))
+        self.strip = TMButtonStrip(tween_machine.TMButtonRowData(
+            button_data or settings["default_button_data"]), self.tween_button, self)
+        layout.addWidget(self.checkbox, 0, 0)
+        layout.addWidget(self.label, 0, 1)
+        layout.addWidget(self.field, 0, 2)
+        layout.addWidget(self.slider, 0, 3)
+        layout.addWidget(self.strip, 1, 3)
+        layout.setColumnStretch(3, 1)
+        self.slider.valueChanged.connect(self._slider_changed)
+        self.slider.sliderReleased.connect(
+            lambda: self.tween_slider(self.slider.value() / self.scale))
+        self.field.editingFinished.connect(
+            lambda: self.tween_field(self.field.value()))
+        self.set_show_mode(settings["show_mode"])
+        if settings["use_overshoot"]:
+            self.toggle_overshoot()
+
+    def checked(self):
+        """
+        Return whether the set's check box is on
+        """
+        return self.checkbox.isChecked()
+
+    def bias(self):
+        """
+        Return the bias set by the field, from 0 to 1
+        """
+        return (self.field.value() + 100) / 200.0
+
+    def tween(self, value):
+        """
+        Tween the set at the given slider value
+        """
+        bias = (value + 100) / 200.0
+        if tween_machine.SETTINGS["key_mode"] == "selected_keys":
+            snapshot = self._snapshot or tween_machine.TMKeySnapshot.capture(self.data.nodes)
+            self._snapshot = None
+            snapshot.apply(tween_machine.get_easing(self.data.easing)(bias))
+        else:
+            self.data.tween(bias)
+
+    def _slider_changed(self, position):
+        """
+        Follow the slider while it's dragged; a click that moves the slider
+        without a drag tweens straight away
+        """
+        value = position / self.scale
+        self.update_field(value)
+        if not self.slider.isSliderDown():
+            self.tween(value)
+        elif tween_machine.SETTINGS["key_mode"] == "selected_keys":
+            if self._snapshot is None:
+                self._snapshot = tween_machine.TMKeySnapshot.capture(self.data.nodes)
+            self._snapshot.apply(tween_machine.get_easing(self.data.easing)(
+                (value + 100) / 200.0), live=True)
+
+    def tween_field(self, value):
+        """
+        Callback when the field value is changed
+        """
+        self._set_slider(value)
+        self.tween(value)
+
+    def tween_slider(self, value):
+        """
+        Callback when the slider is released
+        """
+        self.update_field(value)
+        self.tween(value)
+
+    def tween_button(self, value):
+        """
+        Callback when a button is clicked
+        """
+        self.update_field(value)
+        self.tween_field(value)
+
+    def update_field(self, value):
+        """
+        Update the field without tweening
+        """
+        self.field.blockSignals(True)
+        self.field.setValue(value)
+        self.field.blockSignals(False)
+
+    def _set_slider(self, value):
+        self.slider.blockSignals(True)
+        self.slider.setValue(int(round(value * self.scale)))
+        self.slider.blockSignals(False)
+
+    def set_show_mode(self, mode):
+        """
+        Set the show mode for this row
+        """
+        self.slider.setVisible(mode in ["both", "slider"])
+        self.strip.setVisible(mode in ["both", "buttons"])
+
+    def set_label_visibility(self, mode):
+        """
+        Set the visibility of the set's label
+        """
+        self.label.setVisible(mode)
+
+    def toggle_overshoot(self):
+        """
+        Toggle the overshoot setting
+        """
+        limit = 150 if self.field.maximum() == 100 else 100
+        value = max(-limit, min(limit, self.field.value()))
+        self.slider.blockSignals(True)
+        self.slider.setRange(int(-limit * self.scale), int(limit * self.scale))
+        self.slider.blockSignals(False)
+        self.field.setRange(-limit, limit)
+        self.update_field(value)
+        self._set_slider(value)
+
+
+def add_rows(layout, sets):
+    """
+    Add a Qt row for each TMSet to a Maya layout, inside one container
+    widget, and return the rows
+    """
+    parent = maya_widget(layout)
+    container = QtWidgets.QWidget(parent)
+    column = QtWidgets.QVBoxLayout(container)
+    column.setContentsMargins(0, 0, 0, 0)
+    column.setSpacing(0)
+    rows = []
+    for set_ in sets:
+        row = TMQtSetRow(set_.name, data=set_, parent=container)
+        column.addWidget(row)
+        rows.append(row)
+    parent.layout().addWidget(container)
+    return rows
+
+
+# -------------------------------------------------------------------------
+# --------------------------------------------------------- Benchmark -----
+
+def memory_usage():
+    """
+    Return the resident memory of the Maya process in bytes, or None where it
+    can't be measured
+    """
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _benchmark_build(kind, count):
+    """
+    Build count rows of the given kind ("maya" or "qt") in a new window and
+    return the build time, the number of Maya controls created and the
+    change in memory
+    """
+    window = mc.window(title="tweenMachine benchmark", width=400, height=400)
+    mc.scrollLayout(childResizable=True)
+    column = mc.columnLayout(adjustableColumn=True)
+    mc.showWindow(window)
+    QtWidgets.QApplication.processEvents()
+    sets = []
+    for index in range(count):
+        set_ = tween_machine.TMSet()
+        set_.name = "set%d" % index
+        set_.nodes = []
+        sets.append(set_)
+    controls = len(mc.lsUI(controls=True) or [])
+    memory = memory_usage()
+    start = timer.time()
+    if kind == "qt":
+        add_rows(column, sets)
+    else:
+        for set_ in sets:
+            tween_machine.TMSetUI(column, set_.name, data=set_)
+    QtWidgets.QApplication.processEvents()
+    seconds = timer.time() - start
+    result = {"rows": kind, "sets": count, "seconds": seconds,
+              "controls": len(mc.lsUI(controls=True) or []) - controls,
+              "memory": None}
+    if memory is not None:
+        result["memory"] = memory_usage() - memory
+    mc.deleteUI(window)
+    return result
+
+
+def benchmark(counts=(100, 1000)):
+    """
+    Compare building Maya-widget rows with building Qt rows for the given
+    numbers of sets, logging and returning one result per build.  Memory is
+    the change in the process's resident memory, so it's only indicative
+    """
+    if not AVAILABLE:
+        raise RuntimeError("Qt is not available")
+    results = []
+    for count in counts:
+        for kind in ("maya", "qt"):
+            result = _benchmark_build(kind, count)
+            results.append(result)
+            LOG.info("%4s rows x %5d: %7.3fs, %6d controls, %s",
+                     kind, count, result["seconds"], result["controls"],
+                     "n/a" if result["memory"] is None
+                     else "%.1f MB" % (result["memory"] / 1048576.0))
+    return results
@@ -0,0 +1,171 @@
+"""
+maya_stub.py
+
+A stand-in for the maya package, so that the tweenMachine modules can be
+imported and their data handling tested without Maya.  maya.cmds is backed by
+a small in-memory scene of nodes and string attributes; everything else in
+maya (the API modules, maya.mel, ...) accepts any attribute or call and does
+nothing.
+"""
+
+# Built-in
+import copy
+import fnmatch
+import os
+import sys
+import types
+
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          "python")
+
+
+class _StubType(type):
+    """
+    Metaclass for stub classes: any missing class attribute is another stub
+    class, so stubs can be subclassed, called and chained
+    """
+
+    def __getattr__(cls, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _StubType(name, (_StubBase,), {})
+
+
+def _stub_getattr(self, name):
+    if name.startswith("__"):
+        raise AttributeError(name)
+    return _StubType(name, (_StubBase,), {})
+
+
+_StubBase = _StubType("_StubBase", (object,), {
+    "__init__": lambda self, *args, **kwds: None,
+    "__getattr__": _stub_getattr,
+})
+
+
+class StubModule(types.ModuleType):
+    """
+    Module whose missing attributes are stubs
+    """
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _StubType(name, (_StubBase,), {})
+
+
+class FakeCmds(types.ModuleType):
+    """
+    maya.cmds over an in-memory scene.  nodes maps each node name to a dict
+    of its attribute values; scenes maps file paths to saved node dicts for
+    file -open and file -save.  Commands that aren't implemented return None
+    """
+
+    def __init__(self):
+        types.ModuleType.__init__(self, "maya.cmds")
+        self.reset()
+
+    def reset(self):
+        self.nodes = {}
+        self.option_vars = {}
+        self.scenes = {}
+        self.scene_name = None
+        self.selection = []
+        self.batch = True
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return lambda *args, **kwds: None
+
+    # Scene
+
+    def ls(self, *patterns, **kwds):
+        if kwds.get("sl") or kwds.get("selection"):
+            return list(self.selection)
+        names = []
+        for pattern in patterns:
+            if isinstance(pattern, (list, tuple)):
+                names += self.ls(*pattern)
+            else:
+                names += sorted(fnmatch.filter(self.nodes, pattern))
+        return names
+
+    def objExists(self, name):
+        return name.split(".")[0] in self.nodes
+
+    def createNode(self, type_, name=None, **kwds):
+        name = name or type_ + "1"
+        self.nodes[name] = {}
+        return name
+
+    def addAttr(self, node, longName=None, **kwds):
+        self.nodes[node].setdefault(longName, None)
+
+    def getAttr(self, plug):
+        node, attr = plug.split(".", 1)
+        return self.nodes[node][attr]
+
+    def setAttr(self, plug, value, **kwds):
+        node, attr = plug.split(".", 1)
+        self.nodes[node][attr] = value
+
+    def delete(self, *names):
+        for name in names:
+            self.nodes.pop(name, None)
+
+    def select(self, *names, **kwds):
+        self.selection = [] if kwds.get("clear") else list(names)
+
+    def listRelatives(self, *args, **kwds):
+        return []
+
+    def file(self, path=None, open=False, rename=None, save=False, **kwds):
+        if open:
+            self.nodes = copy.deepcopy(self.scenes[path])
+            self.scene_name = path
+        if rename:
+            self.scene_name = rename
+        if save:
+            self.scenes[self.scene_name] = copy.deepcopy(self.nodes)
+
+    # Preferences and environment
+
+    def optionVar(self, exists=None, q=None, stringValue=None, **kwds):
+        if exists is not None:
+            return exists in self.option_vars
+        if q is not None:
+            return self.option_vars[q]
+        if stringValue is not None:
+            self.option_vars[stringValue[0]] = stringValue[1]
+
+    def about(self, version=False, batch=False, **kwds):
+        if batch:
+            return self.batch
+        if version:
+            return "2018"
+
+
+def install():
+    """
+    Register the stub maya modules and put the tweenMachine modules on the
+    path.  Returns the FakeCmds module
+    """
+    if "maya.cmds" in sys.modules and isinstance(sys.modules["maya.cmds"], FakeCmds):
+        return sys.modules["maya.cmds"]
+    cmds = FakeCmds()
+    maya = StubModule("maya")
+    api = StubModule("maya.api")
+    modules = {"maya": maya, "maya.cmds": cmds, "maya.api": api}
+    for name in ("maya.mel", "maya.standalone", "maya.OpenMayaUI",
+                 "maya.api.OpenMaya", "maya.api.OpenMayaAnim"):
+        modules[name] = StubModule(name)
+    for name, module in modules.items():
+        sys.modules[name] = module
+        if "." in name:
+            parent, _, child = name.rpartition(".")
+            setattr(modules[parent], child, module)
+    if PYTHON_DIR not in sys.path:
+        sys.path.insert(0, PYTHON_DIR)
+    return cmds
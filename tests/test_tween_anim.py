@@ -0,0 +1,176 @@
+"""
+Tests for the Maya-free .anim/.atom tweening
+"""
+
+# Built-in
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import maya_stub
+
+if maya_stub.PYTHON_DIR not in sys.path:
+    sys.path.insert(0, maya_stub.PYTHON_DIR)
+
+import tween_anim
+
+
+ANIM_FILE = """animVersion 1.1;
+mayaVersion 2018;
+timeUnit film;
+linearUnit cm;
+angularUnit deg;
+startTime 0;
+endTime 10;
+anim translate.translateX translateX ball 0 0 0;
+animData {
+  input time;
+  output linear;
+  weighted 0;
+  preInfinity constant;
+  postInfinity constant;
+  keys {
+    0 0 linear linear 1 1 0;
+    10 10 spline spline 1 1 0;
+  }
+}
+anim translate.translateY translateY ball 0 0 1;
+animData {
+  input time;
+  output linear;
+  weighted 0;
+  preInfinity constant;
+  postInfinity constant;
+  keys {
+    0 2 fixed fixed 1 1 0 45 1 30 1;
+    5 4 auto auto 1 1 0;
+    10 -2 step step 1 1 0;
+  }
+}
+"""
+
+
+def key_lines(text, attribute):
+    """
+    Return the stripped key lines of the curve for the given attribute
+    """
+    lines = []
+    reading = False
+    current = None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("anim "):
+            current = stripped.split()[2]
+        elif stripped.startswith("keys"):
+            reading = current == attribute
+        elif stripped.startswith("}"):
+            reading = False
+        elif reading:
+            lines.append(stripped)
+    return lines
+
+
+def tween_text(text, frames, bias, **kwds):
+    """
+    Run tween_stream over a string and return the output and the counts
+    """
+    target = StringIO()
+    counts = tween_anim.tween_stream(StringIO(text), target, frames, bias, **kwds)
+    return target.getvalue(), counts
+
+
+class TestParse(unittest.TestCase):
+
+    def test_key_fields(self):
+        key = tween_anim.TMAnimKey.parse("    10 5.5 linear spline 1 1 0;\n")
+        self.assertEqual(key.time, 10)
+        self.assertEqual(key.value, 5.5)
+        self.assertEqual(key.in_tangent, "linear")
+        self.assertEqual(key.out_tangent, "spline")
+
+    def test_extra_fields_before_tangents(self):
+        key = tween_anim.TMAnimKey.parse("10 5 0 auto step 1 1 0;")
+        self.assertEqual(key.in_tangent, "auto")
+        self.assertEqual(key.out_tangent, "step")
+
+    def test_format_number(self):
+        self.assertEqual(tween_anim.format_number(5.0), "5")
+        self.assertEqual(tween_anim.format_number(0.25), "0.25")
+        self.assertEqual(tween_anim.format_number(-0.0000001), "0")
+
+
+class TestStream(unittest.TestCase):
+
+    def test_round_trip_unchanged(self):
+        output, counts = tween_text(ANIM_FILE, [], 0.5)
+        self.assertEqual(output, ANIM_FILE)
+        self.assertEqual(counts, (0, 0))
+
+    def test_round_trip_outside_keys(self):
+        output, counts = tween_text(ANIM_FILE, [-5, 20], 0.5)
+        self.assertEqual(output, ANIM_FILE)
+        self.assertEqual(counts, (0, 0))
+
+    def test_inserts_key(self):
+        output, counts = tween_text(ANIM_FILE, [2.5], 0.5,
+                                    attributes=["translateX"])
+        self.assertEqual(counts, (1, 1))
+        self.assertEqual(key_lines(output, "translateX"), [
+            "0 0 linear linear 1 1 0;",
+            "2.5 5 linear spline 1 1 0;",
+            "10 10 spline spline 1 1 0;"])
+        self.assertEqual(key_lines(output, "translateY"),
+                         key_lines(ANIM_FILE, "translateY"))
+
+    def test_replaces_key(self):
+        output, counts = tween_text(ANIM_FILE, [5], 0.25,
+                                    attributes=["translateY"])
+        self.assertEqual(counts, (1, 1))
+        keys = key_lines(output, "translateY")
+        self.assertEqual(len(keys), 3)
+        # A fixed previous key falls back to the default tangents and drops
+        # the fixed angle and weight fields
+        self.assertEqual(keys[1], "5 1 auto auto 1 1 0;")
+
+    def test_later_frames_see_new_keys(self):
+        output, counts = tween_text(ANIM_FILE, [5, 7.5], 0.5,
+                                    attributes=["translateX"])
+        self.assertEqual(counts, (1, 2))
+        values = [line.split()[:2] for line in key_lines(output, "translateX")]
+        self.assertEqual(values, [["0", "0"], ["5", "5"], ["7.5", "7.5"], ["10", "10"]])
+
+    def test_output_parses_again(self):
+        output, _ = tween_text(ANIM_FILE, [2.5, 7.5], 0.5)
+        again, counts = tween_text(output, [], 0.5)
+        self.assertEqual(again, output)
+        self.assertEqual(counts, (0, 0))
+
+
+class TestFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_tween_file(self):
+        source = os.path.join(self.directory, "ball.anim")
+        target = os.path.join(self.directory, "ball_tweened.anim")
+        with open(source, "w") as handle:
+            handle.write(ANIM_FILE)
+        self.assertEqual(tween_anim.tween_file(source, target, [2.5], 0.5), (2, 2))
+        with open(target) as handle:
+            output = handle.read()
+        self.assertEqual(output, tween_text(ANIM_FILE, [2.5], 0.5)[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
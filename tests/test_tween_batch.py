@@ -0,0 +1,83 @@
+"""
+Tests for the batch worker, run against the stub maya package
+"""
+
+# Built-in
+import json
+import os
+import tempfile
+import unittest
+
+import maya_stub
+
+cmds = maya_stub.install()
+
+import tween_batch
+import tween_machine
+
+
+STORED_DATA = """<tweenMachineData>
+    <buttons height="10"><button rgb="0.6 0.6 0.6" value="0" /></buttons>
+    <groups>
+        <group name="Body" index="0">
+            <set name="Arms" index="0">l_arm_ctrl r_arm_ctrl</set>
+        </group>
+    </groups>
+</tweenMachineData>"""
+
+
+class TestWorker(unittest.TestCase):
+
+    def setUp(self):
+        cmds.reset()
+        cmds.scenes["/shots/010/anim.ma"] = {"tweenMachineData": {"data": STORED_DATA}}
+        self.calls = []
+        self._tween = tween_machine.tween
+        tween_machine.tween = lambda bias, nodes, **kwds: self.calls.append(
+            (bias, nodes, kwds)) or len(nodes)
+        tween_machine.TMDataService._instance = None
+
+    def tearDown(self):
+        tween_machine.tween = self._tween
+
+    def work(self, **job):
+        job.setdefault("scene", "/shots/010/anim.ma")
+        job.setdefault("output", "/shots/010/anim_tween.ma")
+        handle, path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(handle, "w") as job_file:
+            json.dump(job, job_file)
+        try:
+            return tween_batch.work(path)
+        finally:
+            os.remove(path)
+
+    def test_resolves_stored_set(self):
+        self.assertEqual(self.work(sets=["Body/Arms"], frames=[7, 15], bias=[0.25, 0.5]), 0)
+        self.assertEqual([(bias, nodes) for bias, nodes, _ in self.calls],
+                         [(0.25, ["l_arm_ctrl", "r_arm_ctrl"]),
+                          (0.5, ["l_arm_ctrl", "r_arm_ctrl"])])
+        self.assertEqual([kwds["time"] for _, _, kwds in self.calls], [7, 15])
+
+    def test_resolves_stored_group(self):
+        self.assertEqual(self.work(groups=["Body"], frames=[7]), 0)
+        self.assertEqual(self.calls[0][1], ["l_arm_ctrl", "r_arm_ctrl"])
+
+    def test_keeps_stored_data(self):
+        self.work(frames=[7])
+        saved = cmds.scenes["/shots/010/anim_tween.ma"]["tweenMachineData"]["data"]
+        self.assertEqual(saved, STORED_DATA)
+
+    def test_pins_settings(self):
+        tween_machine.SETTINGS.pin(rotation_mode="quaternion", tween_space="world",
+                                   use_special_tick=True)
+        self.work(sets=["Arms"], frames=[7], rotation="quaternion")
+        self.assertEqual(tween_machine.SETTINGS["rotation_mode"], "quaternion")
+        self.assertEqual(tween_machine.SETTINGS["tween_space"], "local")
+        self.assertEqual(tween_machine.SETTINGS["use_special_tick"], False)
+
+    def test_missing_set_fails(self):
+        self.assertEqual(self.work(sets=["Legs"], frames=[7]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+Tests for bringing the curve cache up to date from the curve journal, run
+against the stub maya package with a small set of fake anim curves
+"""
+
+# Built-in
+import unittest
+
+import maya_stub
+
+cmds = maya_stub.install()
+
+import tween_machine
+
+
+class FakeCurves(object):
+    """
+    keyframe and keyTangent queries over a dictionary of curves, each a list
+    of [time, value, in tangent, out tangent] keys, counting the queries
+    """
+
+    def __init__(self, curves):
+        self.curves = curves
+        self.queries = 0
+
+    def _keys(self, curve, index=None, **kwds):
+        keys = self.curves[curve]
+        if index is not None:
+            keys = keys[index[0]:index[1] + 1]
+        self.queries += 1
+        return keys
+
+    def keyframe(self, curve, timeChange=False, valueChange=False, breakdown=False,
+                 tickDrawSpecial=False, **kwds):
+        if breakdown:
+            return [key[0] for key in self._keys(curve) if len(key) > 4]
+        if tickDrawSpecial:
+            return [False for key in self._keys(curve)]
+        return [key[0 if timeChange else 1] for key in self._keys(curve, **kwds)]
+
+    def keyTangent(self, curve, itt=False, ott=False, **kwds):
+        return [key[2 if itt else 3] for key in self._keys(curve, **kwds)]
+
+
+class TestCurveCacheSync(unittest.TestCase):
+
+    def setUp(self):
+        cmds.reset()
+        self.fake = FakeCurves({
+            "arm_tx": [[0.0, 0.0, "auto", "auto"], [10.0, 5.0, "auto", "auto"],
+                       [20.0, 2.0, "auto", "auto"]],
+            "arm_ty": [[0.0, 1.0, "linear", "linear"], [10.0, 3.0, "linear", "linear"]],
+        })
+        cmds.keyframe = self.fake.keyframe
+        cmds.keyTangent = self.fake.keyTangent
+        self.journal = tween_machine.TMCurveJournal.instance()
+        self.journal.drain()
+        self.cache = tween_machine.TMCurveCache()
+        for curve in ("arm_tx", "arm_ty"):
+            self.cache.keys(curve)
+
+    def tearDown(self):
+        del cmds.keyframe
+        del cmds.keyTangent
+        self.journal.drain()
+
+    def test_patches_edited_keys(self):
+        self.fake.curves["arm_tx"][1][1:] = [7.5, "spline", "flat"]
+        self.journal.mark("arm_tx", [1])
+        queries = self.fake.queries
+        self.cache.sync()
+        times, values, in_tans, out_tans = self.cache.keys("arm_tx")
+        self.assertEqual(list(values), [0.0, 7.5, 2.0])
+        self.assertEqual((in_tans, out_tans),
+                         (["auto", "spline", "auto"], ["auto", "flat", "auto"]))
+        # Only the edited span was queried, and nothing was read again
+        self.assertEqual(self.fake.queries - queries, 4)
+        self.assertEqual((self.cache.stats["patches"], self.cache.stats["drops"]), (1, 0))
+
+    def test_drops_moved_keys(self):
+        self.fake.curves["arm_tx"][1][0] = 12.0
+        self.journal.mark("arm_tx", [1])
+        self.cache.sync()
+        self.assertEqual(self.cache.stats["drops"], 1)
+        self.assertEqual(list(self.cache.keys("arm_tx")[0]), [0.0, 12.0, 20.0])
+
+    def test_drops_whole_curve_edits(self):
+        self.fake.curves["arm_ty"].append([20.0, 6.0, "linear", "linear"])
+        self.journal.mark("arm_ty", [0])
+        self.journal.mark("arm_ty")
+        # An index past the cached keys can't be patched either
+        self.journal.mark("arm_tx", [3])
+        self.cache.sync()
+        self.assertEqual(self.cache.stats["drops"], 2)
+        self.assertEqual(list(self.cache.keys("arm_ty")[0]), [0.0, 10.0, 20.0])
+
+    def test_reset_drops_everything(self):
+        self.journal.reset()
+        self.cache.sync()
+        self.assertEqual(self.cache.stats["drops"], 2)
+        reads = self.cache.stats["reads"]
+        self.cache.keys("arm_ty")
+        self.assertEqual(self.cache.stats["reads"], reads + 1)
+
+    def test_untouched_curves_are_kept(self):
+        self.journal.mark("leg_tx")
+        self.cache.sync()
+        hits = self.cache.stats["hits"]
+        self.cache.keys("arm_tx")
+        self.assertEqual(self.cache.stats["hits"], hits + 1)
+        self.assertEqual(self.cache.stats["drops"], 0)
+
+    def test_edits_drop_key_roles(self):
+        self.fake.curves["arm_tx"][1].append("breakdown")
+        self.assertEqual(self.cache.roles("arm_tx")[0], frozenset([10.0]))
+        self.fake.curves["arm_tx"][1].pop()
+        self.assertEqual(self.cache.roles("arm_tx")[0], frozenset([10.0]))
+        self.journal.mark("arm_tx", [1])
+        self.cache.sync()
+        self.assertEqual(self.cache.roles("arm_tx")[0], frozenset())
+
+
+if __name__ == "__main__":
+    unittest.main()
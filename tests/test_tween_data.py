@@ -0,0 +1,274 @@
+"""
+Tests for reading and writing the tweenMachineData node, run against the stub
+maya package
+"""
+
+# Built-in
+import unittest
+import xml.etree.ElementTree as etree
+
+import maya_stub
+
+cmds = maya_stub.install()
+
+import tween_machine
+
+
+STORED_DATA = """<tweenMachineData>
+    <buttons height="10"><button rgb="0.6 0.6 0.6" value="0" /></buttons>
+    <groups>
+        <group name="Body" index="0">
+            <set name="Arms" index="0" easing="ease_in">l_arm_ctrl r_arm_ctrl</set>
+            <set name="Legs" index="1">l_leg_ctrl r_leg_ctrl</set>
+        </group>
+        <group name="Face" index="1" />
+    </groups>
+    <notes author="anim">Keep the arcs</notes>
+</tweenMachineData>"""
+
+
+def stored_root():
+    """
+    Return the XML currently stored on the data node
+    """
+    return etree.XML(cmds.getAttr("tweenMachineData.data"))
+
+
+class DataTestCase(unittest.TestCase):
+
+    def setUp(self):
+        cmds.reset()
+        cmds.nodes["tweenMachineData"] = {"data": STORED_DATA}
+        tween_machine.TMDataService._instance = None
+
+    def reload(self):
+        """
+        Drop the cached data, as a scene change does, and read it again
+        """
+        service = tween_machine.TMDataService.instance()
+        service.invalidate()
+        return service.get()
+
+    def assert_groups(self, data):
+        self.assertEqual([(group.name, [(set_.name, set_.nodes, set_.easing)
+                                        for set_ in group.sets])
+                          for group in data.groups],
+                         [("Body", [("Arms", ["l_arm_ctrl", "r_arm_ctrl"], "ease_in"),
+                                    ("Legs", ["l_leg_ctrl", "r_leg_ctrl"], None)]),
+                          ("Face", [])])
+
+
+class TestDataService(DataTestCase):
+
+    def test_reads_stored_data(self):
+        self.assert_groups(tween_machine.TMDataService.instance().get())
+        self.assertEqual(cmds.getAttr("tweenMachineData.data"), STORED_DATA)
+
+    def test_round_trip(self):
+        data = tween_machine.TMDataService.instance().get()
+        data.save_data()
+        data = self.reload()
+        self.assert_groups(data)
+        notes = stored_root().find("notes")
+        self.assertEqual((notes.get("author"), notes.text), ("anim", "Keep the arcs"))
+
+    def test_round_trip_keeps_edits(self):
+        data = tween_machine.TMDataService.instance().get()
+        data.groups[1].add_set("Brows", 0, ["l_brow_ctrl"])
+        data = self.reload()
+        self.assertEqual([(set_.name, set_.nodes) for set_ in data.groups[1].sets],
+                         [("Brows", ["l_brow_ctrl"])])
+
+    def test_reload_drops_node_names(self):
+        data = tween_machine.TMDataService.instance().get()
+        data.groups[0].sets[0].set_nodes(["spine_ctrl"])
+        table = data.node_table
+        data = self.reload()
+        self.assertIsNot(data.node_table, table)
+        self.assertNotIn("l_arm_ctrl", data.node_table.ids)
+        self.assertEqual(len(data.node_table), 3)
+        self.assertEqual(data.groups[0].sets[0].nodes, ["spine_ctrl"])
+
+    def test_new_scene_gets_default_data(self):
+        cmds.reset()
+        data = tween_machine.TMDataService.instance().get()
+        self.assertEqual(data.groups, [])
+        self.assertEqual(stored_root().tag, "tweenMachineData")
+
+
+class TestPoseStorage(DataTestCase):
+
+    def test_round_trip(self):
+        pose = tween_machine.TMPose("contact", nodes=["l_foot_ctrl"],
+                                    attrs=["translateY", "rotateX"],
+                                    plugs=[0, 0, 0, 1], values=[1.5, -20.0],
+                                    time=12.0)
+        capture = tween_machine.TMPose.capture
+        tween_machine.TMPose.capture = classmethod(lambda cls, name, nodes=None: pose)
+        try:
+            tween_machine.TMDataService.instance().get().add_pose("contact")
+        finally:
+            tween_machine.TMPose.capture = capture
+        data = self.reload()
+        self.assert_groups(data)
+        loaded = data.poses["contact"]
+        self.assertEqual(loaded.lookup(), {"l_foot_ctrl.translateY": 1.5,
+                                           "l_foot_ctrl.rotateX": -20.0})
+        self.assertEqual(loaded.time, 12.0)
+
+    def test_remove_round_trip(self):
+        data = tween_machine.TMDataService.instance().get()
+        data.add_pose("empty", nodes=[])
+        data.remove_pose("empty")
+        self.assertEqual(self.reload().poses, {})
+
+
+class TestPoseFrameStorage(DataTestCase):
+
+    def test_round_trip(self):
+        data = tween_machine.TMDataService.instance().get()
+        data.set_pose_frames([24, 1, 12.5, 12.5])
+        data = self.reload()
+        self.assert_groups(data)
+        self.assertEqual(data.pose_frames, [1.0, 12.5, 24.0])
+
+    def test_clear_round_trip(self):
+        data = tween_machine.TMDataService.instance().get()
+        data.set_pose_frames([1, 24])
+        data.set_pose_frames([])
+        data = self.reload()
+        self.assertEqual(data.pose_frames, [])
+        self.assertIsNone(stored_root().find("poses").get("frames"))
+
+    def test_no_frames_stored(self):
+        self.assertEqual(tween_machine.TMDataService.instance().get().pose_frames, [])
+
+
+class TestPrefixIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = tween_machine.TMPrefixIndex()
+        for key, set_ in (("Arms", "a"), ("arm_ik", "b"), ("Legs", "c"), ("arms", "d")):
+            self.index.add(key, set_)
+
+    def test_prefix_search(self):
+        self.assertEqual(self.index.search("ARM"), set(["a", "b", "d"]))
+        self.assertEqual([key for key, _ in self.index.iter_prefix("")],
+                         ["arm_ik", "arms", "legs"])
+        self.assertEqual(self.index.search("x"), set())
+
+    def test_remove(self):
+        self.index.remove("arms", "a")
+        self.assertEqual(self.index.get("Arms"), set(["d"]))
+        self.index.remove("arms", "d")
+        self.assertEqual([key for key, _ in self.index.iter_prefix("arm")], ["arm_ik"])
+        # Removing a missing key does nothing
+        self.index.remove("hands", "a")
+
+
+class TestDataIndex(DataTestCase):
+
+    def setUp(self):
+        DataTestCase.setUp(self)
+        self.data = tween_machine.TMDataService.instance().get()
+        self.arms, self.legs = self.data.groups[0].sets
+
+    def search(self, text, mode="name", limit=None):
+        return [set_.name for set_ in self.data.index.search(text, mode, limit)]
+
+    def test_search(self):
+        self.assertEqual(self.search("l"), ["Legs"])
+        self.assertEqual(self.search(""), ["Arms", "Legs"])
+        self.assertEqual(self.search("", limit=1), ["Arms"])
+        self.assertEqual(self.search("r_", "member"), ["Arms", "Legs"])
+        self.assertEqual(self.data.index.sets_for_node("l_leg_ctrl"), set([self.legs]))
+
+    def test_namespaces(self):
+        self.data.groups[1].add_set("Brows", 0, ["face:l_brow_ctrl", "face:r_brow_ctrl"])
+        self.assertEqual(self.search("l_brow", "member"), ["Brows"])
+        self.assertEqual(self.search("face:l", "member"), ["Brows"])
+        self.assertEqual(self.search("FACE", "namespace"), ["Brows"])
+        self.assertEqual(len(self.data.index), 3)
+
+    def test_updates(self):
+        self.arms.set_name("Hands")
+        self.assertEqual(self.search("arm"), [])
+        self.assertEqual(self.search("hand"), ["Hands"])
+        self.arms.set_nodes(["l_hand_ctrl"])
+        self.assertEqual(self.search("l_arm", "member"), [])
+        self.assertEqual(self.search("l_hand", "member"), ["Hands"])
+        self.data.groups[0].remove_set("Legs")
+        self.assertEqual(self.search(""), ["Hands"])
+        self.data.remove_group("Body")
+        self.assertEqual(len(self.data.index), 0)
+
+
+PLAN_DATA = """<tweenMachineData>
+    <groups>
+        <group name="Body" index="0">
+            <set name="Arms" index="0">l_arm_ctrl<plan attributes="">l_arm_ctrl curve1 l_arm_ctrl.translateX 1-2
+l_arm_ctrl curve2 l_arm_ctrl.rotateX 3-4</plan><plan attributes="tx">l_arm_ctrl curve1 l_arm_ctrl.translateX 1-2</plan></set>
+        </group>
+    </groups>
+</tweenMachineData>"""
+
+
+class TestCurvePlanStorage(DataTestCase):
+
+    def setUp(self):
+        DataTestCase.setUp(self)
+        cmds.nodes["tweenMachineData"] = {"data": PLAN_DATA}
+
+    def test_reads_all_attribute_plan(self):
+        set_ = tween_machine.TMDataService.instance().get().groups[0].sets[0]
+        self.assertEqual(list(set_.plans), [()])
+        plan = set_.plans[()]
+        self.assertEqual(plan.entries["l_arm_ctrl"],
+                         [("curve1", "l_arm_ctrl.translateX", "1-2"),
+                          ("curve2", "l_arm_ctrl.rotateX", "3-4")])
+        self.assertEqual(plan.keyed, set(["curve1", "curve2"]))
+
+    def test_drops_attribute_plans(self):
+        data = tween_machine.TMDataService.instance().get()
+        data.save_data()
+        plans = stored_root().find("groups/group/set").findall("plan")
+        self.assertEqual([plan.get("attributes") for plan in plans], [""])
+
+    def test_limits_attribute_plans(self):
+        set_ = tween_machine.TMDataService.instance().get().groups[0].sets[0]
+        for index in range(20):
+            self.assertEqual(set_.curves(["attr%d" % index]), [])
+            self.assertLessEqual(len(set_.plans), set_.plan_limit)
+        self.assertIn((), set_.plans)
+        # Plans for channel box selections aren't stored
+        self.assertEqual(cmds.getAttr("tweenMachineData.data"), PLAN_DATA)
+
+
+class TestEasingStorage(DataTestCase):
+
+    def tearDown(self):
+        tween_machine.EASINGS.pop("snap", None)
+
+    def test_round_trip(self):
+        data = tween_machine.TMDataService.instance().get()
+        data.add_easing("snap", [0.0, 0.0, 0.5, 0.8, 1.0, 1.0])
+        # A new session only knows the curves stored in the scene
+        tween_machine.EASINGS.pop("snap")
+        data = self.reload()
+        self.assert_groups(data)
+        easing = tween_machine.get_easing("snap")
+        self.assertEqual(easing.name, "snap")
+        self.assertAlmostEqual(easing(0.5), 0.8)
+        self.assertEqual(easing.points, [0.0, 0.0, 0.5, 0.8, 1.0, 1.0])
+
+    def test_replace_round_trip(self):
+        data = tween_machine.TMDataService.instance().get()
+        data.add_easing("snap", [0.0, 0.0, 0.5, 0.8, 1.0, 1.0])
+        data.add_easing("snap", [0.0, 0.0, 0.5, 0.2, 1.0, 1.0])
+        self.reload()
+        self.assertEqual(len(stored_root().find("easing").findall("curve")), 1)
+        self.assertAlmostEqual(tween_machine.get_easing("snap")(0.5), 0.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
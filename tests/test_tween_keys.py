@@ -0,0 +1,158 @@
+"""
+Tests for tweening several sets at once, staggered chains and breakdown
+passes, run against the stub maya package with the curve queries and writes
+replaced
+"""
+
+# Built-in
+import unittest
+
+import maya_stub
+
+cmds = maya_stub.install()
+
+import tween_machine
+
+
+class FakeSet(object):
+    """
+    Stands in for a TMSet with a fixed list of curves
+    """
+
+    def __init__(self, nodes, curves, easing="linear"):
+        self.nodes = nodes
+        self.easing = easing
+        self._curves = curves
+
+    def curves(self, attributes=()):
+        return list(self._curves)
+
+
+class TweenTestCase(unittest.TestCase):
+
+    def setUp(self):
+        cmds.reset()
+        self.calls = []
+        self._tween_curves = tween_machine.tween_curves
+        tween_machine.tween_curves = lambda curves, bias, time=None, *args, **kwds: (
+            self.calls.append((list(curves), bias, time)) or len(curves))
+
+    def tearDown(self):
+        tween_machine.tween_curves = self._tween_curves
+
+
+class TestTweenSets(TweenTestCase):
+
+    def test_smallest_set_wins(self):
+        body = FakeSet(["arm", "hand", "spine"], ["arm_tx", "hand_tx", "spine_tx"])
+        hand = FakeSet(["hand"], ["hand_tx"])
+        self.assertEqual(tween_machine.tween_sets([(body, 0.25), (hand, 0.75)]), 3)
+        curves, bias, _ = self.calls[0]
+        self.assertEqual(dict(zip(curves, bias)),
+                         {"hand_tx": 0.75, "arm_tx": 0.25, "spine_tx": 0.25})
+
+    def test_equal_sets_keep_list_order(self):
+        left = FakeSet(["arm"], ["arm_tx"])
+        right = FakeSet(["hand"], ["arm_tx"])
+        tween_machine.tween_sets([(left, 0.2), (right, 0.8)])
+        self.assertEqual(list(self.calls[0][1]), [0.2])
+
+    def test_easing_and_empty_sets(self):
+        eased = FakeSet(["arm"], ["arm_tx"], easing="ease_in")
+        empty = FakeSet([], ["hand_tx"])
+        tween_machine.tween_sets([(eased, 0.5), (empty, 1.0)])
+        self.assertEqual(self.calls[0][0], ["arm_tx"])
+        self.assertAlmostEqual(self.calls[0][1][0], 0.25)
+        self.calls = []
+        self.assertEqual(tween_machine.tween_sets([(empty, 1.0)]), 0)
+        self.assertEqual(self.calls, [])
+
+
+class TestTweenStaggered(TweenTestCase):
+
+    def setUp(self):
+        TweenTestCase.setUp(self)
+        self._resolve_curves = tween_machine.resolve_curves
+        tween_machine.resolve_curves = lambda nodes, attributes=None: [
+            node + "_" + attr for node in nodes for attr in ("tx", "ry")]
+
+    def tearDown(self):
+        TweenTestCase.tearDown(self)
+        tween_machine.resolve_curves = self._resolve_curves
+
+    def test_offsets_and_falloff(self):
+        written = tween_machine.tween_staggered(0.8, ["tail1", "tail2", "tail3"],
+                                                offset=2, falloff=0.5,
+                                                easing="linear", time=10)
+        self.assertEqual(written, 6)
+        curves, biases, times = self.calls[0]
+        self.assertEqual(curves[:2], ["tail1_tx", "tail1_ry"])
+        self.assertEqual(list(times), [10, 10, 12, 12, 14, 14])
+        for bias, expected in zip(biases, [0.8, 0.8, 0.6, 0.6, 0.4, 0.4]):
+            self.assertAlmostEqual(bias, expected)
+
+    def test_offset_per_node(self):
+        tween_machine.tween_staggered(0.5, ["tail1", "tail2"], offset=[0, -3],
+                                      easing="ease_in", time=10)
+        _, biases, times = self.calls[0]
+        self.assertEqual(list(times), [10, 10, 7, 7])
+        self.assertEqual(list(biases), [0.25] * 4)
+
+    def test_no_nodes(self):
+        self.assertEqual(tween_machine.tween_staggered(0.5, [], time=10), 0)
+        self.assertEqual(self.calls, [])
+
+
+CURVE_KEYS = {
+    "arm_tx": ([0.0, 10.0, 13.0, 14.0], [0.0, 10.0, 4.0, 8.0],
+               ["spline"] * 4, ["linear"] * 4),
+    "arm_ty": ([0.0, 10.0], [2.0, 4.0], ["spline"] * 2, ["spline"] * 2),
+}
+
+
+class TestBreakdownIntervals(unittest.TestCase):
+
+    def setUp(self):
+        cmds.reset()
+        self.writes = []
+        self.patched = {"curve_keys": lambda curve: CURVE_KEYS[curve],
+                        "resolve_curves": lambda nodes, attributes=None: sorted(CURVE_KEYS),
+                        "write_keys": lambda keys, time, tangents=(): self.writes.append(
+                            (time, sorted(keys)))}
+        for name, function in list(self.patched.items()):
+            self.patched[name] = getattr(tween_machine, name)
+            setattr(tween_machine, name, function)
+        self.target = FakeSet(["arm"], [])
+
+    def tearDown(self):
+        for name, function in self.patched.items():
+            setattr(tween_machine, name, function)
+
+    def test_midpoints_snap_to_frames(self):
+        written = tween_machine.breakdown_intervals(self.target, 0.5, easing="linear")
+        # 13-14 has no whole frame between its keys
+        self.assertEqual(written, 3)
+        self.assertEqual(self.writes, [
+            (5.0, [("arm_tx", 5.0, "linear", "spline"),
+                   ("arm_ty", 3.0, "spline", "spline")]),
+            (12.0, [("arm_tx", 7.0, "linear", "spline")])])
+
+    def test_placement_without_snap(self):
+        tween_machine.breakdown_intervals(self.target, 0.0, placement=0.25,
+                                          snap=False, easing="linear")
+        self.assertEqual([time for time, _ in self.writes], [2.5, 10.75, 13.25])
+
+    def test_bias_per_interval(self):
+        bias = lambda time_prev, time_next: 1.0 if time_prev >= 10 else 0.0
+        tween_machine.breakdown_intervals(self.target, bias, easing="linear")
+        self.assertEqual([(time, [key[1] for key in keys]) for time, keys in self.writes],
+                         [(5.0, [0.0, 2.0]), (12.0, [4.0])])
+
+    def test_pose_neighbours(self):
+        tween_machine.breakdown_intervals(self.target, 0.5, easing="linear",
+                                          neighbours="poses", frames=[0, 14])
+        self.assertEqual(self.writes, [(7.0, [("arm_tx", 4.0, "linear", "spline")])])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+"""
+Tests for the Qt rows' logic that doesn't need a widget, run against the stub
+maya package with or without Qt installed
+"""
+
+# Built-in
+import unittest
+
+import maya_stub
+
+cmds = maya_stub.install()
+
+import tween_qt
+
+
+# The method itself, so it can run on a stand-in without building a widget
+button_at = tween_qt.TMButtonStrip.__dict__["button_at"]
+
+
+class FakeStrip(object):
+    """
+    Stands in for a TMButtonStrip of the given width
+    """
+
+    margin = tween_qt.TMButtonStrip.margin
+
+    def __init__(self, count, width):
+        self.buttons = tuple(range(count))
+        self._width = width
+
+    def width(self):
+        return self._width
+
+
+class TestButtonStrip(unittest.TestCase):
+
+    def test_hits_buttons(self):
+        strip = FakeStrip(4, 200)
+        # Slots are 50 wide, with buttons from 5 to 45 in each
+        self.assertEqual([button_at(strip, x) for x in (5, 25, 45, 55, 199 - 5)],
+                         [0, 0, 0, 1, 3])
+
+    def test_misses_gaps_and_outside(self):
+        strip = FakeStrip(4, 200)
+        self.assertEqual([button_at(strip, x) for x in (0, 4, 46, 50, 198, -10, 200, 250)],
+                         [-1] * 8)
+
+    def test_empty_strip(self):
+        self.assertEqual(button_at(FakeStrip(0, 200), 20), -1)
+        self.assertEqual(button_at(FakeStrip(3, 0), 0), -1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Tests for TweenSession's key snapshots, run against the stub maya package
+"""
+
+# Built-in
+import unittest
+
+import maya_stub
+
+cmds = maya_stub.install()
+
+import tween_machine
+
+
+def snapshot():
+    """
+    Return a curve snapshot with keys on frames 0 and 10
+    """
+    return ([0.0, 10.0], [0.0, 10.0], ["linear", "linear"], ["linear", "linear"])
+
+
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        cmds.reset()
+        self.session = tween_machine.TweenSession()
+        self.session._curves[(("arm_ctrl",), ())] = ["arm_ctrl_translateX"]
+        self.session._keys["arm_ctrl_translateX"] = snapshot()
+        self.session._keys["leg_ctrl_translateX"] = snapshot()
+
+    def test_later_tweens_see_new_keys(self):
+        self.session.tween(0.5, ["arm_ctrl"], 5)
+        self.session.tween(0.5, ["arm_ctrl"], 7.5)
+        times, values = self.session.keys("arm_ctrl_translateX")[:2]
+        self.assertEqual(times, [0.0, 5.0, 7.5, 10.0])
+        self.assertEqual(values, [0.0, 5.0, 7.5, 10.0])
+
+    def test_error_discards_pending_keys(self):
+        with self.assertRaises(ValueError):
+            with self.session as session:
+                record = session.tween(0.5, ["arm_ctrl"], 5)
+                self.assertEqual(record["keys"], 1)
+                raise ValueError("pipeline failed")
+        self.assertEqual(self.session._pending, {})
+        # The edited snapshot is read again, the untouched one is kept
+        self.assertNotIn("arm_ctrl_translateX", self.session._keys)
+        self.assertEqual(self.session._keys["leg_ctrl_translateX"], snapshot())
+
+    def test_failed_flush_discards_pending_keys(self):
+        self.session.tween(0.5, ["arm_ctrl"], 5)
+        write_keys = tween_machine.write_keys
+
+        def fail(*args):
+            raise RuntimeError("write failed")
+
+        tween_machine.write_keys = fail
+        try:
+            with self.assertRaises(RuntimeError):
+                self.session.flush()
+        finally:
+            tween_machine.write_keys = write_keys
+        self.assertEqual(self.session._pending, {})
+        self.assertNotIn("arm_ctrl_translateX", self.session._keys)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+Tests for which curves the quaternion rotation mode and world space tweens
+take over, run against the stub maya package.  The rotation and matrix math
+itself needs Maya's API types
+"""
+
+# Built-in
+from array import array
+import unittest
+
+import maya_stub
+
+cmds = maya_stub.install()
+
+import tween_machine
+
+
+class Slerped(Exception):
+    pass
+
+
+class TestQuaternionGrouping(unittest.TestCase):
+
+    def setUp(self):
+        cmds.reset()
+        self.slerped = []
+        self._getAttr = cmds.getAttr
+        cmds.getAttr = self.get_attr
+
+    def get_attr(self, plug):
+        # The rotate order is the first thing read for a node that is
+        # slerped; stop there, as the stub API types can't do the math
+        self.slerped.append(plug.split(".")[0])
+        raise Slerped()
+
+    def tearDown(self):
+        cmds.getAttr = self._getAttr
+
+    def slerp(self, plugs, times_next):
+        count = len(plugs)
+        values = array("d", range(count))
+        tween_machine.slerp_rotations(
+            ["curve%d" % index for index in range(count)], array("d", [0.0] * count),
+            array("d", times_next), array("d", [0.0] * count),
+            array("d", [90.0] * count), 0.5, values, plugs)
+        return list(values)
+
+    def test_incomplete_nodes_keep_their_blend(self):
+        values = self.slerp(["arm.rotateX", "arm.rotateY", "arm.translateZ", None],
+                            [10.0] * 4)
+        self.assertEqual(values, [0.0, 1.0, 2.0, 3.0])
+        self.assertEqual(self.slerped, [])
+
+    def test_mismatched_neighbours_keep_their_blend(self):
+        self.slerp(["leg.rotateX", "leg.rotateY", "leg.rotateZ"], [10.0, 10.0, 12.0])
+        self.assertEqual(self.slerped, [])
+
+    def test_complete_nodes_are_slerped(self):
+        with self.assertRaises(Slerped):
+            self.slerp(["leg.rotateZ", "leg.rotateY", "arm.rotateX", "leg.rotateX"],
+                       [10.0] * 4)
+        self.assertEqual(self.slerped, ["leg"])
+
+    def test_blend_neighbours_routes_rotation(self):
+        calls = []
+        slerp_rotations = tween_machine.slerp_rotations
+        tween_machine.slerp_rotations = lambda *args: calls.append(args)
+        try:
+            data = (array("d", [0.0]), array("d", [10.0]), array("d", [0.0]),
+                    array("d", [4.0]), [("arm_rx", "auto", "auto")])
+            tween_machine.blend_neighbours(["arm_rx"], data, 0.25)
+            self.assertEqual(calls, [])
+            keys = tween_machine.blend_neighbours(["arm_rx"], data, 0.25, "quaternion")
+        finally:
+            tween_machine.slerp_rotations = slerp_rotations
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(keys, [("arm_rx", 1.0, "auto", "auto")])
+
+
+class TestWorldSpaceRouting(unittest.TestCase):
+
+    def setUp(self):
+        cmds.reset()
+        self.writes = []
+        self.patched = {"curve_plugs": lambda curves: [
+                            {"ball_vis": "ball.visibility", "ball_sx": "ball.scaleX"}.get(curve)
+                            for curve in curves],
+                        "write_keys": lambda keys, time, tangents=(): self.writes.append(
+                            (time, list(keys)))}
+        for name, function in list(self.patched.items()):
+            self.patched[name] = getattr(tween_machine, name)
+            setattr(tween_machine, name, function)
+
+    def tearDown(self):
+        for name, function in self.patched.items():
+            setattr(tween_machine, name, function)
+
+    def test_other_channels_are_left_to_local_space(self):
+        curves = ["ball_vis", "ball_sx", "unconnected"]
+        self.assertEqual(tween_machine.world_space_keys(curves, 5, 0.5), ([], curves))
+
+    def test_world_and_local_keys_are_written_together(self):
+        calls = []
+        world_space_keys = tween_machine.world_space_keys
+        neighbour_data = tween_machine.neighbour_data
+        tween_machine.world_space_keys = lambda curves, time, bias: (
+            calls.append((list(curves), time, list(bias))) or
+            ([("ball_tx", 3.0, "auto", "auto")], ["ball_vis"]))
+        tween_machine.neighbour_data = lambda curves, time=None, frames=None: (
+            array("d", [0.0]), array("d", [10.0]), array("d", [0.0]),
+            array("d", [1.0]), [("ball_vis", "step", "step")])
+        try:
+            written = tween_machine.tween_curves(
+                ["ball_tx", "ball_vis"], array("d", [0.5, 0.25]), 5, reset_time=False,
+                rotation="euler", space="world", layer="all", tangents="types")
+        finally:
+            tween_machine.world_space_keys = world_space_keys
+            tween_machine.neighbour_data = neighbour_data
+        self.assertEqual(written, 2)
+        self.assertEqual(calls, [(["ball_tx", "ball_vis"], 5, [0.5, 0.25])])
+        # The remaining curve is blended with its own bias
+        self.assertEqual(self.writes, [(5, [("ball_tx", 3.0, "auto", "auto"),
+                                            ("ball_vis", 0.25, "step", "step")])])
+
+
+if __name__ == "__main__":
+    unittest.main()
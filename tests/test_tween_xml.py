@@ -0,0 +1,214 @@
+"""
+Tests for the MEL version's XML fast path (mel/tweenMachineXML.py), run
+against the stub maya package with a small in-memory DAG standing in for the
+API calls the module makes
+"""
+
+# Built-in
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import maya_stub
+
+cmds = maya_stub.install()
+
+MEL_DIR = os.path.join(os.path.dirname(maya_stub.PYTHON_DIR), "mel")
+if MEL_DIR not in sys.path:
+    sys.path.insert(0, MEL_DIR)
+
+import tweenMachineXML
+
+
+DATA_FILE = """<?xml version="1.0"?>
+<tmData>
+  <tmOptions>
+    <tmSliderVis>1</tmSliderVis>
+    <tmButtonVis>0</tmButtonVis>
+    <tmButtons id="2">
+      <tmButton><tmButtonRGB>0.6 0.6 0.6</tmButtonRGB><tmButtonValue>-75</tmButtonValue></tmButton>
+      <tmButton><tmButtonRGB>0.2 0.4 0.8</tmButtonRGB><tmButtonValue>25</tmButtonValue></tmButton>
+    </tmButtons>
+  </tmOptions>
+  <tmGroups>
+    <tmGroup id="Face" order="1">
+      <tmSet id="Brows" order="0"><tmObject>l_brow_ctrl</tmObject></tmSet>
+    </tmGroup>
+    <tmGroup id="Body" order="0">
+      <tmSet id="Legs" order="1"><tmObject>l_leg_ctrl</tmObject></tmSet>
+      <tmSet id="Arms" order="0">
+        <tmObject>l_arm_ctrl</tmObject>
+        <tmObject>missing_ctrl</tmObject>
+        <tmObject>tmCustomCharacterSet</tmObject>
+      </tmSet>
+    </tmGroup>
+  </tmGroups>
+</tmData>
+"""
+
+
+class FakeNode(object):
+    """
+    A transform in the fake DAG, also standing in for the function sets and
+    plugs the module uses on it
+    """
+
+    def __init__(self, parent=None):
+        self.node_name = None
+        self.values = {}
+        self.children = []
+        if parent is not None:
+            parent.children.append(self)
+
+    # MFnDagNode
+    def name(self):
+        return self.node_name
+
+    def hasAttribute(self, attr):
+        return attr in self.values
+
+    def findPlug(self, attr, want_networked):
+        return FakePlug(self, attr)
+
+    def childCount(self):
+        return len(self.children)
+
+    def child(self, index):
+        return self.children[index]
+
+
+class FakePlug(object):
+
+    def __init__(self, node, attr):
+        self.node = node
+        self.attr = attr
+
+    def asString(self):
+        return self.node.values[self.attr]
+
+    def setString(self, value):
+        self.node.values[self.attr] = value
+
+
+class FakeOpenMaya(object):
+    """
+    The OpenMaya calls tweenMachineXML makes, over FakeNodes registered in
+    the stub scene by name
+    """
+
+    class MFnData(object):
+        kString = "string"
+
+    class MFnTypedAttribute(object):
+        def create(self, long_name, short_name, data_type):
+            return long_name
+
+    class MDagModifier(object):
+        def createNode(self, node_type, parent=None):
+            return FakeNode(parent)
+
+        def renameNode(self, node, name):
+            node.node_name = name
+            cmds.nodes[name] = {"fake": node}
+
+        def addAttribute(self, node, attribute):
+            node.values[attribute] = ""
+
+        def doIt(self):
+            pass
+
+    class MSelectionList(object):
+        def add(self, name):
+            if name not in cmds.nodes:
+                raise RuntimeError("No object matches name: " + name)
+            self.node = cmds.nodes[name]["fake"]
+
+        def getDagPath(self, index):
+            return self.node
+
+    class MGlobal(object):
+        messages = []
+
+        @classmethod
+        def displayInfo(cls, message):
+            cls.messages.append(message)
+
+    MFnDagNode = MFnDependencyNode = staticmethod(lambda node: node)
+
+
+class TestXML(unittest.TestCase):
+
+    def setUp(self):
+        cmds.reset()
+        cmds.nodes["l_arm_ctrl"] = {}
+        cmds.nodes["l_leg_ctrl"] = {}
+        self._open_maya = tweenMachineXML.OpenMaya
+        tweenMachineXML.OpenMaya = FakeOpenMaya
+        FakeOpenMaya.MGlobal.messages = []
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "tmData.xml")
+        with open(self.path, "w") as handle:
+            handle.write(DATA_FILE)
+
+    def tearDown(self):
+        tweenMachineXML.OpenMaya = self._open_maya
+        tweenMachineXML._DATA = None
+        shutil.rmtree(self.directory)
+
+    def split(self, text):
+        return text.split(tweenMachineXML.SEPARATOR) if text else []
+
+    def test_parse_rejects_other_files(self):
+        other = os.path.join(self.directory, "other.xml")
+        with open(other, "w") as handle:
+            handle.write("<scene><node /></scene>")
+        self.assertIsNone(tweenMachineXML.parse_file(other))
+        with open(other, "w") as handle:
+            handle.write("<tmData><tmOptions>")
+        self.assertIsNone(tweenMachineXML.parse_file(other))
+        self.assertIsNone(tweenMachineXML.parse_file(other + ".missing"))
+        self.assertEqual(tweenMachineXML.parse_file(self.path).tag, "tmData")
+
+    def test_build_and_read(self):
+        self.assertEqual(tweenMachineXML.load_file(self.path), 1)
+        # Nodes are named like makeNode names them
+        self.assertIn("tmGroup2", cmds.nodes)
+        self.assertIn("tmObject4", cmds.nodes)
+        self.assertEqual(tweenMachineXML.read_scene(), 1)
+        self.assertEqual(self.split(tweenMachineXML.visibility()), ["1", "0"])
+        self.assertEqual(self.split(tweenMachineXML.buttons()),
+                         ["0.6 0.6 0.6", "-75", "0.2 0.4 0.8", "25"])
+        self.assertEqual(self.split(tweenMachineXML.groups()), ["Body", "Face"])
+        self.assertEqual(self.split(tweenMachineXML.sets("Body")), ["Arms", "Legs"])
+        self.assertEqual(self.split(tweenMachineXML.objects("Body", "Arms")),
+                         ["l_arm_ctrl", "tmCustomCharacterSet"])
+        self.assertEqual(len(FakeOpenMaya.MGlobal.messages), 1)
+        self.assertIn("missing_ctrl", FakeOpenMaya.MGlobal.messages[0])
+        self.assertEqual(tweenMachineXML.sets("Hands"), "")
+
+    def test_read_without_data(self):
+        self.assertEqual(tweenMachineXML.read_scene(), 0)
+        self.assertEqual(tweenMachineXML.groups(), "")
+
+    def test_save_round_trip(self):
+        tweenMachineXML.load_file(self.path)
+        saved = os.path.join(self.directory, "saved.xml")
+        tweenMachineXML.save_file(saved, 0, 1, "0.6 0.6 0.6\t0.2 0.4 0.8", "-75\t25")
+        # Loading the saved file again gives the same data
+        cmds.reset()
+        cmds.nodes["l_arm_ctrl"] = {}
+        self.assertEqual(tweenMachineXML.load_file(saved), 1)
+        tweenMachineXML.read_scene()
+        self.assertEqual(self.split(tweenMachineXML.visibility()), ["0", "1"])
+        self.assertEqual(self.split(tweenMachineXML.buttons()),
+                         ["0.6 0.6 0.6", "-75", "0.2 0.4 0.8", "25"])
+        self.assertEqual(self.split(tweenMachineXML.groups()), ["Body", "Face"])
+        self.assertEqual(self.split(tweenMachineXML.sets("Face")), ["Brows"])
+        self.assertEqual(self.split(tweenMachineXML.objects("Body", "Arms")),
+                         ["l_arm_ctrl", "tmCustomCharacterSet"])
+
+
+if __name__ == "__main__":
+    unittest.main()